@@ -0,0 +1,49 @@
+"""Accuracy against throughput for each kinematics integrator.
+
+A robot drives a constant curve for a fixed time at several step sizes with
+each integrator, fixed and adaptive, and the final position is compared with
+the exact arc. Run from the repository root with
+
+    python -m benchmarks.integrators
+"""
+import math
+import time
+
+import hardware.virtual.integrators as integrators
+
+# A gentle curve, the wheel speeds (m/s) and wheel base (m) of the default robot
+VEL_LEFT = 0.2
+VEL_RIGHT = 0.3
+WIDTH = 0.225
+
+DURATION = 20.0
+STEPS = (0.001, 0.01, 0.02, 0.05, 0.1)
+TOLERANCE = 1e-6
+
+def run(integrate, dt):
+    """Integrate the curve for DURATION.
+
+    Returns:
+        tuple: Final pose and the ticks stepped per second of wall time.
+    """
+    ticks = round(DURATION / dt)
+    pose = (0.0, 0.0, 0.0)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        pose = integrate(*pose, VEL_LEFT, VEL_RIGHT, WIDTH, dt)
+    return pose, ticks / (time.perf_counter() - start)
+
+def main():
+    # Constant wheel speeds make one arc over the whole run exact
+    exact = integrators.arc(0.0, 0.0, 0.0, VEL_LEFT, VEL_RIGHT, WIDTH, DURATION)
+
+    print(f"{'integrator':>18} {'dt':>6} {'error (m)':>12} {'ticks/s':>12}")
+    for name, step in integrators.INTEGRATORS.items():
+        for label, integrate in ((name, step), (name + " adaptive", integrators.adaptive(step, TOLERANCE))):
+            for dt in STEPS:
+                pose, rate = run(integrate, dt)
+                error = math.hypot(pose[0] - exact[0], pose[1] - exact[1])
+                print(f"{label:>18} {dt:>6} {error:>12.3e} {rate:>12.0f}")
+
+if __name__ == "__main__":
+    main()
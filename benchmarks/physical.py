@@ -0,0 +1,71 @@
+"""Control loop latency and throughput of the physical code path.
+
+Runs a Robot style control tick (read both wheel encoders, then set both wheel
+targets) against PhysicalInterface driving an emulated BrickPi3, directly and
+through the background poller, and reports the tick latency percentiles and
+ticks per second. Run from the repository root with
+
+    python -m benchmarks.physical --latency 0.0005 --jitter 0.0002
+"""
+import argparse
+import logging
+import time
+import numpy as np
+
+import hardware.hardwareInterface as hw
+import hardware.physicalInterface as pi
+import hardware.polledInterface as poll
+import hardware.virtual.brickpi3Emulator as emulator
+
+LEFT = hw.MOTOR_PORTS.PORT_A
+RIGHT = hw.MOTOR_PORTS.PORT_D
+
+def controlLoop(interface, ticks) -> np.ndarray:
+    """Run control ticks as fast as possible.
+
+    Returns:
+        np.ndarray: Latency of each tick (s).
+    """
+    latencies = np.empty(ticks)
+    for tick in range(ticks):
+        start = time.perf_counter()
+        left, right = interface.get_motor_encoders((LEFT, RIGHT))
+        interface.set_motor_positions({LEFT: left + 10, RIGHT: right + 10})
+        latencies[tick] = time.perf_counter() - start
+    return latencies
+
+def physicalLoopTicks(latency=0.0, jitter=0.0, ticks=2000, poll_rate=0) -> float:
+    """Control ticks per second against an emulated BrickPi3."""
+    interface = pi.PhysicalInterface(emulator.BrickPi3(latency, jitter, seed=0))
+    if poll_rate:
+        interface = poll.PolledInterface(interface, poll_rate)
+    latencies = controlLoop(interface, ticks)
+    interface.stop()
+    return ticks / latencies.sum()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the physical control loop against an emulated BrickPi3.")
+    parser.add_argument("--latency", type=float, default=0.0005, help="Time each SPI transaction takes (s)")
+    parser.add_argument("--jitter", type=float, default=0.0002, help="Largest random extra time per transaction (s)")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--poll-rate", type=float, default=200.0, help="Rate of the polled run (Hz)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    for label, poll_rate in (("direct", 0), (f"polled {args.poll_rate:.0f} Hz", args.poll_rate)):
+        device = emulator.BrickPi3(args.latency, args.jitter, seed=0)
+        interface = pi.PhysicalInterface(device)
+        if poll_rate:
+            interface = poll.PolledInterface(interface, poll_rate)
+
+        latencies = controlLoop(interface, args.ticks)
+        interface.stop()
+
+        p50, p99 = np.percentile(latencies, (50, 99)) * 1e6
+        print(f"{label:>16}: {args.ticks / latencies.sum():>10.0f} ticks/s, "
+              f"latency p50 {p50:.1f}us p99 {p99:.1f}us max {latencies.max() * 1e6:.1f}us, "
+              f"{device.transactions / args.ticks:.2f} transactions/tick")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Benchmark suite for the virtual hardware stack.
+
+Measures ticks per second of a single headless VirtualRobot, of a
+BatchVirtualRobot and of a World of robots (robot ticks per second), of a
+VirtualRobot drawing to a window and of the physical control loop against an
+emulated BrickPi3, the time `import robot` and loading the config take in a
+fresh interpreter (see benchmarks.startup), and the wall time a headless
+Robot takes to complete the command list in robot_config.toml. Results are
+written as JSON and can be compared against a stored baseline, failing if any
+result regresses by more than the tolerance. Before any timing, the suite
+checks that a robot blocked by a wall is recorded at the pose the World put
+it back to, and fails if not.
+
+The results depend on the machine, so no baseline is committed. Record one on
+the machine the comparisons will run on, from the repository root, with
+
+    python -m benchmarks.run --baseline benchmarks/baseline.json --save-baseline
+
+and then compare later runs against it with
+
+    python -m benchmarks.run --output bench.json --baseline benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import dataclasses
+import io
+import json
+import logging
+import math
+import sys
+import tempfile
+import time
+
+import robot
+import robotConfig
+import hardware.virtual.virtualRobot as vr
+import hardware.virtual.batchVirtualRobot as bvr
+import world as wd
+import benchmarks.physical as physical
+import benchmarks.startup as startup
+
+# Each benchmark is repeated and the best run kept
+REPEATS = 3
+
+def best(benchmark, *args) -> float:
+    return max(benchmark(*args) for _ in range(REPEATS))
+
+def virtualRobotTicks(headless, ticks=100000) -> float:
+    """Ticks per second of one VirtualRobot driving towards a distant target."""
+    virtualRobot = vr.VirtualRobot(dataclasses.replace(robotConfig.load(), headless=headless))
+    for port in (virtualRobot.config.left_motor, virtualRobot.config.right_motor):
+        virtualRobot.controller(port).set_position(10 ** 9)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        virtualRobot.update(0.001)
+    elapsed = time.perf_counter() - start
+
+    if virtualRobot.renderer is not None:
+        virtualRobot.renderer.stop()
+    return ticks / elapsed
+
+def batchTicks(n=1000, ticks=2000) -> float:
+    """Robot ticks per second of a BatchVirtualRobot driving towards a distant target."""
+    robots = bvr.BatchVirtualRobot(n)
+    robots.forwards(10 ** 6)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        robots.update(0.001)
+    return n * ticks / (time.perf_counter() - start)
+
+def worldTicks(n=300, ticks=200) -> float:
+    """Robot ticks per second of a World of robots driving around a walled arena."""
+    config = robotConfig.load()
+    world = wd.World((-10.0, -10.0, 10.0, 10.0))
+    world.addBox(-1.0, -1.0, 1.0, 1.0)
+    # A ring of robots around the central box, each driving a different curve
+    for i in range(n):
+        angle = 2 * math.pi * i / n
+        radius = 3.0 + 6.0 * (i % 7) / 7
+        robot = world.addRobot(config, radius * math.sin(angle), radius * math.cos(angle), math.degrees(angle))
+        robot.interface.set_motor_power(config.robot.left_motor, 40 + i % 50)
+        robot.interface.set_motor_power(config.robot.right_motor, 60)
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        world.update(0.02)
+    return n * ticks / (time.perf_counter() - start)
+
+def checkBlockedRecording(ticks=100) -> list[str]:
+    """Check that a robot blocked by a wall is recorded where it was put back,
+    not where it was stepped to inside the wall.
+
+    Returns:
+        list[str]: A description of each tick recorded at the wrong pose.
+    """
+    import recorder as rc
+
+    config = robotConfig.load()
+    world = wd.World((-1.0, -1.0, 1.0, 1.0))
+    errors = []
+    with tempfile.TemporaryDirectory() as path:
+        trajectory = rc.TrajectoryRecorder(path)
+        robot = world.addRobot(config, 0.0, 0.5, 0.0, recorder=trajectory)
+        robot.interface.set_motor_power(config.robot.left_motor, 100)
+        robot.interface.set_motor_power(config.robot.right_motor, 100)
+        restored = {}
+        for tick in range(ticks):
+            if world.update(0.02):
+                restored[tick] = (robot.robot.x, robot.robot.y, robot.robot.orientation)
+        trajectory.close()
+
+        recorded = rc.loadTrajectory(path)
+        if not restored:
+            errors.append("the robot never reached the wall")
+        for tick, pose in restored.items():
+            row = (float(recorded['x'][tick]), float(recorded['y'][tick]), float(recorded['orientation'][tick]))
+            if row != pose:
+                errors.append(f"tick {tick} recorded at {row} but put back at {pose}")
+        del recorded
+    return errors
+
+def commandCompletion(config_path) -> float:
+    """Wall time (s) for a headless Robot to run the command list."""
+    config = dataclasses.replace(robotConfig.load(config_path), headless=True, virtual=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        rob = robot.Robot(config)
+        start = time.perf_counter()
+        rob.start()
+        return time.perf_counter() - start
+
+def runAll(config_path) -> dict:
+    """Run every benchmark.
+
+    Returns:
+        dict: Benchmark name to its value, unit and whether higher is better.
+    """
+    results = {
+        "virtual_robot_headless": {"value": best(virtualRobotTicks, True), "unit": "ticks/s", "higher_is_better": True},
+        "batch_1000_robots": {"value": best(batchTicks), "unit": "robot ticks/s", "higher_is_better": True},
+        "world_300_robots": {"value": best(worldTicks), "unit": "robot ticks/s", "higher_is_better": True},
+        # With no emulated bus latency this is the cost of the physical code path itself
+        "physical_control_loop": {"value": best(physical.physicalLoopTicks), "unit": "ticks/s", "higher_is_better": True},
+    }
+
+    try:
+        results["virtual_robot_rendering"] = {"value": best(virtualRobotTicks, False), "unit": "ticks/s", "higher_is_better": True}
+    except Exception as err:
+        # No display (or no Zelle graphics module) to draw to
+        print(f"benchmarks: Skipping rendering, {err}")
+
+    # Importing the robot and loading its config, as every run of main.py does
+    results["startup"] = {"value": startup.importTime(config_path)[0], "unit": "s", "higher_is_better": False}
+
+    # The command list finishes in milliseconds, best of a few more runs
+    results["command_completion"] = {"value": min(commandCompletion(config_path) for _ in range(REPEATS * 3)), "unit": "s", "higher_is_better": False}
+    return results
+
+def compare(results, baseline, tolerance) -> list[str]:
+    """Find the results which regressed against the baseline.
+
+    Args:
+        results (dict): Results from runAll.
+        baseline (dict): Stored results from runAll.
+        tolerance (float): Allowed relative regression.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]['value']
+        change = (result['value'] - base) / base
+        if not result['higher_is_better']:
+            change = -change
+        if change < -tolerance:
+            regressions.append(f"{name}: {result['value']:.4g} {result['unit']} against {base:.4g} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the virtual hardware stack.")
+    parser.add_argument("--config", default="robot_config.toml", help="Robot config with the command list")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    errors = checkBlockedRecording()
+    for error in errors:
+        print(f"benchmarks: Blocked robot {error}")
+    if errors:
+        sys.exit(1)
+
+    results = runAll(args.config)
+    for name, result in results.items():
+        print(f"{name:>26} {result['value']:>14.4g} {result['unit']}")
+
+    if args.output:
+        with open(args.output, "w") as stream:
+            json.dump(results, stream, indent=4)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as stream:
+            json.dump(results, stream, indent=4)
+    elif args.baseline:
+        with open(args.baseline) as stream:
+            regressions = compare(results, json.load(stream), args.tolerance)
+        for regression in regressions:
+            print(f"benchmarks: Regression in {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
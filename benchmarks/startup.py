@@ -0,0 +1,97 @@
+"""Startup time of the robot, and what it pulls in at startup.
+
+Times `import robot` and loading robot_config.toml, as Robot does, in fresh
+interpreters, and checks that none of the modules only some runs need (NumPy,
+the TOML parser, the graphics and the simulator) are loaded by them, as they
+would slow down every cold start of main.py on the Raspberry Pi. The config
+is loaded through Robot's disk cache, which is filled first, so an unchanged
+config must start without the TOML parser. Exits with an error if either the
+startup time budget is exceeded or a heavy module is loaded. Run from the
+repository root with
+
+    python -m benchmarks.startup --budget 0.1
+
+The time includes the standard library modules every run needs, in STDLIB,
+which are also reported on their own. asyncio, which runs the commands, is
+most of their time.
+"""
+import argparse
+import subprocess
+import sys
+
+# Modules which must be loaded only by the runs which use them
+HEAVY = (
+    "numpy",
+    "tomllib",
+    "tkinter",
+    "graphics.graphics",
+    "graphics.renderer",
+    "hardware.virtual.virtualRobot",
+    "hardware.virtual.batchVirtualRobot",
+)
+
+# Standard library modules every run of the robot imports
+STDLIB = ("asyncio", "logging", "dataclasses", "enum")
+
+# Time (s) the import and the config load may take, STDLIB included
+BUDGET = 0.1
+
+PROBE = f"""
+import sys
+import time
+start = time.perf_counter()
+import {", ".join(STDLIB)}
+middle = time.perf_counter()
+import robot
+import robotConfig
+robotConfig.load(sys.argv[1], cache_dir=robotConfig.CACHE_DIR)
+print(time.perf_counter() - start, middle - start)
+print(",".join(name for name in {HEAVY!r} if name in sys.modules))
+"""
+
+def importTime(config_path="robot_config.toml", repeats=5) -> tuple:
+    """Time `import robot` and loading the config in fresh interpreters.
+
+    Args:
+        config_path (str, optional): Robot config to load. Defaults to "robot_config.toml".
+        repeats (int, optional): Interpreters to time. Defaults to 5.
+
+    Returns:
+        tuple: Best startup time (s), best import time of STDLIB (s), and the
+            heavy modules the startup loaded.
+    """
+    # Fill Robot's disk cache, as the first run after an edit does
+    subprocess.run([sys.executable, "-c", PROBE, config_path], capture_output=True, check=True)
+    best = None
+    best_stdlib = None
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", PROBE, config_path], capture_output=True, text=True, check=True).stdout.split("\n")
+        elapsed, stdlib = (float(value) for value in output[0].split())
+        best = elapsed if best is None else min(best, elapsed)
+        best_stdlib = stdlib if best_stdlib is None else min(best_stdlib, stdlib)
+        loaded = [name for name in output[1].split(",") if name]
+    return best, best_stdlib, loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the robot's startup time.")
+    parser.add_argument("--config", default="robot_config.toml", help="Robot config to load")
+    parser.add_argument("--budget", type=float, default=BUDGET, help="Time the import and the config load may take (s)")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    elapsed, stdlib, loaded = importTime(args.config, args.repeats)
+    print(f"startup: import robot and load {args.config} {elapsed * 1000:.1f}ms (budget {args.budget * 1000:.0f}ms), "
+          f"of which {stdlib * 1000:.1f}ms for {', '.join(STDLIB)}")
+
+    failed = False
+    if elapsed > args.budget:
+        print("startup: Over the startup time budget")
+        failed = True
+    if loaded:
+        print(f"startup: Loaded at import : {', '.join(loaded)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Commands the robot can be given in the [[commands]] config list.
+
+Each command is a coroutine taking the robot and its config table, which
+awaits the robot's ticks until it is done. Commands can be composed with
+SEQUENCE and PARALLEL, given a timeout (s of robot time) after which they are
+cancelled, and are cancelled cleanly, leaving the wheels where they were.
+"""
+import asyncio
+import logging
+import math
+
+import hardware.hardwareInterface as hw
+import common as cm
+
+log = logging.getLogger(__name__)
+
+# Commands which move the wheels along a motion profile, and may override the
+# [motion] config
+MOVES = ("FORWARDS", "TURN", "ARC", "WAYPOINT")
+
+# Keys each type of command must be given, checked as the config is loaded.
+# SET_POWER takes either power or both left_power and right_power instead.
+KEYS = {
+    "FORWARDS": ("distance",),
+    "TURN": ("angle",),
+    "ARC": ("radius", "angle"),
+    "WAYPOINT": ("x", "y"),
+    "WAIT": ("duration",),
+    "WAIT_SENSOR": ("port",),
+    "SEQUENCE": ("commands",),
+    "PARALLEL": ("commands",),
+}
+
+# Smallest turn (degrees) WAYPOINT makes to face its point
+WAYPOINT_ANGLE_MIN = 0.5
+
+async def move(robot, command, left_degrees, right_degrees):
+    """Turn the wheels, along the motion profile of the command."""
+    profile = robot.profile(command, max(abs(left_degrees), abs(right_degrees)))
+    await robot.moveWheels(left_degrees, right_degrees, profile)
+
+async def forwards(robot, command):
+    """Drive forwards (or backwards for a negative distance).
+
+    Keys: distance (m). Moves may also be given profile, power and
+    acceleration, overriding the [motion] config.
+    """
+    # TODO : Add tuned correction terms here for wheel rotations
+    degrees = robot.wheelDegrees(command['distance'])
+    await move(robot, command, degrees, degrees)
+
+async def turn(robot, command):
+    """Turn on the spot.
+
+    Keys: angle (degrees, +ve for clockwise).
+    """
+    degrees = robot.wheelDegrees(math.radians(command['angle']) * robot.wheelWidth / 2.0)
+    await move(robot, command, degrees, -degrees)
+
+async def arc(robot, command):
+    """Drive around an arc.
+
+    Keys: radius (m, of the path of the centre of the robot, +ve to turn
+    clockwise), angle (degrees turned, -ve to reverse around the arc).
+    """
+    angle = math.radians(command['angle'])
+    outer = robot.wheelDegrees((abs(command['radius']) + robot.wheelWidth / 2.0) * angle)
+    inner = robot.wheelDegrees((abs(command['radius']) - robot.wheelWidth / 2.0) * angle)
+    if command['radius'] >= 0:
+        await move(robot, command, outer, inner)
+    else:
+        await move(robot, command, inner, outer)
+
+async def waypoint(robot, command):
+    """Turn to face a point, then drive to it, from the pose estimated by
+    odometry.
+
+    Keys: x, y (m).
+    """
+    x, y, orientation = robot.odometry.pose()
+    bearing = math.degrees(math.atan2(command['x'] - x, command['y'] - y))
+    # Shortest way round, clockwise +ve
+    angle = (bearing - orientation + 180.0) % 360.0 - 180.0
+    if abs(angle) >= WAYPOINT_ANGLE_MIN:
+        await turn(robot, dict(command, angle=angle))
+
+    # From wherever the turn actually ended
+    x, y, _ = robot.odometry.pose()
+    await forwards(robot, dict(command, distance=math.hypot(command['x'] - x, command['y'] - y)))
+
+async def wait(robot, command):
+    """Wait.
+
+    Keys: duration (s).
+    """
+    await robot.sleep(command['duration'])
+
+async def waitSensor(robot, command):
+    """Wait for a sensor reading to pass a threshold.
+
+    Keys: port (PORT_1 to PORT_4), below and/or above (in the units of the
+    sensor's type), finishing once the reading is below below or above above.
+    Racing it in a PARALLEL against a move stops the move at the threshold.
+    """
+    port = cm.config_sensor_port_to_hw(command['port'])
+    if port is None:
+        raise ValueError(f"Sensor port not valid : {command['port']}")
+    below = command.get('below', -math.inf)
+    above = command.get('above', math.inf)
+    while True:
+        try:
+            value = robot.hw.get_sensor(port)
+            if value < below or value > above:
+                return
+        except hw.SensorError:
+            # Not ready yet
+            pass
+        await robot.tick()
+
+async def setPower(robot, command):
+    """Set the power of the wheels.
+
+    Keys: power (%, both wheels) or left_power and right_power (%), and
+    optionally duration (s) after which the wheels are stopped. Without a
+    duration the command finishes straight away, leaving the wheels running.
+    """
+    left = command.get('left_power', command.get('power', 0))
+    right = command.get('right_power', command.get('power', 0))
+    robot.setPower(left, right)
+    if 'duration' not in command:
+        return
+    try:
+        await robot.sleep(command['duration'])
+    finally:
+        robot.setPower(0, 0)
+
+async def stream(robot, command):
+    """Stream the encoders and power of the wheels to the telemetry file.
+
+    Keys: period (s, 0 for every tick), optionally duration (s). Without a
+    duration it streams until cancelled, so is meant to be run in a racing
+    PARALLEL alongside the motion.
+    """
+    if robot.telemetry is None:
+        log.warning("No telemetry to stream to, select some [telemetry] signals")
+        return
+
+    period = command.get('period', 0.0)
+    end = robot.time + command.get('duration', math.inf)
+    while robot.time < end:
+        (_, powerLeft, encoderLeft, _), (_, powerRight, encoderRight, _) = robot.hw.get_motor_statuses(robot.motors)
+        robot.telemetry.emit(robot.time, "encoders", encoderLeft, encoderRight)
+        robot.telemetry.emit(robot.time, "power", powerLeft, powerRight)
+        if period > 0:
+            await robot.sleep(period)
+        else:
+            await robot.tick()
+
+async def sequence(robot, command):
+    """Run commands one after the other.
+
+    Keys: commands (list of command tables).
+    """
+    for child in command['commands']:
+        await execute(robot, child)
+
+async def parallel(robot, command):
+    """Run commands at the same time.
+
+    Keys: commands (list of command tables), optionally race (bool, default
+    false) to finish as soon as the first command does, cancelling the rest.
+    """
+    tasks = [asyncio.ensure_future(execute(robot, child)) for child in command['commands']]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED if command.get('race', False) else asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()   # Raise any error from the commands
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled commands clean up before moving on
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+COMMANDS = {
+    "FORWARDS": forwards,
+    "TURN": turn,
+    "ARC": arc,
+    "WAYPOINT": waypoint,
+    "WAIT": wait,
+    "WAIT_SENSOR": waitSensor,
+    "SET_POWER": setPower,
+    "STREAM": stream,
+    "SEQUENCE": sequence,
+    "PARALLEL": parallel,
+}
+
+async def execute(robot, command):
+    """Execute a command table, cancelling it if it runs past its timeout.
+
+    Args:
+        robot (robot.Robot): The robot to command.
+        command (dict): The command, with its type and keys.
+    """
+    if command['type'] not in COMMANDS:
+        log.warning("Unrecognized command : %s", command['type'])
+        return
+
+    coroutine = COMMANDS[command['type']](robot, command)
+    if 'timeout' not in command:
+        await coroutine
+        return
+
+    try:
+        await robot.within(coroutine, command['timeout'])
+    except asyncio.TimeoutError:
+        log.warning("%s timed out after %.2fs", command['type'], command['timeout'])
@@ -9,36 +9,9 @@ def bound(value, min_val: Any, max_val: Any) -> Any:
 
 
 def config_port_to_hw(motor):
-    match motor:
-        case "PORT_A":
-            return hw.MOTOR_PORTS.PORT_A
-        case "PORT_B":
-            return hw.MOTOR_PORTS.PORT_B
-        case "PORT_C":
-            return hw.MOTOR_PORTS.PORT_C
-        case "PORT_D":
-            return hw.MOTOR_PORTS.PORT_D
-        
-class Enumeration(object):
-    def __init__(self, names):  # or *names, with no .split()
-        number = 0
-        for line, name in enumerate(names.split('\n')):
-            if name.find(",") >= 0:
-                # strip out the spaces
-                while(name.find(" ") != -1):
-                    name = name[:name.find(" ")] + name[(name.find(" ") + 1):]
+    """Get the hw.MOTOR_PORTS port named in the config, or None if there isn't one."""
+    return hw.MOTOR_PORTS.__members__.get(motor)
 
-                # strip out the commas
-                while(name.find(",") != -1):
-                    name = name[:name.find(",")] + name[(name.find(",") + 1):]
-
-                # if the value was specified
-                if(name.find("=") != -1):
-                    number = int(float(name[(name.find("=") + 1):]))
-                    name = name[:name.find("=")]
-
-                # optionally print to confirm that it's working correctly
-                #print "%40s has a value of %d" % (name, number)
-
-                setattr(self, name, number)
-                number = number + 1
\ No newline at end of file
+def config_sensor_port_to_hw(sensor):
+    """Get the hw.SENSOR_PORTS port named in the config, or None if there isn't one."""
+    return hw.SENSOR_PORTS.__members__.get(sensor)
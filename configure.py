@@ -0,0 +1,236 @@
+"""Fit the motor config from recorded logs of a motor's response to its power.
+
+The virtual motor's speed follows
+
+    d(dps)/dt = c1 * power + c2 * dps + c3 * sign(dps)
+
+(see hardware.virtual.motor.Motor), so its constants can be read off a least
+squares fit of logged power against the encoder. A log is a CSV file with a
+header and time (s), power (%) and encoder (degrees) columns, recorded with
+nothing attached to the motor. The record program drives a motor through a
+series of power steps and writes such a log:
+
+    python configure.py record --port PORT_A --output motor_log.csv
+
+and the fit program fits every log given and writes the constants into
+config/motor_config.toml:
+
+    python configure.py fit motor_log.csv
+
+The fit works on whole arrays, so logs of millions of samples take a second or
+two, most of it reading the CSV.
+"""
+import argparse
+import logging
+import math
+import re
+import sys
+import time
+import dataclasses
+import numpy as np
+
+import robot
+import robotConfig
+import common as cm
+import scheduler as sc
+
+log = logging.getLogger(__name__)
+
+# Powers (%) the record program steps the motor through
+POWER_STEPS = (0, 25, 50, 75, 100, 50, 0, -30, -60, -100, -20, 0)
+
+# Time (s) the speed is averaged over to smooth the quantised encoder
+WINDOW = 0.05
+
+def loadLog(path):
+    """Read a log.
+
+    Returns:
+        tuple: Time (s), power (%) and encoder (degrees) arrays.
+    """
+    with open(path) as stream:
+        header = [name.strip() for name in stream.readline().split(",")]
+    columns = [header.index(name) for name in ("time", "power", "encoder")]
+    data = np.loadtxt(path, delimiter=",", skiprows=1, usecols=columns, ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+def resample(times, power, encoder, step=None):
+    """Resample a log onto a uniform time step.
+
+    Args:
+        step (float, optional): The time step (s). Defaults to the median of the log's steps.
+
+    Returns:
+        tuple: The time step (s), and the power (%) and encoder (degrees) arrays.
+    """
+    if step is None:
+        step = float(np.median(np.diff(times)))
+    uniform = np.arange(times[0], times[-1], step)
+    # Power is held between samples, the encoder is interpolated
+    held = np.searchsorted(times, uniform, side="right") - 1
+    return step, power[held], np.interp(uniform, times, encoder)
+
+def fitRows(step, power, encoder, window=WINDOW):
+    """Build the least squares rows of one resampled log.
+
+    The speed averaged over each window of k samples obeys, while the power is
+    constant, dps[n + k] = a * dps[n] + b * power + c * sign(dps[n]) with
+    a = exp(-k * step / time_constant), so pairs of windows with one power over
+    both give one row each.
+
+    The encoder is quantised, so each dps is noisy, and the noise in the dps[n]
+    column would bias a towards 0. Each row also carries an instrument for
+    dps[n], the window ending one sample before it starts, whose noise is
+    independent of both dps[n] and dps[n + k].
+
+    Returns:
+        tuple: Rows (dps, power, sign), their instruments, the next window's
+            dps, and k.
+    """
+    k = max(1, round(window / step))
+    dps = (encoder[k:] - encoder[:-k]) / (k * step)
+    # Rows start at k + 1, leaving room for the instrument's window
+    n = np.arange(k + 1, len(dps) - k)
+    instrument = dps[n - k - 1]
+    previous = dps[n]
+    following = dps[n + k]
+
+    # Number of power changes up to each sample, equal at both ends of a span
+    # with one power
+    changes = np.concatenate(([0], np.cumsum(power[1:] != power[:-1])))
+    constant = changes[n + 2 * k] == changes[n - k - 1]
+    # Friction makes stopped and reversing motors nonlinear, so only rows
+    # moving one way throughout are kept
+    moving = (previous != 0) & (np.sign(instrument) == np.sign(previous)) & (np.sign(previous) == np.sign(following))
+    keep = constant & moving
+
+    sign = np.sign(previous[keep])
+    rows = np.column_stack((previous[keep], power[n[keep]], sign))
+    instruments = np.column_stack((instrument[keep], power[n[keep]], sign))
+    return rows, instruments, following[keep], k
+
+def fitMotor(logs, dps_per_torque, window=WINDOW) -> dict:
+    """Fit the motor constants to logs.
+
+    Args:
+        logs (list[tuple]): Time, power and encoder arrays of each log.
+        dps_per_torque (float): Free speed lost per Nm of load (degrees / s), from rpm_torque_b.
+        window (float, optional): Time (s) the speed is averaged over. Defaults to WINDOW.
+
+    Returns:
+        dict: rpm_power_a, inertia, friction, and the fit's time_constant (s) and rms error (degrees / s).
+    """
+    # Every log is resampled to the first log's step, so that a is shared
+    step = resample(*logs[0])[0]
+    fitted = [fitRows(*resample(times, power, encoder, step), window) for times, power, encoder in logs]
+    rows = np.concatenate([rows for rows, _, _, _ in fitted])
+    instruments = np.concatenate([instruments for _, instruments, _, _ in fitted])
+    targets = np.concatenate([targets for _, _, targets, _ in fitted])
+    k = fitted[0][3]
+    if len(rows) < 3:
+        raise ValueError("Not enough steady power in the logs to fit")
+
+    # Instrumental variables estimate, the least squares solution of
+    # instruments^T rows x = instruments^T targets
+    (a, b, c), *_ = np.linalg.lstsq(instruments.T @ rows, instruments.T @ targets, rcond=None)
+    if not 0 < a < 1:
+        raise ValueError(f"Logs don't show a settling motor (a = {a:.4g})")
+
+    time_constant = -k * step / math.log(a)
+    return {
+        "rpm_power_a": b / (1 - a) / 6.0,
+        "inertia": time_constant / math.radians(dps_per_torque),
+        "friction": max(-c / (1 - a), 0.0) / dps_per_torque,
+        "time_constant": time_constant,
+        "rms": float(np.sqrt(np.mean((rows @ (a, b, c) - targets) ** 2))),
+    }
+
+def writeConfig(path, motor_type, values):
+    """Set constants in a motor's table of the motor config, keeping the rest
+    of the file (and its comments) as it is."""
+    with open(path) as stream:
+        text = stream.read()
+
+    start = text.index(f"[{motor_type}]")
+    following = re.search(r"^\[", text[start + 1:], re.MULTILINE)
+    end = start + 1 + following.start() if following else len(text)
+    table = text[start:end]
+
+    for key, value in values.items():
+        line = f"{key} = {value:.6g}"
+        table, found = re.subn(rf"^{key}\s*=.*$", line, table, flags=re.MULTILINE)
+        if not found:
+            table = table.rstrip("\n") + f"\n\n{line}\n"
+
+    with open(path, "w") as stream:
+        stream.write(text[:start] + table + text[end:])
+
+def record(args):
+    port = cm.config_port_to_hw(args.port)
+    if port is None:
+        print(f"configure: Motor port not valid : {args.port}")
+        sys.exit(-1)
+    config = robotConfig.loadOrExit(args.config)
+    physical = dataclasses.replace(config.physical, emulate=args.emulate, latency=0.0, jitter=0.0, poll_rate=0.0)
+    interface = robot.getHardware(dataclasses.replace(config, virtual=False, physical=physical))
+
+    scheduler = sc.LoopScheduler(args.rate)
+    start = time.perf_counter()
+    rows = []
+    for power in POWER_STEPS:
+        interface.set_motor_power(port, power)
+        until = time.perf_counter() + args.hold
+        while time.perf_counter() < until:
+            scheduler.tick()
+            rows.append((time.perf_counter() - start, power, interface.get_motor_encoder(port)))
+    interface.set_motor_power(port, 0)
+
+    np.savetxt(args.output, rows, delimiter=",", header="time,power,encoder", comments="", fmt=("%.6f", "%g", "%d"))
+    print(f"configure: Recorded {len(rows)} samples to {args.output}")
+
+def fit(args):
+    try:
+        config = robotConfig.loadMotors(args.config)[args.motor]
+    except (robotConfig.ConfigError, KeyError) as err:
+        print(f"configure: Can't read {args.motor} from {args.config} : {err}")
+        return
+    start = time.perf_counter()
+    logs = [loadLog(path) for path in args.logs]
+    values = fitMotor(logs, -config.rpm_torque_b * 6.0, args.window)
+    print(f"configure: Fitted {sum(len(times) for times, _, _ in logs)} samples in {time.perf_counter() - start:.2f}s")
+    print(f"configure: Time constant {values['time_constant'] * 1000:.1f}ms, rms error {values['rms']:.1f} degrees / s")
+
+    constants = {key: values[key] for key in ("rpm_power_a", "inertia", "friction")}
+    for key, value in constants.items():
+        print(f"    {key} = {value:.6g} (was {getattr(config, key)})")
+    if not args.dry_run:
+        writeConfig(args.config, args.motor, constants)
+        print(f"configure: Wrote {args.config}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the motor config from recorded logs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recorder = commands.add_parser("record", help="Record a log of a motor driven through power steps")
+    recorder.add_argument("--port", default="PORT_A", help="Motor port, PORT_A to PORT_D")
+    recorder.add_argument("--rate", type=float, default=200.0, help="Samples per second")
+    recorder.add_argument("--hold", type=float, default=1.0, help="Time each power is held (s)")
+    recorder.add_argument("--emulate", action="store_true", help="Record an emulated BrickPi3")
+    recorder.add_argument("--config", default="robot_config.toml", help="Robot config, for the motor of the emulated BrickPi3")
+    recorder.add_argument("--output", default="motor_log.csv")
+    recorder.set_defaults(run=record)
+
+    fitter = commands.add_parser("fit", help="Fit the motor config to logs")
+    fitter.add_argument("logs", nargs="+", help="CSV logs with time, power and encoder columns")
+    fitter.add_argument("--motor", default="LegoMotor", help="Table of the motor config to fit")
+    fitter.add_argument("--config", default="config/motor_config.toml")
+    fitter.add_argument("--window", type=float, default=WINDOW, help="Time the speed is averaged over (s)")
+    fitter.add_argument("--dry-run", action="store_true", help="Print the constants without writing them")
+    fitter.set_defaults(run=fit)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import threading
+import time
+
+# Frames drawn per second by default
+DEFAULT_FPS = 30.0
+
+class Renderer:
+    """Draw a robot at a fixed frame rate on its own thread.
+
+    The physics side hands over poses with publish, which only swaps a tuple
+    reference, so it never waits on Tk. Each frame the render thread takes the
+    latest pose and draws it, skipping any poses published in between.
+
+    Tk must be used from a single thread, so the graphics module (which creates
+    the Tk root when imported) and the window are created on the render thread.
+    """
+    def __init__(self, base_width, wheel_radius, wheel_width, fps=DEFAULT_FPS, title="VirtualTandem"):
+        self.geometry = (base_width, wheel_radius, wheel_width)
+        self.fps = fps
+        self.title = title
+
+        self.pose = (0.0, 0.0, 0.0)     # Latest published pose
+        self.running = True
+        self.error = None
+
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.__run, args=(started,), name="renderer", daemon=True)
+        self.thread.start()
+        started.wait()
+        if self.error:
+            raise self.error
+
+    def publish(self, x, y, orientation):
+        """Publish the latest pose of the robot to be drawn on the next frame."""
+        self.pose = (x, y, orientation)
+
+    def isOpen(self) -> bool:
+        return self.thread.is_alive()
+
+    def stop(self):
+        """Stop drawing and close the window."""
+        self.running = False
+        self.thread.join()
+
+    def join(self):
+        """Wait until the window is closed."""
+        self.thread.join()
+
+    def __run(self, started):
+        try:
+            import graphics.graphics as gp
+            import graphics.robotGraphics as robGraphics
+
+            window = gp.GraphWin(self.title, 800, 800, autoflush=False)
+            window.setCoords(-3, -3, 3, 3)
+            graphics = robGraphics.RobotGraphics(window, *self.geometry)
+        except Exception as err:
+            self.error = err
+            return
+        finally:
+            started.set()
+
+        frame = 1.0 / self.fps
+        shown = None
+        while self.running and not window.isClosed():
+            start = time.time()
+
+            pose = self.pose
+            if pose is not shown:
+                graphics.setPose(*pose)
+                shown = pose
+            gp.update()
+
+            time.sleep(max(frame - (time.time() - start), 0.0))
+
+        if not window.isClosed():
+            window.close()
@@ -1,13 +1,19 @@
 import math
+import numpy as np
 
 if __name__ == '__main__':
     import graphics as gp
 else:
     import graphics.graphics as gp
 
+# Most points kept in the trail before it is thinned out
+TRAIL_CAP = 2000
+
+# Distance the robot must move before another point is added to the trail
+TRAIL_STEP = 0.005
+
 class RobotGraphics:
-    def __init__(self, window, base_width, wheel_radius, wheel_width, x=0, y=0, o=0):
-        self.path: list[tuple[int, int]] = []
+    def __init__(self, window, base_width, wheel_radius, wheel_width, x=0, y=0, o=0, trail_cap=TRAIL_CAP, trail_step=TRAIL_STEP):
         self.x = x
         self.y = y
         self.o = o
@@ -24,22 +30,12 @@ class RobotGraphics:
         self.wheelWidth = wheel_width
         self.wheelHeight = wheel_radius * 2
 
-    def updateRobot(self, dx=0, dy=0, do=0):
-        self.path.append((self.x, self.y))
-        self.x += dx
-        self.y += dy
-        self.o += do
-
-        if do == 0 and self.polygon:
-            self.polygon.move(dx, dy)
-            return
-
-        # Points on the robot to draw it
+        # Points on the robot to draw it, relative to its centre
         # Duplicate wheel edges closest to the robot to ensure a line is drawn
-        robotPoints = [
+        self.robotPoints = np.array([
             # Rectangle
             (-self.width / 2, self.height / 2),
-            # Left wheel 
+            # Left wheel
             (-self.width / 2, -self.wheelHeight / 2),
             (-self.width / 2, self.wheelHeight / 2),
             (-self.width / 2 - self.wheelWidth, self.wheelHeight / 2),
@@ -60,30 +56,79 @@ class RobotGraphics:
             (self.width / 4, self.height / 2),
             (0, self.height / 1.3),
             (-self.width / 4, self.height / 2)
-        ]
+        ])
 
+        # The path travelled, as a fixed size buffer of points. Whenever it
+        # fills it is thinned to every other point and the step between new
+        # points doubled, so the whole trail keeps an even spacing
+        self.trail = np.empty((trail_cap, 2))
+        self.trailLength = 0
+        self.trailStep = trail_step
+        self.trailLine = None
+
+    def setPose(self, x, y, o):
+        """Move the robot to an absolute pose."""
+        self.updateRobot(x - self.x, y - self.y, o - self.o)
+
+    def updateRobot(self, dx=0, dy=0, do=0):
+        self.__extendTrail()
+        self.x += dx
+        self.y += dy
+        self.o += do
+
+        # Orientation is a heading, clockwise from the y axis
         cosO = math.cos(math.radians(self.o))
         sinO = math.sin(math.radians(self.o))
+        rotation = np.array([[cosO, -sinO], [sinO, cosO]])
+
+        coords = self.__toScreen(self.robotPoints @ rotation + (self.x, self.y))
+
+        if self.polygon is None:
+            self.polygon = gp.Polygon([gp.Point(*point) for point in self.robotPoints])
+            self.polygon.setFill(self.col)
+            self.polygon.draw(self.window)
 
-        transformedPoints = [
-            gp.Point(cosO * pointX - sinO * pointY + self.x, sinO * pointX + cosO * pointY + self.y) for (pointX, pointY) in robotPoints
-        ]
+        # Move the existing canvas item rather than drawing a new polygon
+        self.window.coords(self.polygon.id, *coords.ravel().tolist())
 
-        current = self.polygon
+        if self.window.autoflush:
+            gp.update()
 
-        self.polygon = gp.Polygon(transformedPoints)
-        self.polygon.setFill(self.col)
+    def __extendTrail(self):
+        if self.trailLength and math.hypot(self.x - self.trail[self.trailLength - 1, 0], self.y - self.trail[self.trailLength - 1, 1]) < self.trailStep:
+            return
+
+        if self.trailLength == len(self.trail):
+            kept = self.trail[::2].copy()
+            self.trailLength = len(kept)
+            self.trail[:self.trailLength] = kept
+            self.trailStep *= 2
+
+        self.trail[self.trailLength] = (self.x, self.y)
+        self.trailLength += 1
+
+        if self.trailLength < 2:
+            return
 
-        self.polygon.draw(self.window)
+        coords = self.__toScreen(self.trail[:self.trailLength]).ravel().tolist()
+        if self.trailLine is None:
+            self.trailLine = self.window.create_line(*coords)
+            self.window.tag_lower(self.trailLine)
+        else:
+            self.window.coords(self.trailLine, *coords)
 
-        if current:
-            current.undraw()
+    def __toScreen(self, points) -> np.ndarray:
+        """Transform world points into window coordinates, as GraphWin.toScreen."""
+        trans = self.window.trans
+        if trans is None:
+            return points
+        return np.column_stack(((points[:, 0] - trans.xbase) / trans.xscale, (trans.ybase - points[:, 1]) / trans.yscale))
 
 if __name__ == '__main__':
     import time
     window = gp.GraphWin("VirtualTandem", 400, 400)
     window.setCoords(-3, -3, 3, 3)
-    rob = RobotGraphics(window)
+    rob = RobotGraphics(window, 0.2, 0.05, 0.025)
 
     while True:
         rob.updateRobot(dx = 0.01, dy=0.01, do=1)
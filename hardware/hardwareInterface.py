@@ -1,21 +1,39 @@
-from common import Enumeration
-
-SENSOR_PORTS = Enumeration("""
-    PORT_1,
-    PORT_2,
-    PORT_3,
-    PORT_4,
-""")
-
-MOTOR_PORTS = Enumeration("""
-    PORT_A,
-    PORT_B,
-    PORT_C,
-    PORT_D,
-""")
+from enum import IntEnum
+
+# Ports are ints, so they index tuples of per port values directly
+class SENSOR_PORTS(IntEnum):
+    PORT_1 = 0
+    PORT_2 = 1
+    PORT_3 = 2
+    PORT_4 = 3
+
+class MOTOR_PORTS(IntEnum):
+    PORT_A = 0
+    PORT_B = 1
+    PORT_C = 2
+    PORT_D = 3
+
+# What a sensor port reads, and the value get_sensor returns for it
+class SENSOR_TYPES(IntEnum):
+    NONE = 0
+    TOUCH = 1       # 1 while pressed, else 0
+    ULTRASONIC = 2  # Distance (cm) to the nearest obstacle ahead, 255 with none in range
+    LIGHT = 3       # Reflected light (%), from 0 (none) to 100
+
+class SensorError(IOError):
+    """A sensor which can't be read, such as one on a port set to NONE."""
+
+class MotorError(IOError):
+    """A motor which can't be read, such as on a port with none attached."""
+
+# Power which lets a motor spin freely
+MOTOR_FLOAT = -128
 
 def validMotorPort(port):
-    return port == MOTOR_PORTS.PORT_A or port == MOTOR_PORTS.PORT_B or port == MOTOR_PORTS.PORT_C or port == MOTOR_PORTS.PORT_D
+    return isinstance(port, int) and 0 <= port < len(MOTOR_PORTS)
+
+def validSensorPort(port):
+    return isinstance(port, int) and 0 <= port < len(SENSOR_PORTS)
 
 class HardwareInterface:
     # def __init__(self):
@@ -30,6 +48,14 @@ class HardwareInterface:
             dt (float): Delta time (s).
         """
         raise "Method not defined"
+
+    def stop(self):
+        """Stop the hardware at the end of a run, sending any commands still
+        waiting and floating the motors, so nothing keeps driving once the
+        program exits.
+        """
+        for port in MOTOR_PORTS:
+            self.set_motor_power(port, MOTOR_FLOAT)
     
     def set_motor_power(self, port, power):
         """
@@ -51,6 +77,16 @@ class HardwareInterface:
         """
         raise "Method not defined"
 
+    def set_motor_positions(self, positions):
+        """
+        Set the target positions of several motors together, so they all take effect in the same tick
+
+        Keyword arguments:
+        positions -- Dictionary of motor port to target position in degrees
+        """
+        for port, position in positions.items():
+            self.set_motor_position(port, position)
+
     def set_motor_position_relative(self, port, degrees): 
         """
         Set the relative motor target position in degrees. Current position plus the specified degrees.
@@ -125,9 +161,22 @@ class HardwareInterface:
             power -- the raw PWM power in percent (-100 to 100)
             encoder -- The encoder position
             dps -- The current speed in Degrees Per Second
+
+        Raises MotorError if there is no motor on the port.
         """
         raise "Method not defined"
 
+    def get_motor_statuses(self, ports):
+        """
+        Read the status of several motors together
+
+        Keyword arguments:
+        ports -- The motor ports to read. PORT_A, PORT_B, PORT_C, and/or PORT_D.
+
+        Returns a list with the status of each port in the order given, as get_motor_status
+        """
+        return [self.get_motor_status(port) for port in ports]
+
     def get_motor_encoder(self, port):
         """
         Read a motor encoder in degrees
@@ -135,11 +184,23 @@ class HardwareInterface:
         Keyword arguments:
         port -- The motor port (one at a time). PORT_A, PORT_B, PORT_C, or PORT_D.
 
-        Returns the encoder position in degrees
+        Returns the encoder position in degrees. Raises MotorError if there is no motor on the port.
         """
         raise "Method not defined"
 
 
+    def get_motor_encoders(self, ports):
+        """
+        Read several motor encoders in degrees together
+
+        Keyword arguments:
+        ports -- The motor ports to read. PORT_A, PORT_B, PORT_C, and/or PORT_D.
+
+        Returns a list with the encoder position of each port in the order given
+        """
+        return [self.get_motor_encoder(port) for port in ports]
+
+
     def offset_motor_encoder(self, port, position):
         """
         Offset a motor encoder
@@ -161,3 +222,24 @@ class HardwareInterface:
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         """
         raise "Method not defined"
+
+    def set_sensor_type(self, port, sensor_type):
+        """
+        Set the type of the sensor on a port
+
+        Keyword arguments:
+        port -- The sensor port (one at a time). PORT_1, PORT_2, PORT_3, or PORT_4.
+        sensor_type -- The sensor type, one of SENSOR_TYPES
+        """
+        raise "Method not defined"
+
+    def get_sensor(self, port):
+        """
+        Read a sensor
+
+        Keyword arguments:
+        port -- The sensor port (one at a time). PORT_1, PORT_2, PORT_3, or PORT_4.
+
+        Returns the value of the sensor, as described by SENSOR_TYPES. Raises SensorError if the port has no sensor type set.
+        """
+        raise "Method not defined"
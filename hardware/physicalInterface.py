@@ -1,44 +1,119 @@
+import sys
+import threading
+
 import hardware.hardwareInterface as hw
-import brickpi3
 
-bp = brickpi3.BrickPi3()
+# Largest raw reading of the NXT light sensor, which falls as more light
+# reaches it
+LIGHT_RAW_MAX = 4095.0
 
 class PhysicalInterface(hw.HardwareInterface):
-    def __init__(self):
+    def __init__(self, device=None):
+        """Drive a BrickPi3.
+
+        Args:
+            device (brickpi3.BrickPi3, optional): The BrickPi3 to drive, such as
+                the emulator in hardware.virtual.brickpi3Emulator. Defaults to
+                the real device, opened here.
+        """
         print("Physical Interface Initialising")
+        if device is None:
+            import brickpi3
+            device = brickpi3.BrickPi3()
+        self.bp = device
+
+        # BrickPi3 port bit masks, indexed by hw.MOTOR_PORTS
+        self.ports = (device.PORT_A, device.PORT_B, device.PORT_C, device.PORT_D)
+        # BrickPi3 sensor port bit masks, indexed by hw.SENSOR_PORTS
+        self.sensorPorts = (device.PORT_1, device.PORT_2, device.PORT_3, device.PORT_4)
+        # BrickPi3 sensor type of each of hw.SENSOR_TYPES
+        self.sensorTypes = {
+            hw.SENSOR_TYPES.NONE: device.SENSOR_TYPE.NONE,
+            hw.SENSOR_TYPES.TOUCH: device.SENSOR_TYPE.TOUCH,
+            hw.SENSOR_TYPES.ULTRASONIC: device.SENSOR_TYPE.EV3_ULTRASONIC_CM,
+            hw.SENSOR_TYPES.LIGHT: device.SENSOR_TYPE.NXT_LIGHT_ON,
+        }
+        # Type set on each sensor port, to convert its readings
+        self.sensors = [hw.SENSOR_TYPES.NONE] * len(hw.SENSOR_PORTS)
+        # Raised by the device for a sensor which isn't ready or configured
+        self.sensorError = getattr(sys.modules[type(device).__module__], "SensorError", hw.SensorError)
+
+        # Held while a group of commands is sent, so they go out back to back
+        self.lock = threading.Lock()
 
     def update(self, dt):
         pass
 
+    def stop(self):
+        # Floats the motors, and unconfigures the sensors
+        with self.lock:
+            self.bp.reset_all()
+
     def set_motor_power(self, port, power):
-        return bp.set_motor_power(port, power)
+        return self.bp.set_motor_power(self.ports[port], power)
 
     def set_motor_position(self, port, position):
-        return bp.set_motor_position(port, position)
+        return self.bp.set_motor_position(self.ports[port], position)
+
+    def set_motor_positions(self, positions):
+        # The BrickPi3 accepts several ports in one command when they share a
+        # target, so ports are grouped to send one SPI transaction per target
+        masks = {}
+        for port, position in positions.items():
+            masks[position] = masks.get(position, 0) | self.ports[port]
+        with self.lock:
+            for position, mask in masks.items():
+                self.bp.set_motor_position(mask, position)
 
     def set_motor_position_relative(self, port, degrees): 
-        return bp.set_motor_position_relative(port, degrees)
+        return self.bp.set_motor_position_relative(self.ports[port], degrees)
 
     def set_motor_position_kp(self, port, kp = 25):
-        return bp.set_motor_position_kp(port, kp)
+        return self.bp.set_motor_position_kp(self.ports[port], kp)
 
     def set_motor_position_kd(self, port, kd = 70):
-        return bp.set_motor_position_kd(port, kd)
+        return self.bp.set_motor_position_kd(self.ports[port], kd)
 
     def set_motor_dps(self, port, dps):
-        return bp.set_motor_dps(port, dps)
+        return self.bp.set_motor_dps(self.ports[port], dps)
 
     def set_motor_limits(self, port, power = 0, dps = 0):
-        return bp.set_motor_limits(port, power, dps)
+        return self.bp.set_motor_limits(self.ports[port], power, dps)
 
     def get_motor_status(self, port):
-        return bp.get_motor_status(port)
+        return self.bp.get_motor_status(self.ports[port])
+
+    def get_motor_statuses(self, ports):
+        # Reads are one port per transaction on the BrickPi3, the status
+        # carries the encoder too so nothing else needs reading
+        with self.lock:
+            return [self.bp.get_motor_status(self.ports[port]) for port in ports]
 
     def get_motor_encoder(self, port):
-        return bp.get_motor_encoder(port)
+        return self.bp.get_motor_encoder(self.ports[port])
+
+    def get_motor_encoders(self, ports):
+        with self.lock:
+            return [self.bp.get_motor_encoder(self.ports[port]) for port in ports]
 
     def offset_motor_encoder(self, port, position):
-        return bp.offset_motor_encoder(port, position)
+        return self.bp.offset_motor_encoder(self.ports[port], position)
 
     def reset_motor_encoder(self, port):
-        return bp.reset_motor_encoder(port)
+        return self.bp.reset_motor_encoder(self.ports[port])
+
+    def set_sensor_type(self, port, sensor_type):
+        with self.lock:
+            self.bp.set_sensor_type(self.sensorPorts[port], self.sensorTypes[sensor_type])
+        self.sensors[port] = hw.SENSOR_TYPES(sensor_type)
+
+    def get_sensor(self, port):
+        # Locked so a read isn't interleaved with a polling thread's reads
+        try:
+            with self.lock:
+                value = self.bp.get_sensor(self.sensorPorts[port])
+        except self.sensorError as err:
+            raise hw.SensorError(str(err)) from err
+        if self.sensors[port] == hw.SENSOR_TYPES.LIGHT:
+            return 100.0 * (1.0 - value / LIGHT_RAW_MAX)
+        return value
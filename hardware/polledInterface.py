@@ -0,0 +1,224 @@
+import threading
+import time
+import logging
+from collections import namedtuple
+
+import hardware.hardwareInterface as hw
+
+log = logging.getLogger(__name__)
+
+# Motor status of every polled port, read together at time (s since the epoch).
+# statuses is a tuple indexed by port of (flags, power, encoder, dps) tuples.
+MotorSnapshot = namedtuple("MotorSnapshot", ("time", "statuses"))
+
+# Setters where only the latest call has any effect, so a later one replaces
+# an earlier one to the same port still waiting to be sent. Every other
+# command is sent as many times as it was queued.
+COALESCED_COMMANDS = ("set_motor_power", "set_motor_position", "set_motor_dps", "set_motor_position_kp",
+                      "set_motor_position_kd", "set_motor_limits", "set_sensor_type")
+
+class PolledInterface(hw.HardwareInterface):
+    def __init__(self, interface, rate=100.0):
+        """Poll a hardware interface on a thread of its own.
+
+        Every period the polling thread sends the waiting commands, in the order
+        they were queued, then reads the status of all motors into a new
+        MotorSnapshot, and any sensors with a type set. Reads return values from
+        the latest snapshot and writes only queue the command, so neither waits
+        on the bus. Setters queued more than once within one period are
+        coalesced, so only the latest is sent. If a poll fails, the thread
+        stops the hardware and stops polling, and the error is raised again
+        from every later read or write.
+
+        Args:
+            interface (hw.HardwareInterface): The interface to poll.
+            rate (float, optional): Polls per second. Defaults to 100.0.
+        """
+        log.info("Polling at %.0f Hz", rate)
+        self.interface = interface
+        self.period = 1.0 / rate
+        self.ports = (hw.MOTOR_PORTS.PORT_A, hw.MOTOR_PORTS.PORT_B, hw.MOTOR_PORTS.PORT_C, hw.MOTOR_PORTS.PORT_D)
+
+        self.pending = {}   # Commands waiting to be sent, keyed to coalesce them
+        self.queued = 0     # Commands queued, which key those never coalesced
+        self.lock = threading.Lock()
+
+        self.snapshot = self.__read()
+        # Types sent to each sensor port, and the latest reading of each
+        # (None until one is read), as the sensors are polled too
+        self.sensorTypes = [hw.SENSOR_TYPES.NONE] * len(hw.SENSOR_PORTS)
+        self.readings = (None,) * len(hw.SENSOR_PORTS)
+        self.overruns = 0   # Polls which took longer than the period
+        self.error = None   # Exception which stopped the polling thread
+
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, name="poller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop polling after sending any waiting commands, then stop the hardware."""
+        self.running = False
+        self.thread.join()
+        if self.error is None:
+            self.__send()
+        self.interface.stop()
+
+    def get_snapshot(self) -> MotorSnapshot:
+        """Get the latest snapshot of every motor's status."""
+        self.__check()
+        return self.snapshot
+
+    def update(self, dt):
+        self.interface.update(dt)
+
+    def set_motor_power(self, port, power):
+        self.__queue("set_motor_power", port, power)
+
+    def set_motor_position(self, port, position):
+        self.__queue("set_motor_position", port, position)
+
+    def set_motor_positions(self, positions):
+        self.__check()
+        with self.lock:
+            for port, position in positions.items():
+                self.__queueLocked("set_motor_position", port, position)
+
+    def set_motor_position_relative(self, port, degrees):
+        self.__check()
+        # Made absolute now, so coalescing can't drop part of the movement
+        self.__queue("set_motor_position", port, self.snapshot.statuses[port][2] + degrees)
+
+    def set_motor_position_kp(self, port, kp = 25):
+        self.__queue("set_motor_position_kp", port, kp)
+
+    def set_motor_position_kd(self, port, kd = 70):
+        self.__queue("set_motor_position_kd", port, kd)
+
+    def set_motor_dps(self, port, dps):
+        self.__queue("set_motor_dps", port, dps)
+
+    def set_motor_limits(self, port, power = 0, dps = 0):
+        self.__queue("set_motor_limits", port, power, dps)
+
+    def get_motor_status(self, port):
+        self.__check()
+        return list(self.snapshot.statuses[port])
+
+    def get_motor_statuses(self, ports):
+        self.__check()
+        statuses = self.snapshot.statuses
+        return [list(statuses[port]) for port in ports]
+
+    def get_motor_encoder(self, port):
+        self.__check()
+        return self.snapshot.statuses[port][2]
+
+    def get_motor_encoders(self, ports):
+        self.__check()
+        statuses = self.snapshot.statuses
+        return [statuses[port][2] for port in ports]
+
+    def offset_motor_encoder(self, port, position):
+        self.__queue("offset_motor_encoder", port, position)
+
+    def reset_motor_encoder(self, port):
+        self.__queue("reset_motor_encoder", port)
+
+    def set_sensor_type(self, port, sensor_type):
+        self.__queue("set_sensor_type", port, sensor_type)
+
+    def get_sensor(self, port):
+        self.__check()
+        value = self.readings[port]
+        if value is None:
+            raise hw.SensorError(f"Sensor not read yet, port : {port}")
+        return value
+
+    def __check(self):
+        """Raise the error which stopped the polling thread, if one did."""
+        if self.error is not None:
+            raise self.error
+
+    def __queue(self, method, port, *args):
+        self.__check()
+        with self.lock:
+            self.__queueLocked(method, port, *args)
+
+    def __queueLocked(self, method, port, *args):
+        if method in COALESCED_COMMANDS:
+            key = (port, method)
+            # Re-inserting moves the command to the back, behind anything
+            # queued before it
+            self.pending.pop(key, None)
+        else:
+            self.queued += 1
+            key = self.queued
+        self.pending[key] = (method, port, args)
+
+    def __send(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        # Positions queued back to back are sent together, which keeps the
+        # order as nothing else is queued between them
+        positions = {}
+        for method, port, args in pending.values():
+            if method == "set_motor_position":
+                positions[port] = args[0]
+                continue
+            if positions:
+                self.interface.set_motor_positions(positions)
+                positions = {}
+            getattr(self.interface, method)(port, *args)
+            if method == "set_sensor_type":
+                self.sensorTypes[port] = args[0]
+        if positions:
+            self.interface.set_motor_positions(positions)
+
+    def __read(self) -> MotorSnapshot:
+        statuses = self.interface.get_motor_statuses(self.ports)
+        return MotorSnapshot(time.time(), tuple(tuple(status) for status in statuses))
+
+    def __readSensors(self) -> tuple:
+        readings = []
+        for port, sensor_type in enumerate(self.sensorTypes):
+            value = None
+            if sensor_type != hw.SENSOR_TYPES.NONE:
+                try:
+                    value = self.interface.get_sensor(port)
+                except hw.SensorError:
+                    # Sensors take a moment to start once their type is set
+                    pass
+            readings.append(value)
+        return tuple(readings)
+
+    def __run(self):
+        next = time.perf_counter()
+        while self.running:
+            try:
+                self.__send()
+                self.snapshot = self.__read()
+                self.readings = self.__readSensors()
+            except Exception as err:
+                # Left running, the caller would steer by a frozen snapshot
+                # with its commands never sent, so stop everything and hand
+                # the error to the caller's next read or write
+                log.exception("Polling failed, stopping the motors")
+                self.error = err
+                self.running = False
+                try:
+                    self.interface.stop()
+                except Exception:
+                    log.exception("Couldn't stop the motors")
+                return
+
+            next += self.period
+            remaining = next - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                # Fell behind, start the next period from now rather than
+                # polling back to back to catch up
+                self.overruns += 1
+                next = time.perf_counter()
@@ -0,0 +1,457 @@
+import array
+import logging
+import numpy as np
+
+from enum import IntEnum
+
+import motionProfile as mp
+import hardware.virtual.integrators as integrators
+import hardware.virtual.motor as motor
+import hardware.virtual.motorController as mc
+from hardware.virtual.virtualRobot import VirtualRobot
+
+log = logging.getLogger(__name__)
+
+class WHEEL(IntEnum):
+    RIGHT = 0
+    LEFT = 1
+    NONE = 2
+
+# Rows of the shared state block, one column per robot
+STATE_FIELDS = (
+    "x",
+    "y",
+    "orientation",
+    "encoder_left",
+    "encoder_right",
+    "ang_vel_left",
+    "ang_vel_right",
+    "ang_acc_left",
+    "ang_acc_right",
+    "target_left",
+    "target_right",
+    "power_left",
+    "power_right",
+    "integral_left",
+    "integral_right",
+)
+
+# Indices into a VirtualRobot snapshot of the values each robot here has, the
+# pose and then, for each wheel from its start, the controller's mode, power,
+# target and integral, and the motor's encoder, speed and acceleration
+SNAPSHOT_POSE = 0
+SNAPSHOT_TIME = len(VirtualRobot.STATE) - 1
+SNAPSHOT_WHEELS = (len(VirtualRobot.STATE), len(VirtualRobot.STATE) + len(mc.MotorController.STATE) + len(motor.Motor.STATE))
+SNAPSHOT_CONTROLLER = tuple(mc.MotorController.STATE.index(name) for name in ("mode", "power", "target", "integral"))
+SNAPSHOT_MOTOR = tuple(len(mc.MotorController.STATE) + motor.Motor.STATE.index(name) for name in ("encoder", "ang_vel", "ang_acc"))
+# Only written to snapshots, a batch's gains are its own
+SNAPSHOT_GAINS = tuple(mc.MotorController.STATE.index(name) for name in ("kp", "kd", "ki"))
+SNAPSHOT_MOTOR_POWER = len(mc.MotorController.STATE) + motor.Motor.STATE.index("power")
+
+# Default difference in encoder position and target (degrees) within which a
+# robot's move is considered done
+POSITION_REACHED = 1
+
+class BatchVirtualRobot:
+    """Step N independent virtual robots at once with NumPy array operations.
+
+    Each robot follows the same control law as motorController.MotorController,
+    the same motor model as motor.Motor and the same differential drive
+    kinematics as integrators.arc, but the pose, encoders, angular velocities
+    and motor goals of every robot live in one contiguous
+    (fields x N) array, so a tick costs a fixed number of vectorised operations
+    whatever N is.
+
+    The controller gains (kp, kd, ki, in the firmware's units), the tolerance a
+    move is done within (position_reached), the geometry (wheel_radius,
+    wheel_width), the weight and the terrain (wheel_slip_vel, wheel_slip_acc)
+    may be scalars or arrays of length N, which is what makes it useful for
+    tuning: every column can be a different parameter set.
+    """
+    def __init__(self, n, config=None, motor_config=None, kp=mc.DEFAULT_KP, kd=mc.DEFAULT_KD,
+                 ki=mc.DEFAULT_KI, position_reached=POSITION_REACHED,
+                 wheel_radius=None, wheel_width=None, weight=None,
+                 wheel_slip_vel=None, wheel_slip_acc=None):
+        self.n = n
+
+        if config is None or motor_config is None:
+            import robotConfig
+            loaded = robotConfig.load()
+            config = loaded.robot if config is None else config
+            motor_config = loaded.motor if motor_config is None else motor_config
+        self.config = config
+        self.motor_config = motor_config
+
+        if wheel_radius is None:
+            wheel_radius = config.wheel_radius
+        if wheel_width is None:
+            wheel_width = config.wheel_width
+        if weight is None:
+            weight = config.weight
+        if wheel_slip_vel is None:
+            wheel_slip_vel = config.terrain.wheel_slip_vel
+        if wheel_slip_acc is None:
+            wheel_slip_acc = config.terrain.wheel_slip_acc
+
+        self.kp = self.__perRobot(kp)
+        self.kd = self.__perRobot(kd)
+        self.ki = self.__perRobot(ki)
+        # Gains scaled once, as MotorController does when they are set
+        self.gain_p = self.kp * mc.KP_SCALE
+        self.gain_d = self.kd * mc.KD_SCALE
+        self.gain_i = self.ki * mc.KI_SCALE
+        self.position_reached = self.__perRobot(position_reached)
+        self.wheel_radius = self.__perRobot(wheel_radius)
+        self.wheel_width = self.__perRobot(wheel_width)
+        self.weight = self.__perRobot(weight)
+        self.wheel_slip_vel = self.__perRobot(wheel_slip_vel)
+        self.wheel_slip_acc = self.__perRobot(wheel_slip_acc)
+
+        # The motor model's constants, as motor.Motor derives them, with the
+        # time constant per robot as each drives its own load
+        self.dps_per_power = motor_config.rpm_power_a * 6.0
+        self.encoder_degrees = motor_config.encoder_degrees
+        self.dps_per_torque = -motor_config.rpm_torque_b * 6.0
+        self.dps_max = motor_config.rpm_torque_a * 6.0
+        self.friction = motor_config.friction * self.dps_per_torque
+        load_inertia = self.weight / 2.0 * self.wheel_radius ** 2
+        self.time_constant = (motor_config.inertia + load_inertia) * np.deg2rad(self.dps_per_torque)
+        self.decay_dt = None
+        self.decay = None
+
+        self.state = np.zeros((len(STATE_FIELDS), n))
+        for row, field in enumerate(STATE_FIELDS):
+            # Each row of a C ordered block is itself a contiguous view
+            setattr(self, field, self.state[row])
+
+        # Motor modes, starting held at 0 as in VirtualRobot
+        self.mode_left = np.full(n, mc.MODE_POSITION, dtype=np.int8)
+        self.mode_right = np.full(n, mc.MODE_POSITION, dtype=np.int8)
+
+        # Profiled move in progress, the fraction of it done on each tick (one
+        # row per robot, padded with 1.0), where each robot's move started
+        # and how far, and the ticks until each robot's targets are at the
+        # end, which it can't have settled before
+        self.move_profile = None
+        self.profile_tick = 0
+        self.profile_ticks = np.zeros(n, dtype=int)
+        self.move_start = (np.zeros(n), np.zeros(n))
+        self.move_degrees = (np.zeros(n), np.zeros(n))
+
+        self.time = 0.0
+
+    def set_motor_power(self, wheel, power, robots=slice(None)):
+        """Drive a wheel at a fixed power.
+
+        Args:
+            wheel (WHEEL): The wheel to drive.
+            power (float | np.ndarray): Power in percent [-100, 100], per robot or shared.
+            robots (index, optional): Subset of robots to command. Defaults to all.
+        """
+        mode, _, powers, _ = self.__wheel(wheel)
+        mode[robots] = mc.MODE_POWER
+        powers[robots] = power
+
+    def set_motor_position(self, wheel, position, robots=slice(None)):
+        """Set the encoder target of a wheel, as VirtualInterface.set_motor_position.
+
+        Args:
+            wheel (WHEEL): The wheel to drive.
+            position (float | np.ndarray): Target encoder position (degrees).
+            robots (index, optional): Subset of robots to command. Defaults to all.
+        """
+        mode, target, _, integral = self.__wheel(wheel)
+        # The integral restarts when a motor enters position control
+        integral[robots] = np.where(mode[robots] == mc.MODE_POSITION, integral[robots], 0.0)
+        mode[robots] = mc.MODE_POSITION
+        target[robots] = np.round(position)
+
+    def wheelDegrees(self, distance) -> np.ndarray:
+        """Degrees each robot's wheels turn to roll a distance (m)."""
+        return np.broadcast_to(distance / (2 * np.pi * self.wheel_radius) * 360, (self.n,))
+
+    def profile(self, name, degrees, power, acceleration, jerk, dt):
+        """Compute each robot's motion profile of a move, as Robot.profile.
+
+        Args:
+            name (str): One of motionProfile.PROFILES.
+            degrees (np.ndarray): Distance the wheel which moves furthest turns, per robot (degrees).
+            power (float): Fraction of full power the move is limited to.
+            acceleration (float): Largest acceleration (m/s^2).
+            jerk (float): Largest jerk (m/s^3), for scurve.
+            dt (float): Control tick (s).
+
+        Returns:
+            np.ndarray: (n, ticks) fraction of the move done at each tick,
+                padded with 1.0, or None to step straight to the targets.
+        """
+        full_speed = min(self.motor_config.rpm_power_a * 6.0 * 100.0, self.motor_config.rpm_torque_a * 6.0)
+        per_metre = self.wheelDegrees(1.0)
+        # Robots sharing a geometry share a profile, so each is only computed once
+        profiles = {}
+        rows = []
+        for distance, scale in zip(np.abs(degrees), per_metre):
+            key = (distance, scale)
+            if key not in profiles:
+                profiles[key] = mp.getProfile(name, distance, power * full_speed, acceleration * scale, jerk * scale, dt)
+            rows.append(profiles[key])
+        if rows[0] is None:
+            return None
+
+        fractions = np.ones((self.n, max(len(row) for row in rows)))
+        for robot, row in enumerate(rows):
+            fractions[robot, :len(row)] = row
+        return fractions
+
+    def move(self, left_degrees, right_degrees, profile=None):
+        """Turn every robot's wheels by a number of degrees each, as Robot.moveWheels.
+
+        Args:
+            left_degrees (float | np.ndarray): Degrees to turn the left wheel, per robot or shared.
+            right_degrees (float | np.ndarray): Degrees to turn the right wheel, per robot or shared.
+            profile (np.ndarray, optional): Fraction of the move the targets are
+                set to at each tick, from profile. Defaults to None, which sets
+                them to the end straight away.
+        """
+        self.move_start = (self.get_encoder(WHEEL.LEFT), self.get_encoder(WHEEL.RIGHT))
+        self.move_degrees = (np.broadcast_to(left_degrees, (self.n,)), np.broadcast_to(right_degrees, (self.n,)))
+        self.move_profile = profile
+        self.profile_tick = 0
+        if profile is None:
+            self.profile_ticks[:] = 0
+            self.__setMoveTargets(1.0)
+        else:
+            # Each robot's targets reach the end on the first tick its row reaches 1.0
+            self.profile_ticks[:] = np.argmax(profile >= 1.0, axis=1) + 1
+
+    def forwards(self, distance, robots=slice(None)):
+        """Set both wheels to drive a straight distance, as the FORWARDS command.
+
+        Args:
+            distance (float | np.ndarray): Distance to travel (m).
+            robots (index, optional): Subset of robots to command. Defaults to all.
+        """
+        degrees = self.wheelDegrees(distance)[robots]
+        self.set_motor_position(WHEEL.LEFT, self.get_encoder(WHEEL.LEFT)[robots] + degrees, robots)
+        self.set_motor_position(WHEEL.RIGHT, self.get_encoder(WHEEL.RIGHT)[robots] + degrees, robots)
+
+    def turnDegrees(self, angle) -> tuple:
+        """Degrees the left and right wheels turn for the TURN command.
+
+        Args:
+            angle (float): Angle to turn on the spot (degrees, +ve clockwise).
+        """
+        degrees = self.wheelDegrees(np.radians(angle) * self.wheel_width / 2.0)
+        return degrees, -degrees
+
+    def arcDegrees(self, radius, angle) -> tuple:
+        """Degrees the left and right wheels turn for the ARC command.
+
+        Args:
+            radius (float): Radius of the path of the centre (m, +ve to turn clockwise).
+            angle (float): Angle turned (degrees, -ve to reverse around the arc).
+        """
+        angle = np.radians(angle)
+        outer = self.wheelDegrees((abs(radius) + self.wheel_width / 2.0) * angle)
+        inner = self.wheelDegrees((abs(radius) - self.wheel_width / 2.0) * angle)
+        return (outer, inner) if radius >= 0 else (inner, outer)
+
+    def get_encoder(self, wheel) -> np.ndarray:
+        """Get the rounded encoder values of a wheel for every robot.
+
+        Returns:
+            np.ndarray: The encoder values (degrees).
+        """
+        return np.round(self.encoder_left if wheel == WHEEL.LEFT else self.encoder_right)
+
+    def settled(self) -> np.ndarray:
+        """Robots whose motors are both in position control and within
+        position_reached of their targets.
+
+        Returns:
+            np.ndarray: Boolean mask of settled robots.
+        """
+        return ((self.mode_left == mc.MODE_POSITION) & (np.abs(self.target_left - np.round(self.encoder_left)) < self.position_reached)
+                & (self.mode_right == mc.MODE_POSITION) & (np.abs(self.target_right - np.round(self.encoder_right)) < self.position_reached)
+                & (self.profile_tick >= self.profile_ticks))
+
+    def update(self, dt):
+        """Advance every robot by one tick.
+
+        Args:
+            dt (float): Delta time (s). Nothing is advanced unless it is positive.
+        """
+        if dt <= 0:
+            return
+        if dt != self.decay_dt:
+            self.decay_dt = dt
+            with np.errstate(divide="ignore"):
+                self.decay = np.where(self.time_constant > 0, np.exp(-dt / self.time_constant), 0.0)
+
+        if self.move_profile is not None:
+            ticks = self.move_profile.shape[1]
+            self.__setMoveTargets(self.move_profile[:, min(self.profile_tick, ticks - 1)])
+            self.profile_tick += 1
+            if self.profile_tick >= ticks:
+                self.move_profile = None
+
+        self.__updateMotor(self.encoder_left, self.ang_vel_left, self.ang_acc_left, self.mode_left, self.target_left, self.power_left, self.integral_left, dt)
+        self.__updateMotor(self.encoder_right, self.ang_vel_right, self.ang_acc_right, self.mode_right, self.target_right, self.power_right, self.integral_right, dt)
+
+        vel_left = self.__groundVelocity(self.ang_vel_left, self.ang_acc_left)
+        vel_right = self.__groundVelocity(self.ang_vel_right, self.ang_acc_right)
+
+        # Distance travelled by the centre of the robot and the angle turned
+        # (anticlockwise, radians) over the tick
+        distance = dt * (vel_left + vel_right) / 2.0
+        arc_angle = (vel_right - vel_left) * dt / self.wheel_width
+
+        # Delta forward and sideways (to the left) along the arc, falling back
+        # to a straight line when the wheels are (nearly) matched
+        straight = np.abs(vel_left - vel_right) < integrators.VEL_DIFF_MIN
+        safe_angle = np.where(straight, 1.0, arc_angle)
+        df = np.where(straight, distance, np.sin(safe_angle) / safe_angle * distance)
+        ds = np.where(straight, 0.0, (1.0 - np.cos(safe_angle)) / safe_angle * distance)
+
+        # Orientation is a heading in degrees, clockwise from the y axis
+        heading = np.deg2rad(self.orientation)
+        sin_heading = np.sin(heading)
+        cos_heading = np.cos(heading)
+
+        self.x += df * sin_heading - ds * cos_heading
+        self.y += df * cos_heading + ds * sin_heading
+        self.orientation -= np.where(straight, 0.0, np.rad2deg(arc_angle))
+
+        self.time += dt
+
+    def run(self, dt, max_time) -> np.ndarray:
+        """Step until every robot has settled or max_time has been simulated.
+
+        Args:
+            dt (float): Delta time (s).
+            max_time (float): Maximum time to simulate (s).
+
+        Returns:
+            np.ndarray: Time each robot took to settle (s), nan if it never did.
+        """
+        start = self.time
+        settle_time = np.full(self.n, np.nan)
+        pending = ~self.settled()
+        settle_time[~pending] = 0.0
+        while pending.any() and self.time - start < max_time:
+            self.update(dt)
+            done = pending & self.settled()
+            settle_time[done] = self.time - start
+            pending &= ~done
+        return settle_time
+
+    def snapshot(self, robot=0) -> array.array:
+        """Save one robot's state as a VirtualRobot snapshot, which can be
+        restored into a VirtualRobot or into robots of another batch.
+
+        A batch has no speed control, limits or encoder offsets, which are
+        saved as 0, and the motor's power is the commanded power in power mode
+        and 0 otherwise.
+
+        Args:
+            robot (int, optional): The robot. Defaults to 0.
+
+        Returns:
+            array.array: The snapshot.
+        """
+        snapshot = np.zeros(VirtualRobot.STATE_SIZE)
+        snapshot[SNAPSHOT_POSE:SNAPSHOT_POSE + 3] = self.x[robot], self.y[robot], self.orientation[robot]
+        snapshot[SNAPSHOT_TIME] = self.time
+        for start, wheel in zip(SNAPSHOT_WHEELS, (WHEEL.LEFT, WHEEL.RIGHT)):
+            mode, target, power, integral = self.__wheel(wheel)
+            encoder, ang_vel, ang_acc = self.__motor(wheel)
+            snapshot[[start + i for i in SNAPSHOT_CONTROLLER]] = mode[robot], power[robot], target[robot], integral[robot]
+            snapshot[[start + i for i in SNAPSHOT_MOTOR]] = encoder[robot], ang_vel[robot], ang_acc[robot]
+            snapshot[[start + i for i in SNAPSHOT_GAINS]] = self.kp[robot], self.kd[robot], self.ki[robot]
+            snapshot[start + SNAPSHOT_MOTOR_POWER] = power[robot] if mode[robot] == mc.MODE_POWER else 0.0
+        return array.array("d", snapshot.tobytes())
+
+    def restore(self, snapshot, robots=slice(None)):
+        """Start robots from a VirtualRobot snapshot, to fork many runs from
+        one shared start. The batch's own gains are kept, so each run can try
+        different ones, and the batch's clock is set to the snapshot's.
+
+        Args:
+            snapshot (array.array): Snapshot from VirtualRobot.snapshot or BatchVirtualRobot.snapshot.
+            robots (index, optional): Subset of robots to restore. Defaults to all.
+
+        Raises:
+            ValueError: If a motor in the snapshot is under speed control, which a batch doesn't model.
+        """
+        snapshot = np.asarray(snapshot, dtype=float)
+        self.x[robots], self.y[robots], self.orientation[robots] = snapshot[SNAPSHOT_POSE:SNAPSHOT_POSE + 3]
+        self.time = float(snapshot[SNAPSHOT_TIME])
+        for start, wheel in zip(SNAPSHOT_WHEELS, (WHEEL.LEFT, WHEEL.RIGHT)):
+            mode, target, power, integral = self.__wheel(wheel)
+            encoder, ang_vel, ang_acc = self.__motor(wheel)
+            saved_mode, saved_power, saved_target, saved_integral = snapshot[[start + i for i in SNAPSHOT_CONTROLLER]]
+            if saved_mode == mc.MODE_DPS:
+                raise ValueError("Can't restore a motor under speed control into a BatchVirtualRobot")
+            mode[robots] = saved_mode
+            power[robots] = saved_power
+            target[robots] = saved_target
+            integral[robots] = saved_integral
+            encoder[robots], ang_vel[robots], ang_acc[robots] = snapshot[[start + i for i in SNAPSHOT_MOTOR]]
+
+    def __setMoveTargets(self, done):
+        """Set the targets of the move to a fraction of the way (per robot or shared)."""
+        self.set_motor_position(WHEEL.LEFT, self.move_start[0] + self.move_degrees[0] * done)
+        self.set_motor_position(WHEEL.RIGHT, self.move_start[1] + self.move_degrees[1] * done)
+
+    def __updateMotor(self, encoder, ang_vel, ang_acc, mode, target, power, integral, dt):
+        """Vectorised MotorController.update followed by motor.Motor.update."""
+        positioning = mode == mc.MODE_POSITION
+        error = target - np.round(encoder)
+        integral += np.where(positioning, error * self.gain_i * dt, 0.0)
+        np.clip(integral, -100, 100, out=integral)
+
+        control = error * self.gain_p + integral - ang_vel * self.gain_d
+        drive = np.clip(np.where(positioning, control, np.where(mode == mc.MODE_POWER, power, 0.0)), -100, 100)
+
+        # Speed each motor would settle to, then friction opposing the motion
+        # (or the drive of a stopped motor) as in motor.Motor.update
+        drive = np.clip(self.dps_per_power * drive, -self.dps_max, self.dps_max)
+        stopped = ang_vel == 0
+        steady = drive - np.where(np.where(stopped, drive, ang_vel) > 0, self.friction, -self.friction)
+        new_vel = steady + (ang_vel - steady) * self.decay
+        # Motors through zero are held by friction, or driven on the other way
+        # as in motor.reverse
+        flipped = ~stopped & ((new_vel > 0) != (ang_vel > 0))
+        held = (stopped | flipped) & (np.abs(drive) <= self.friction)
+        reversing = flipped & ~held
+        if reversing.any():
+            time_constant = self.time_constant[reversing]
+            reversed_steady = drive[reversing] - np.copysign(self.friction, drive[reversing])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                stopped_time = time_constant * np.log((ang_vel[reversing] - steady[reversing]) / -steady[reversing])
+                new_vel[reversing] = np.where(time_constant > 0, reversed_steady * (1.0 - np.exp(-(dt - stopped_time) / time_constant)), reversed_steady)
+        new_vel[held] = 0.0
+
+        encoder += (ang_vel + new_vel) * 0.5 * dt * self.encoder_degrees
+        ang_acc[:] = (new_vel - ang_vel) / dt
+        ang_vel[:] = new_vel
+
+    def __groundVelocity(self, ang_vel, ang_acc) -> np.ndarray:
+        """Linear velocity of the wheels over the ground, less the slip (m/s)."""
+        rim = 2 * np.pi * self.wheel_radius / 360.0
+        vel = rim * ang_vel
+        slip = self.wheel_slip_vel * np.abs(vel) + self.wheel_slip_acc * np.abs(rim * ang_acc)
+        return vel * (1.0 - np.minimum(slip, 1.0))
+
+    def __wheel(self, wheel):
+        if wheel == WHEEL.LEFT:
+            return self.mode_left, self.target_left, self.power_left, self.integral_left
+        return self.mode_right, self.target_right, self.power_right, self.integral_right
+
+    def __motor(self, wheel):
+        if wheel == WHEEL.LEFT:
+            return self.encoder_left, self.ang_vel_left, self.ang_acc_left
+        return self.encoder_right, self.ang_vel_right, self.ang_acc_right
+
+    def __perRobot(self, value) -> np.ndarray:
+        return np.broadcast_to(np.asarray(value, dtype=float), (self.n,)).copy()
@@ -0,0 +1,172 @@
+"""A stand in for the brickpi3 module's BrickPi3 device.
+
+BrickPi3 implements the motor methods of brickpi3.BrickPi3, driving a virtual
+motor.Motor through a motorController.MotorController on each port instead of
+talking to the hardware over SPI, so that PhysicalInterface (and anything
+built on it) can run, be tested and be benchmarked off the robot. Its sensors
+are in an empty room, so they read as sensing nothing once their type is set.
+Every call is one transaction which takes the configured latency plus a random
+jitter, and the motors are advanced to the wall clock time at the start of
+each one.
+"""
+import random
+import time
+import logging
+
+import hardware.hardwareInterface as hw
+import hardware.virtual.motor as motor
+import hardware.virtual.motorController as mc
+
+log = logging.getLogger(__name__)
+
+# Largest step (s) the motors are advanced by, longer gaps are sub-stepped
+MAX_STEP = 0.001
+
+# Raised for a sensor which can't be read, as brickpi3.SensorError is
+SensorError = hw.SensorError
+
+# The sensor types PhysicalInterface sets, named as brickpi3's are
+class SENSOR_TYPE:
+    NONE = 1
+    TOUCH = 4
+    NXT_LIGHT_ON = 7
+    EV3_ULTRASONIC_CM = 33
+
+# Reading of each sensor type with nothing to sense, the light sensor's raw
+# reading falling as more light reaches it
+NOTHING_SENSED = {
+    SENSOR_TYPE.TOUCH: 0,
+    SENSOR_TYPE.NXT_LIGHT_ON: 4095,
+    SENSOR_TYPE.EV3_ULTRASONIC_CM: 255.0,
+}
+
+class BrickPi3:
+    PORT_1 = 0x01
+    PORT_2 = 0x02
+    PORT_3 = 0x04
+    PORT_4 = 0x08
+
+    PORT_A = 0x01
+    PORT_B = 0x02
+    PORT_C = 0x04
+    PORT_D = 0x08
+
+    MOTOR_FLOAT = mc.MOTOR_FLOAT
+
+    SENSOR_TYPE = SENSOR_TYPE
+
+    def __init__(self, latency=0.0, jitter=0.0, motor_config=None, seed=None):
+        """Emulate a BrickPi3.
+
+        Args:
+            latency (float, optional): Time each transaction takes (s). Defaults to 0.0.
+            jitter (float, optional): Largest random extra time per transaction (s). Defaults to 0.0.
+            motor_config (robotConfig.MotorConfig, optional): Config of the motor on every port. Defaults to the LegoMotor table of the motor config.
+            seed (int, optional): Seed for the jitter. Defaults to None.
+        """
+        log.info("Emulating BrickPi3 with %.1fus latency", latency * 1e6)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+        if motor_config is None:
+            import robotConfig
+            motor_config = robotConfig.loadMotors()["LegoMotor"]
+        self.ports = {mask: mc.MotorController(motor.Motor(motor_config)) for mask in (self.PORT_A, self.PORT_B, self.PORT_C, self.PORT_D)}
+        self.sensor_types = {mask: SENSOR_TYPE.NONE for mask in (self.PORT_1, self.PORT_2, self.PORT_3, self.PORT_4)}
+        self.last = time.perf_counter()
+        self.transactions = 0   # Number of transactions made
+
+    def set_motor_power(self, port, power):
+        for controller in self.__transaction(port):
+            controller.set_power(power)
+
+    def set_motor_position(self, port, position):
+        for controller in self.__transaction(port):
+            controller.set_position(position)
+
+    def set_motor_position_relative(self, port, degrees):
+        for controller in self.__transaction(port):
+            controller.set_position_relative(degrees)
+
+    def set_motor_position_kp(self, port, kp = 25):
+        for controller in self.__transaction(port):
+            controller.set_kp(kp)
+
+    def set_motor_position_kd(self, port, kd = 70):
+        for controller in self.__transaction(port):
+            controller.set_kd(kd)
+
+    def set_motor_dps(self, port, dps):
+        for controller in self.__transaction(port):
+            controller.set_dps(dps)
+
+    def set_motor_limits(self, port, power = 0, dps = 0):
+        for controller in self.__transaction(port):
+            controller.set_limits(power, dps)
+
+    def get_motor_status(self, port):
+        return self.__single(port).get_status()
+
+    def get_motor_encoder(self, port):
+        return self.__single(port).get_encoder()
+
+    def offset_motor_encoder(self, port, position):
+        for controller in self.__transaction(port):
+            controller.offset_encoder(position)
+
+    def reset_motor_encoder(self, port):
+        for controller in self.__transaction(port):
+            controller.reset_encoder()
+
+    def set_sensor_type(self, port, sensor_type, params=0):
+        self.__transaction(port)
+        for mask in self.sensor_types:
+            if port & mask:
+                self.sensor_types[mask] = sensor_type
+
+    def get_sensor(self, port):
+        self.__transaction(port)
+        if port not in self.sensor_types:
+            raise IOError("Reads take exactly one port")
+        sensor_type = self.sensor_types[port]
+        if sensor_type not in NOTHING_SENSED:
+            raise SensorError("get_sensor error: Invalid sensor type")
+        return NOTHING_SENSED[sensor_type]
+
+    def reset_all(self):
+        for controller in self.__transaction(self.PORT_A | self.PORT_B | self.PORT_C | self.PORT_D):
+            controller.set_power(mc.MOTOR_FLOAT)
+            controller.set_limits(0, 0)
+        for mask in self.sensor_types:
+            self.sensor_types[mask] = SENSOR_TYPE.NONE
+
+    def __single(self, port):
+        ports = self.__transaction(port)
+        if len(ports) != 1:
+            raise IOError("Reads take exactly one port")
+        return ports[0]
+
+    def __transaction(self, port) -> list:
+        """Take the time of one SPI transaction and bring the motors up to date.
+
+        Returns:
+            list: The ports addressed by the port mask.
+        """
+        self.transactions += 1
+        delay = self.latency + self.random.uniform(0.0, self.jitter)
+        if delay > 0:
+            # Sleep rather than spin, as the real SPI calls let other threads
+            # run while they wait on the bus
+            time.sleep(delay)
+
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        while elapsed > 0:
+            dt = min(elapsed, MAX_STEP)
+            for controller in self.ports.values():
+                controller.update(dt)
+            elapsed -= dt
+
+        return [controller for mask, controller in self.ports.items() if port & mask]
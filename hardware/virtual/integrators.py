@@ -0,0 +1,132 @@
+"""Integrators for the differential drive kinematics.
+
+Each integrator advances a pose (x, y in metres, orientation as a heading in
+degrees clockwise from the y axis) over dt with the wheels at constant linear
+velocities, and returns the new pose. The robot moves along its heading at the
+mean wheel velocity and turns anticlockwise at (vel_right - vel_left) / width.
+
+'arc' follows the circular arc exactly, so it is exact for any dt while the
+wheel velocities are constant. The others approximate it with increasing order
+and cost, and can be wrapped with adaptive to sub-step until an error tolerance
+is met.
+"""
+import math
+import logging
+
+log = logging.getLogger(__name__)
+
+# Minimal difference between wheel velocities for the robot to be considered
+# as moving in a straight line
+VEL_DIFF_MIN = 0.0001
+
+def derivative(orientation, vel_left, vel_right, width):
+    """Rate of change of the pose at a heading.
+
+    Returns:
+        tuple: dx/dt (m/s), dy/dt (m/s), d(orientation)/dt (rad/s).
+    """
+    vel = (vel_left + vel_right) / 2.0
+    return vel * math.sin(orientation), vel * math.cos(orientation), -(vel_right - vel_left) / width
+
+def euler(x, y, orientation, vel_left, vel_right, width, dt):
+    dx, dy, do = derivative(math.radians(orientation), vel_left, vel_right, width)
+    return x + dx * dt, y + dy * dt, orientation + math.degrees(do * dt)
+
+def midpoint(x, y, orientation, vel_left, vel_right, width, dt):
+    o = math.radians(orientation)
+    _, _, do = derivative(o, vel_left, vel_right, width)
+    dx, dy, do = derivative(o + do * dt / 2, vel_left, vel_right, width)
+    return x + dx * dt, y + dy * dt, orientation + math.degrees(do * dt)
+
+def rk4(x, y, orientation, vel_left, vel_right, width, dt):
+    o = math.radians(orientation)
+    dx1, dy1, do1 = derivative(o, vel_left, vel_right, width)
+    dx2, dy2, do2 = derivative(o + do1 * dt / 2, vel_left, vel_right, width)
+    dx3, dy3, do3 = derivative(o + do2 * dt / 2, vel_left, vel_right, width)
+    dx4, dy4, do4 = derivative(o + do3 * dt, vel_left, vel_right, width)
+    return (x + (dx1 + 2 * dx2 + 2 * dx3 + dx4) * dt / 6,
+            y + (dy1 + 2 * dy2 + 2 * dy3 + dy4) * dt / 6,
+            orientation + math.degrees((do1 + 2 * do2 + 2 * do3 + do4) * dt / 6))
+
+def arc(x, y, orientation, vel_left, vel_right, width, dt):
+    o = math.radians(orientation)
+    distance = dt * (vel_left + vel_right) / 2.0
+
+    if abs(vel_left - vel_right) < VEL_DIFF_MIN:
+        return x + math.sin(o) * distance, y + math.cos(o) * distance, orientation
+
+    # Angle turned anticlockwise around the centre of the arc
+    arc_angle = (vel_right - vel_left) * dt / width
+
+    # Delta forward
+    df = math.sin(arc_angle) / arc_angle * distance
+    # Delta sideways (to the left)
+    ds = (1.0 - math.cos(arc_angle)) / arc_angle * distance
+
+    return (x + df * math.sin(o) - ds * math.cos(o),
+            y + df * math.cos(o) + ds * math.sin(o),
+            orientation - math.degrees(arc_angle))
+
+INTEGRATORS = {
+    "euler": euler,
+    "midpoint": midpoint,
+    "rk4": rk4,
+    "arc": arc,
+}
+
+def adaptive(step, tolerance, max_depth=8):
+    """Wrap an integrator with adaptive sub-stepping by step doubling.
+
+    Each step is compared against two half steps, which are kept when they
+    differ by at most the tolerance. Otherwise each half is sub-stepped again,
+    starting from the first half step already taken, up to max_depth times.
+    Steps which still miss the tolerance at max_depth are kept, with a warning
+    the first time.
+
+    Args:
+        step (function): The integrator to wrap.
+        tolerance (float): Largest allowed position difference (m).
+        max_depth (int, optional): Most times a step may be halved. Defaults to 8.
+
+    Returns:
+        function: An integrator with the same signature.
+    """
+    warned = False
+
+    def integrate(x, y, orientation, vel_left, vel_right, width, dt, depth=0, full=None):
+        nonlocal warned
+        if full is None:
+            full = step(x, y, orientation, vel_left, vel_right, width, dt)
+        half = step(x, y, orientation, vel_left, vel_right, width, dt / 2)
+        both = step(*half, vel_left, vel_right, width, dt / 2)
+
+        error = math.hypot(full[0] - both[0], full[1] - both[1])
+        if error <= tolerance:
+            return both
+        if depth >= max_depth:
+            if not warned:
+                warned = True
+                log.warning("Tolerance %gm not met at the smallest step %gs, error %gm", tolerance, dt, error)
+            return both
+
+        # The first half step is the full step of the first sub-step
+        first = integrate(x, y, orientation, vel_left, vel_right, width, dt / 2, depth + 1, half)
+        return integrate(*first, vel_left, vel_right, width, dt / 2, depth + 1)
+
+    return integrate
+
+def getIntegrator(name="arc", tolerance=0.0):
+    """Look up an integrator by name.
+
+    Args:
+        name (str, optional): One of INTEGRATORS. Defaults to "arc".
+        tolerance (float, optional): Adaptive sub-stepping tolerance (m), 0 for fixed steps. Defaults to 0.0.
+
+    Returns:
+        function: The integrator.
+    """
+    if name not in INTEGRATORS:
+        raise ValueError(f"Unknown integrator : {name}")
+    if tolerance > 0:
+        return adaptive(INTEGRATORS[name], tolerance)
+    return INTEGRATORS[name]
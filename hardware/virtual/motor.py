@@ -1,38 +1,146 @@
-import toml
-import sys
+import math
+import logging
+
+log = logging.getLogger(__name__)
+
+def reverse(ang_vel, steady, reversed_steady, time_constant, dt) -> float:
+    """Speed at the end of a tick in which a motor slows through zero and
+    speeds up the other way, as friction turns to oppose the new direction.
+
+    Args:
+        ang_vel (float): Speed at the start of the tick (degrees / s).
+        steady (float): Speed it was settling to before the reversal (degrees / s).
+        reversed_steady (float): Speed it settles to after the reversal (degrees / s).
+        time_constant (float): Time constant of the speed (s).
+        dt (float): Length of the tick (s).
+    """
+    if time_constant <= 0:
+        return reversed_steady
+    # Time until the speed reaches zero, along the first exponential
+    stopped = time_constant * math.log((ang_vel - steady) / -steady)
+    return reversed_steady * (1.0 - math.exp(-(dt - stopped) / time_constant))
 
 class Motor:
-    def __init__(self, config_type):
-        print("Initialising Virtual Motors")
-        self.config = config_type
-        with open("config/motor_config.toml") as stream:
-            try:
-                self.config = toml.load(stream)[config_type]
-                print(self.config)
-            except toml.TomlDecodeError as err:
-                print(err)
-                sys.exit(-1)
-        self.encoder = 0    # Encoder value
-        self.ang_vel = 0    # Angular velocity (degrees / s)
-        self.ang_acc = 0    # Angular acceleration (degrees / s^2)
+    # State which changes as the motor runs, in the order it is saved
+    STATE = ("encoder", "ang_vel", "ang_acc", "power")
+
+    __slots__ = STATE + ("config", "dps_per_power", "encoder_degrees", "dps_per_torque", "dps_max",
+                         "friction", "load_inertia", "time_constant", "decay_dt", "decay")
+
+    def __init__(self, config, load_inertia=0.0):
+        """A motor with the second order dynamics of a DC motor.
+
+        The motor's torque falls linearly with its speed, along the line
+        rpm = rpm_power_a * power + rpm_torque_b * torque, so left to itself at
+        a constant power it settles exponentially to its free speed. How fast
+        it settles is set by the inertia it has to accelerate, its own plus the
+        load's, and Coulomb friction and any load torque hold it back.
+
+        Args:
+            config (robotConfig.MotorConfig): Config of the motor.
+            load_inertia (float, optional): Inertia driven by the motor, at its output shaft (kg m^2). Defaults to 0.0.
+        """
+        log.info("Initialising Virtual Motors")
+        self.config = config
+        log.debug("%s", self.config)
+        self.encoder = 0.0  # Encoder value
+        self.ang_vel = 0.0  # Angular velocity (degrees / s)
+        self.ang_acc = 0.0  # Angular acceleration (degrees / s^2)
+        self.power = 0.0    # Last power sent to the motor (%)
+
+        # Constants of the model in degrees / s, read from the config once
+        self.dps_per_power = self.config.rpm_power_a * 6.0
+        self.encoder_degrees = self.config.encoder_degrees
+        # Free speed (degrees / s) lost per Nm of torque held against the motor
+        self.dps_per_torque = -self.config.rpm_torque_b * 6.0
+        # Largest free speed (degrees / s)
+        self.dps_max = self.config.rpm_torque_a * 6.0
+        self.friction = self.config.friction * self.dps_per_torque
+        self.setLoadInertia(load_inertia)
+
+    def setLoadInertia(self, load_inertia):
+        """Set the inertia driven by the motor (kg m^2), which slows how fast it
+        reaches its speed."""
+        self.load_inertia = load_inertia
+        # Time constant (s) of the speed, from the slope of the torque speed
+        # line (rad / s per Nm) and the total inertia
+        inertia = self.config.inertia + load_inertia
+        self.time_constant = inertia * math.radians(self.dps_per_torque)
+        self.decay_dt = None
+        self.decay = 0.0
 
     def update(self, power, torque, dt) -> float:
         """Send a pwm signal into the motor.
 
+        The speed is advanced with the exact solution over dt for a constant
+        power and torque, so the update is stable for any dt.
+
         Args:
             power (float): Percentage duty cycle sent to motor [-100, 100].
-            torque (float): The current torque on the motor (Nm).
+            torque (float): Load torque opposing forward rotation (Nm).
             dt (float): Time passed since last update (s).
         """
-        # Calculate normal rpm from power and bound it by the torque
-        self.encoder += self.ang_vel * dt * self.config['encoder_degrees']
-        print("----- MOTOR ENCODER -----",self.encoder)
-        rpm = min(self.config['rpm_power_a'] * power, self.config['rpm_torque_a'] + self.config['rpm_torque_b'] * torque)
+        self.power = power
+        if dt <= 0:
+            # Nothing moves in no time, and the acceleration is kept rather
+            # than divided by zero
+            return dt
+        if dt != self.decay_dt:
+            self.decay_dt = dt
+            self.decay = math.exp(-dt / self.time_constant) if self.time_constant > 0 else 0.0
 
-        self.ang_vel = rpm * 6.0
+        # Speed the motor would settle to at this power and load
+        drive = min(max(self.dps_per_power * power, -self.dps_max), self.dps_max) - torque * self.dps_per_torque
+        ang_vel = self.ang_vel
+
+        # Friction opposes the motion, or holds a stopped motor which isn't
+        # driven hard enough to overcome it
+        if ang_vel == 0 and abs(drive) <= self.friction:
+            new_vel = 0.0
+        else:
+            friction = self.friction if (ang_vel if ang_vel != 0 else drive) > 0 else -self.friction
+            steady = drive - friction
+            new_vel = steady + (ang_vel - steady) * self.decay
+            if ang_vel != 0 and (new_vel > 0) != (ang_vel > 0):
+                if abs(drive) <= self.friction:
+                    # Stopped by friction part way through the tick, and held
+                    new_vel = 0.0
+                else:
+                    # Through zero part way through the tick, then driven the
+                    # other way against friction for the rest of it
+                    new_vel = reverse(ang_vel, steady, drive - math.copysign(self.friction, drive), self.time_constant, dt)
+
+        self.ang_acc = (new_vel - ang_vel) / dt
+        self.ang_vel = new_vel
+        self.encoder += (ang_vel + new_vel) * 0.5 * dt * self.encoder_degrees
 
         return dt
 
+    def saveState(self, buffer, index) -> int:
+        """Write the STATE into a buffer of floats.
+
+        Args:
+            buffer (array.array): The buffer.
+            index (int): Index of the buffer to start at.
+
+        Returns:
+            int: Index after the state.
+        """
+        buffer[index] = self.encoder
+        buffer[index + 1] = self.ang_vel
+        buffer[index + 2] = self.ang_acc
+        buffer[index + 3] = self.power
+        return index + 4
+
+    def loadState(self, buffer, index) -> int:
+        """Read the STATE back from a buffer written by saveState.
+
+        Returns:
+            int: Index after the state.
+        """
+        self.encoder, self.ang_vel, self.ang_acc, self.power = buffer[index:index + 4]
+        return index + 4
+
     def getEncoder(self) -> int:
         """Get the encoder value for the motor.
 
@@ -0,0 +1,221 @@
+"""Closed loop control of a virtual motor, as run by the BrickPi3 firmware.
+
+A MotorController sits between the commands sent to a motor port and the
+motor.Motor on it. Like the firmware it runs the motor in one of four modes:
+floating, a fixed power, position control (a PID on the encoder position with
+the derivative taken on the measured speed) or speed control (a feedforward of
+the target speed plus a proportional correction). Power and speed limits clamp
+the power sent to the motor in every mode.
+
+The gains are scaled once when they are set rather than every tick, and the
+update only does float arithmetic on attributes, so stepping a controller
+allocates nothing beyond the floats themselves.
+"""
+
+# Motor power which floats the motor
+MOTOR_FLOAT = -128
+
+# Modes a motor port can be in
+MODE_FLOAT = 0
+MODE_POWER = 1
+MODE_POSITION = 2
+MODE_DPS = 3
+
+# Default gains of the firmware
+DEFAULT_KP = 25
+DEFAULT_KD = 70
+DEFAULT_KI = 0
+
+# Power (%) per degree of position error for each unit of kp, so the default kp
+# of 25 gives the 2 %/degree of the earlier proportional controller
+KP_SCALE = 2.0 / 25.0
+
+# Power (%) per degree / s of speed for each unit of kd
+KD_SCALE = 1.0 / 7000.0
+
+# Power (%) per degree s of accumulated position error for each unit of ki
+KI_SCALE = 2.0 / 25.0
+
+# Power (%) per degree / s of speed error in speed control
+DPS_KP = 0.05
+
+# Position error (degrees) within which a motor is not flagged as overloaded
+POSITION_TOLERANCE = 5
+
+# Status flags
+FLAG_LOW_VOLTAGE_FLOAT = 0x01
+FLAG_OVERLOADED = 0x02
+
+class MotorController:
+    # Commands and gains, in the order they are saved
+    STATE = ("mode", "power", "target", "dps", "offset", "integral",
+             "kp", "kd", "ki", "power_limit", "dps_limit")
+
+    __slots__ = STATE + ("motor", "dps_per_power", "gain_p", "gain_d", "gain_i", "limit")
+
+    def __init__(self, motor, kp=DEFAULT_KP, kd=DEFAULT_KD, ki=DEFAULT_KI):
+        """Control a motor.
+
+        Args:
+            motor (motor.Motor): The motor to drive.
+            kp (float, optional): Position proportional gain. Defaults to DEFAULT_KP.
+            kd (float, optional): Position derivative gain. Defaults to DEFAULT_KD.
+            ki (float, optional): Position integral gain, which the BrickPi3 leaves at 0. Defaults to DEFAULT_KI.
+        """
+        self.motor = motor
+        self.mode = MODE_FLOAT
+        self.power = 0.0    # Power (%) in power mode
+        self.target = 0     # Target encoder position (degrees) in position mode
+        self.dps = 0.0      # Target speed (degrees / s) in speed mode
+        self.offset = 0     # Encoder offset (degrees)
+        self.integral = 0.0
+
+        # Speed (degrees / s) for each % of power, for the feedforward and the
+        # speed limit
+        self.dps_per_power = motor.dps_per_power
+
+        self.power_limit = 0
+        self.dps_limit = 0
+        self.limit = 100.0
+
+        self.set_kp(kp)
+        self.set_kd(kd)
+        self.set_ki(ki)
+
+    def set_power(self, power):
+        """Drive at a power (%), or float with MOTOR_FLOAT."""
+        if power == MOTOR_FLOAT:
+            self.mode = MODE_FLOAT
+        else:
+            self.mode = MODE_POWER
+            self.power = min(max(power, -100.0), 100.0)
+
+    def set_position(self, position):
+        """Hold a position (degrees, relative to the offset)."""
+        if self.mode != MODE_POSITION:
+            self.integral = 0.0
+        self.mode = MODE_POSITION
+        self.target = round(position) + self.offset
+
+    def set_position_relative(self, degrees):
+        """Hold a position relative to the current one (degrees)."""
+        self.set_position(self.get_encoder() + degrees)
+
+    def set_dps(self, dps):
+        """Run at a speed (degrees / s)."""
+        self.mode = MODE_DPS
+        self.dps = dps
+
+    def set_kp(self, kp):
+        self.kp = kp
+        self.gain_p = kp * KP_SCALE
+
+    def set_kd(self, kd):
+        self.kd = kd
+        self.gain_d = kd * KD_SCALE
+
+    def set_ki(self, ki):
+        self.ki = ki
+        self.gain_i = ki * KI_SCALE
+
+    def set_limits(self, power=0, dps=0):
+        """Limit the power (%) and speed (degrees / s), 0 for no limit."""
+        self.power_limit = power
+        self.dps_limit = dps
+        limit = 100.0
+        if power:
+            limit = min(limit, power)
+        if dps:
+            limit = min(limit, dps / self.dps_per_power)
+        self.limit = limit
+
+    def offset_encoder(self, position):
+        self.offset += position
+
+    def reset_encoder(self):
+        self.offset = round(self.motor.encoder)
+
+    def get_encoder(self) -> int:
+        """Encoder position (degrees) relative to the offset."""
+        return round(self.motor.encoder) - self.offset
+
+    def get_error(self) -> int:
+        """Position error (degrees) in position mode."""
+        return self.target - round(self.motor.encoder)
+
+    def flags(self) -> int:
+        if self.mode == MODE_POSITION and abs(self.get_error()) > POSITION_TOLERANCE:
+            return FLAG_OVERLOADED
+        if self.mode == MODE_DPS and abs(self.dps - self.motor.ang_vel) > POSITION_TOLERANCE * self.dps_per_power:
+            return FLAG_OVERLOADED
+        return 0
+
+    def get_status(self) -> list:
+        """Status of the motor, as the BrickPi3 reports it.
+
+        Returns:
+            list: Flags, power (%), encoder (degrees) and speed (degrees / s).
+        """
+        return [self.flags(), round(self.motor.power), self.get_encoder(), round(self.motor.getVelocity())]
+
+    def saveState(self, buffer, index) -> int:
+        """Write the STATE, then the motor's, into a buffer of floats.
+
+        Args:
+            buffer (array.array): The buffer.
+            index (int): Index of the buffer to start at.
+
+        Returns:
+            int: Index after the state.
+        """
+        values = (self.mode, self.power, self.target, self.dps, self.offset, self.integral,
+                  self.kp, self.kd, self.ki, self.power_limit, self.dps_limit)
+        for i, value in enumerate(values, index):
+            buffer[i] = value
+        return self.motor.saveState(buffer, index + 11)
+
+    def loadState(self, buffer, index) -> int:
+        """Read the state back from a buffer written by saveState.
+
+        Returns:
+            int: Index after the state.
+        """
+        mode, self.power, target, self.dps, offset, self.integral, kp, kd, ki, power_limit, dps_limit = buffer[index:index + 11]
+        # Integers in the firmware, which the buffer holds exactly as floats
+        self.mode = int(mode)
+        self.target = int(target)
+        self.offset = int(offset)
+        self.set_kp(kp)
+        self.set_kd(kd)
+        self.set_ki(ki)
+        self.set_limits(power_limit, dps_limit)
+        return self.motor.loadState(buffer, index + 11)
+
+    def update(self, dt, torque=0.0):
+        """Run the controller for a tick and step the motor.
+
+        Args:
+            dt (float): Delta time (s).
+            torque (float, optional): Load torque on the motor (Nm). Defaults to 0.0.
+        """
+        limit = self.limit
+        mode = self.mode
+        if mode == MODE_POSITION:
+            error = self.target - round(self.motor.encoder)
+            power = error * self.gain_p - self.motor.ang_vel * self.gain_d
+            if self.gain_i:
+                # Clamped so a long saturated move can't wind the integral up
+                integral = self.integral + error * self.gain_i * dt
+                self.integral = integral = min(max(integral, -limit), limit)
+                power += integral
+        elif mode == MODE_DPS:
+            dps = self.dps
+            if self.dps_limit:
+                dps = min(max(dps, -self.dps_limit), self.dps_limit)
+            power = dps / self.dps_per_power + (dps - self.motor.ang_vel) * DPS_KP
+        elif mode == MODE_POWER:
+            power = self.power
+        else:
+            power = 0.0
+
+        self.motor.update(min(max(power, -limit), limit), torque, dt)
@@ -0,0 +1,172 @@
+"""Virtual sensors on the robot's sensor ports.
+
+A Sensor is mounted at an offset from the centre of the wheels, facing at an
+angle to the robot's heading, and reads the robot's world (see world.World)
+by casting rays from there against the walls and the other robots' footprints.
+The rays of a read are cast together, as arrays of every ray against every
+nearby obstacle, rather than one ray and one wall at a time:
+
+- ULTRASONIC casts a fan of rays across its beam, and reads the distance to
+  the nearest hit, or ULTRASONIC_MAX with nothing in range, as the EV3's does.
+- LIGHT casts one ray from its LED, and reads more reflected light the nearer
+  the obstacle it hits, falling to 0 at its range.
+- TOUCH casts one ray the length of its plunger, and reads 1 if it hits.
+
+A robot outside any world senses nothing. Each sensor keeps its last reading
+with the simulation time it was taken at, so reading it again within the same
+tick costs nothing.
+"""
+import math
+
+import numpy as np
+
+import hardware.hardwareInterface as hw
+
+# Reading (cm) of the ultrasonic sensor with nothing in range
+ULTRASONIC_MAX = 255.0
+
+# Half the width (degrees) of the ultrasonic sensor's beam, and the number of
+# rays cast across it
+ULTRASONIC_CONE = 15.0
+ULTRASONIC_RAYS = 7
+
+# Range (m) of each type when the config doesn't give one
+RANGES = {
+    hw.SENSOR_TYPES.TOUCH: 0.005,
+    hw.SENSOR_TYPES.ULTRASONIC: ULTRASONIC_MAX / 100.0,
+    hw.SENSOR_TYPES.LIGHT: 0.1,
+}
+
+def castRays(x, y, directions, walls, centres, radii) -> np.ndarray:
+    """Distance along each of several rays from one point to the first wall
+    or circle it hits.
+
+    Args:
+        x (float): x of the start of the rays (m).
+        y (float): y of the start of the rays (m).
+        directions (np.ndarray): (k, 2) unit vectors along the rays.
+        walls (np.ndarray): (m, 4) walls, x1, y1, x2 and y2 (m).
+        centres (np.ndarray): (c, 2) centres of circles (m).
+        radii (np.ndarray): (c,) radii of the circles (m).
+
+    Returns:
+        np.ndarray: (k,) distance (m) along each ray, inf for a ray which hits nothing.
+    """
+    distances = np.full(len(directions), np.inf)
+    dx = directions[:, 0:1]
+    dy = directions[:, 1:2]
+
+    if len(walls):
+        # Solve start + t * direction = wall start + u * wall for every ray
+        # (rows) and wall (columns) at once
+        sx = (walls[:, 2] - walls[:, 0])[None, :]
+        sy = (walls[:, 3] - walls[:, 1])[None, :]
+        px = (walls[:, 0] - x)[None, :]
+        py = (walls[:, 1] - y)[None, :]
+        denominator = dx * sy - dy * sx
+        parallel = denominator == 0
+        denominator = np.where(parallel, 1.0, denominator)
+        t = (px * sy - py * sx) / denominator
+        u = (px * dy - py * dx) / denominator
+        hits = np.where(~parallel & (t >= 0) & (u >= 0) & (u <= 1), t, np.inf)
+        distances = np.minimum(distances, hits.min(axis=1))
+
+    if len(centres):
+        cx = (centres[:, 0] - x)[None, :]
+        cy = (centres[:, 1] - y)[None, :]
+        along = cx * dx + cy * dy
+        # Squared half chord of each circle the ray's line crosses
+        chord = radii[None, :] ** 2 - (cx * cx + cy * cy - along * along)
+        half = np.sqrt(np.maximum(chord, 0.0))
+        # A ray starting inside a circle hits it straight away
+        hits = np.where((chord >= 0) & (along + half >= 0), np.maximum(along - half, 0.0), np.inf)
+        distances = np.minimum(distances, hits.min(axis=1))
+    return distances
+
+class Sensor:
+    __slots__ = ("type", "forward", "left", "angle", "range", "configured_range", "bearings", "time", "value")
+
+    def __init__(self, sensor_type, forward=0.0, left=0.0, angle=0.0, range=0.0):
+        """Mount a sensor on the robot.
+
+        Args:
+            sensor_type (hw.SENSOR_TYPES): What the sensor reads.
+            forward (float, optional): Distance ahead of the centre of the wheels (m). Defaults to 0.0.
+            left (float, optional): Distance to the left of the centre of the wheels (m). Defaults to 0.0.
+            angle (float, optional): Direction it faces (degrees clockwise from the robot's heading). Defaults to 0.0.
+            range (float, optional): Furthest it senses (m). Defaults to 0.0, the RANGES of its type.
+        """
+        self.forward = forward
+        self.left = left
+        self.angle = angle
+        self.configured_range = range
+        self.set_type(sensor_type)
+
+    @classmethod
+    def fromConfig(cls, config):
+        """Mount the sensor of a [[sensors]] entry.
+
+        Args:
+            config (robotConfig.SensorConfig): The entry.
+        """
+        return cls(config.type, config.forward, config.left, config.angle, config.range)
+
+    def set_type(self, sensor_type):
+        self.type = hw.SENSOR_TYPES(sensor_type)
+        self.range = self.configured_range or RANGES.get(self.type, 0.0)
+        # Direction of each ray relative to the way the sensor faces
+        if self.type == hw.SENSOR_TYPES.ULTRASONIC:
+            self.bearings = np.linspace(-ULTRASONIC_CONE, ULTRASONIC_CONE, ULTRASONIC_RAYS)
+        else:
+            self.bearings = np.zeros(1)
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget the last reading, such as after the robot is moved without a tick."""
+        self.time = None
+        self.value = None
+
+    def read(self, robot) -> float:
+        """Read the sensor, as described by hw.SENSOR_TYPES.
+
+        Args:
+            robot (VirtualRobot): The robot it is mounted on.
+
+        Raises:
+            hw.SensorError: If the sensor's type is NONE.
+        """
+        if self.time == robot.time:
+            return self.value
+        if self.type == hw.SENSOR_TYPES.NONE:
+            raise hw.SensorError("Sensor type is NONE")
+
+        distance = self.__cast(robot)
+        if self.type == hw.SENSOR_TYPES.TOUCH:
+            value = 1 if distance <= self.range else 0
+        elif self.type == hw.SENSOR_TYPES.ULTRASONIC:
+            # The EV3's reports to the nearest millimetre
+            value = round(distance * 100.0, 1) if distance <= self.range else ULTRASONIC_MAX
+        else:
+            value = 100.0 * max(1.0 - distance / self.range, 0.0)
+
+        self.time = robot.time
+        self.value = value
+        return value
+
+    def __cast(self, robot) -> float:
+        """Distance (m) to the nearest obstacle along the sensor's rays, inf if there are none in range."""
+        world = robot.world
+        if world is None:
+            return math.inf
+
+        heading = math.radians(robot.orientation)
+        x = robot.x + self.forward * math.sin(heading) - self.left * math.cos(heading)
+        y = robot.y + self.forward * math.cos(heading) + self.left * math.sin(heading)
+
+        walls, centres, radii = world.obstacles(x - self.range, y - self.range, x + self.range, y + self.range, robot)
+        if not len(walls) and not len(centres):
+            return math.inf
+
+        bearings = np.radians(robot.orientation + self.angle + self.bearings)
+        directions = np.stack((np.sin(bearings), np.cos(bearings)), axis=1)
+        return float(castRays(x, y, directions, walls, centres, radii).min())
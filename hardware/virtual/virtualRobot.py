@@ -1,150 +1,210 @@
-import toml
-import sys
-import numpy as np
-
+import math
+import array
+import logging
+import dataclasses
 
 import hardware.virtual.motor as motor
+import hardware.virtual.motorController as mc
+import hardware.virtual.integrators as integrators
 import hardware.hardwareInterface as hw
 
-import common as cm
-from common import Enumeration
-
-import graphics.robotGraphics as robGraphics
-import graphics.graphics as gp
+log = logging.getLogger(__name__)
 
-MOTOR_STATUS = Enumeration("""
-    POWER_GOAL,
-    POSITION_GOAL,
-    HOLD,
-    IDLE,
-""")
+class VirtualRobot:
+    # Pose and clock, saved ahead of each wheel's controller and motor
+    STATE = ("x", "y", "orientation", "time")
 
-WHEEL = Enumeration("""
-    RIGHT,
-    LEFT,
-    NONE,
-""")
+    # Length of a snapshot
+    STATE_SIZE = len(STATE) + 2 * (len(mc.MotorController.STATE) + len(motor.Motor.STATE))
 
-# Minimal difference between wheel velocities for the robot to be considered as
-# 'moving forward'.
-VEL_DIFF_MIN = 0.0001
+    __slots__ = STATE + ("config", "fullConfig", "integrate", "telemetry", "recorder", "renderer",
+                         "left_motor", "right_motor", "left_controller", "right_controller", "controllers",
+                         "wheelWidth", "wheel_slip_vel", "wheel_slip_acc", "rim", "world", "sensors",
+                         "vel_left", "vel_right")
 
-# Difference in encoder position and target to consider a move done
-POSITION_CONTROL_REACHED = 1
+    def __init__(self, config, telemetry=None, recorder=None):
+        """Simulate the robot.
 
-class VirtualRobot:
-    def __init__(self):
-        print("Initialising Virtual Robot")
+        Args:
+            config (robotConfig.Config): The robot config.
+            telemetry (telemetry.Telemetry, optional): Streams selected signals each tick. Defaults to None.
+            recorder (recorder.TrajectoryRecorder, optional): Records every tick. Defaults to None.
+        """
+        log.info("Initialising Virtual Robot")
         # Virtual robot will need some values from the physical robot, i.e. 
         # weight, wheelbase, etc
-        with open("robot_config.toml") as stream:
-            try:
-                self.config = toml.load(stream)['robot']
-                print(self.config)
-            except toml.TomlDecodeError as err:
-                print(err)
-                sys.exit(-1)
-
-        self.x = 0
-        self.y = 0
-        self.orientation = 0
-
-        window = gp.GraphWin("VirtualTandem", 800, 800)
-        window.setCoords(-3, -3, 3, 3)
-
-        self.graphics = robGraphics.RobotGraphics(window, self.config['inner_wheel_base'], self.config['wheel_radius'], (self.config['outer_wheel_base'] - self.config['inner_wheel_base']) / 2)
-        self.graphics.updateRobot(self.x, self.y, self.orientation)
-
-        self.left_motor = motor.Motor("LegoMotor")
-        self.right_motor = motor.Motor("LegoMotor")
-        self.left_motor_status = (MOTOR_STATUS.HOLD, 0)
-        self.right_motor_status = (MOTOR_STATUS.HOLD, 0)
-        self.wheelWidth = np.mean([self.config['outer_wheel_base'], self.config['inner_wheel_base']])
-
-
-    def set_motor_power(self, port, power):
-        motor = self.__motorFromPort__(port)
-        match motor:
-            case WHEEL.LEFT:
-                self.left_motor_status = (MOTOR_STATUS.POWER_GOAL, power)
-            case WHEEL.RIGHT:
-                self.right_motor_status = (MOTOR_STATUS.POWER_GOAL, power)
-            case WHEEL.NONE:
-                print("Virtual Robot: Trying to set power of unattached port.")
-
-    def set_motor_position(self, port, position):
-        wheel = self.__motorFromPort__(port)
-        if wheel == WHEEL.LEFT:
-            self.left_motor_status = (MOTOR_STATUS.POSITION_GOAL, position)
-        else:
-            self.right_motor_status = (MOTOR_STATUS.POSITION_GOAL,  position)
-
-    def updateMotor(self, motor: motor.Motor, status, dt: float) -> bool:
-        """Update a motor depending on its status. 
-
-        Args:
-            motor (motor.Motor): The motor.
-            status (_type_): The motor status.
+        self.config = config.robot
+        self.fullConfig = config
+        log.debug("%s", self.config)
+
+        # Starting at the start pose of the [world] config
+        self.x, self.y, self.orientation = (float(value) for value in config.world.start)
+        self.time = 0.0
+
+        # Kinematics integrator, from the [simulation] config
+        self.integrate = integrators.getIntegrator(config.simulation.integrator, config.simulation.tolerance)
+
+        # Selected signals are streamed here each tick, None when disabled
+        self.telemetry = telemetry
+        # Every tick is recorded here, None when disabled
+        self.recorder = recorder
+
+        # Headless robots never open a window, so the graphics (and Tk) are
+        # only imported when drawing. The window is redrawn at its own frame
+        # rate from the latest published pose rather than every tick.
+        self.renderer = None
+        if not config.headless:
+            import graphics.renderer as renderer
+
+            self.renderer = renderer.Renderer(self.config.inner_wheel_base, self.config.wheel_radius, self.config.wheel_thickness)
+
+        # Each wheel accelerates half the robot's mass at its rim, which the
+        # motor sees as extra inertia at its shaft
+        load_inertia = self.config.weight / 2.0 * self.config.wheel_radius ** 2
+        self.left_motor = motor.Motor(config.motor, load_inertia)
+        self.right_motor = motor.Motor(config.motor, load_inertia)
+        # The motors start held where they are, as the BrickPi3's do once
+        # a position is set
+        self.left_controller = mc.MotorController(self.left_motor)
+        self.right_controller = mc.MotorController(self.right_motor)
+        self.left_controller.set_position(0)
+        self.right_controller.set_position(0)
+        self.wheelWidth = self.config.wheel_width
+
+        # Controllers indexed by hw.MOTOR_PORTS, resolved once here so a port
+        # is looked up by indexing
+        controllers = [None] * 4
+        controllers[self.config.left_motor] = self.left_controller
+        controllers[self.config.right_motor] = self.right_controller
+        self.controllers = tuple(controllers)
+
+        # Fraction of the wheel's travel lost to slipping, per m/s of speed and
+        # per m/s^2 of acceleration, on the terrain being driven over
+        self.wheel_slip_vel = self.config.terrain.wheel_slip_vel
+        self.wheel_slip_acc = self.config.terrain.wheel_slip_acc
+        # Distance (m) the rim of a wheel travels per degree
+        self.rim = 2 * math.pi * self.config.wheel_radius / 360.0
+        # Linear velocity (m/s) of each wheel over the last tick
+        self.vel_left = 0.0
+        self.vel_right = 0.0
+
+        # World the robot senses, set when it is put in one
+        self.world = None
+        # Sensors indexed by hw.SENSOR_PORTS, None where there is none. The
+        # sensors need NumPy, so it is only loaded when there are some.
+        self.sensors = [None] * len(hw.SENSOR_PORTS)
+        if config.sensors:
+            import hardware.virtual.sensors as sensors
+
+            for sensor in config.sensors:
+                self.sensors[sensor.port] = sensors.Sensor.fromConfig(sensor)
+
+    def controller(self, port) -> mc.MotorController:
+        """Get the controller of the motor on a port.
 
         Returns:
-            bool: Whether or not this status can be moved into locked.
+            mc.MotorController: The controller, or None if no motor is on the port.
         """
-        match status[0]:
-            # PID Goes here in the future
-            case MOTOR_STATUS.POSITION_GOAL:
-                # Simple proportional controller
-                difference = status[1] - motor.getEncoder()
-                print("diff:", difference)
-                if abs(difference) < POSITION_CONTROL_REACHED:
-                    print("End reached")
-                    return True
-                
-                motor.update(cm.bound(difference * 2, -100, 100), 0, dt)
-
-            case MOTOR_STATUS.HOLD:
-                motor.update(0, 0, dt)
-
-            case _:
-                print("----- UNKNOWN INSTR -----")
-        return False
+        controller = self.controllers[port] if hw.validMotorPort(port) else None
+        if controller is None:
+            log.warning("No motor on port : %s", port)
+        return controller
 
     def update(self, dt):
-        print("----- UPDATING -----")
-        if self.updateMotor(self.left_motor, self.left_motor_status, dt):
-            self.left_motor_status = (MOTOR_STATUS.HOLD, 0)
-        if self.updateMotor(self.right_motor, self.right_motor_status, dt):
-            self.right_motor_status = (MOTOR_STATUS.HOLD, 0)
-
-        vel_left = self.__linear_wheel_velocity(WHEEL.LEFT)
-        vel_right = self.__linear_wheel_velocity(WHEEL.RIGHT)
-
-        dx = 0
-        dy = 0
-        do = 0
-
-        if abs(vel_left - vel_right) < VEL_DIFF_MIN:
-            dx = np.sin(np.deg2rad(self.orientation)) * dt * (vel_left + vel_right) / 2.0
-            dy = np.cos(np.deg2rad(self.orientation)) * dt * (vel_left + vel_right) / 2.0
-        else:
-            radius = self.wheelWidth * (vel_left + vel_right) / (2 * (vel_right - vel_left))
-            arc_angle = (vel_right - vel_left) * dt / self.wheelWidth
+        self.step(dt)
+        self.publish()
 
-            # Delta forward
-            df = np.sin(arc_angle) * radius
-            # Delta sideways
-            ds = radius - np.cos(arc_angle) * radius
-            
-            dx = df * np.sin(self.orientation) + ds * np.sin(270.0 + self.orientation)
-            dy = df * np.cos(self.orientation) + ds * np.cos(270.0 + self.orientation)
-            do = 90 - arc_angle
+    def step(self, dt):
+        """Advance the motors and the pose, without publishing the tick.
 
-        self.orientation += do 
-        self.x += dx
-        self.y += dy
+        A world.World steps all its robots, puts back any which collided, and
+        only then publishes each robot's tick, so nothing sees a pose which
+        was never reached.
 
-        print("virtual robot y", self.y)
+        Args:
+            dt (float): Delta time (s).
+        """
+        self.left_controller.update(dt)
+        self.right_controller.update(dt)
+
+        self.vel_left = self.__linear_wheel_velocity(self.left_motor)
+        self.vel_right = self.__linear_wheel_velocity(self.right_motor)
+
+        self.x, self.y, self.orientation = self.integrate(self.x, self.y, self.orientation, self.vel_left, self.vel_right, self.wheelWidth, dt)
+        self.time += dt
+
+    def publish(self):
+        """Send the tick's pose to the telemetry, the recorder and the window."""
+        if self.telemetry is not None:
+            self.__emitTelemetry(self.vel_left, self.vel_right)
+
+        if self.recorder is not None:
+            self.recorder.record(self.time, self.x, self.y, self.orientation,
+                                 self.left_motor.encoder, self.right_motor.encoder,
+                                 self.left_motor.power, self.right_motor.power,
+                                 self.left_controller.mode, self.right_controller.mode)
+
+        if self.renderer is not None:
+            self.renderer.publish(self.x, self.y, self.orientation)
 
-        self.graphics.updateRobot(dx, dy, do)
+    def join(self):
+        """Wait until the window is closed, if there is one."""
+        if self.renderer is not None:
+            self.renderer.join()
+
+    def snapshot(self, buffer=None) -> array.array:
+        """Save the whole state of the simulation (the pose, clock, controllers
+        and motors) into one flat buffer of STATE_SIZE floats.
+
+        The buffer can be copied with a single slice, pickled to another
+        process, and restored into this or any robot built from the same config.
+
+        Args:
+            buffer (array.array, optional): Buffer to save into, which is reused
+                rather than allocating a new one. Defaults to None.
+
+        Returns:
+            array.array: The buffer.
+        """
+        if buffer is None:
+            buffer = array.array("d", bytes(8 * self.STATE_SIZE))
+        buffer[0] = self.x
+        buffer[1] = self.y
+        buffer[2] = self.orientation
+        buffer[3] = self.time
+        index = self.left_controller.saveState(buffer, len(self.STATE))
+        self.right_controller.saveState(buffer, index)
+        return buffer
+
+    def restore(self, buffer):
+        """Restore the state saved by snapshot."""
+        self.x, self.y, self.orientation, self.time = buffer[:len(self.STATE)]
+        index = self.left_controller.loadState(buffer, len(self.STATE))
+        self.right_controller.loadState(buffer, index)
+        self.invalidateSensors()
+        if self.renderer is not None:
+            self.renderer.publish(self.x, self.y, self.orientation)
+
+    def fork(self, snapshot=None):
+        """Start a new simulation from a snapshot of this one.
+
+        The fork is headless, with no telemetry or recorder, and shares nothing
+        with this robot, so any number can be stepped and commanded on their
+        own (such as to try different gains from the same point). To fork in
+        another process, send it the config and the snapshot, which both
+        pickle, and restore the snapshot into a VirtualRobot built there.
+
+        Args:
+            snapshot (array.array, optional): Snapshot to start from. Defaults to this robot's current state.
+
+        Returns:
+            VirtualRobot: The new robot.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+        fork = VirtualRobot(dataclasses.replace(self.fullConfig, headless=True))
+        fork.restore(snapshot)
+        return fork
 
     def get_x(self) -> float:
         return self.x
@@ -162,30 +222,86 @@ class VirtualRobot:
         return self.right_motor.encoder
     
     def get_encoder(self, port) -> int:
-        if self.__motorFromPort__(port) == WHEEL.LEFT:
-            return self.get_encoder_left()
-        else:
-            return self.get_encoder_right()
+        """Get the encoder of a motor (degrees).
+
+        Raises:
+            hw.MotorError: If there is no motor on the port.
+        """
+        return self.__attached(port).get_encoder()
+
+    def get_status(self, port) -> list:
+        """Get the status of a motor, as the BrickPi3 reports it.
 
-    def __motorFromPort__(self, port):
-        if cm.config_port_to_hw(self.config['left_motor']) == port:
-            return WHEEL.LEFT
-        elif cm.config_port_to_hw(self.config['right_motor']) == port:
-            return WHEEL.RIGHT
+        Raises:
+            hw.MotorError: If there is no motor on the port.
+
+        Returns:
+            list: Flags, power (%), encoder (degrees) and speed (degrees / s).
+        """
+        return self.__attached(port).get_status()
+
+    def set_sensor_type(self, port, sensor_type):
+        """Set the type of the sensor on a port, mounting one at the centre of
+        the wheels facing forwards if the config doesn't place one there.
+
+        Raises:
+            hw.SensorError: If the port isn't a sensor port.
+        """
+        if not hw.validSensorPort(port):
+            raise hw.SensorError(f"Sensor port not valid : {port}")
+        sensor = self.sensors[port]
+        if sensor is None:
+            import hardware.virtual.sensors as sensors
+
+            self.sensors[port] = sensors.Sensor(sensor_type)
         else:
-            return WHEEL.NONE
-    
-    def __linear_wheel_velocity(self, wheel) -> float:
-        """Calculate the linear velocity of a wheel (m/s).
+            sensor.set_type(sensor_type)
+
+    def get_sensor(self, port):
+        """Read the sensor on a port, as described by hw.SENSOR_TYPES.
+
+        Raises:
+            hw.SensorError: If there is no sensor on the port.
+        """
+        sensor = self.sensors[port] if hw.validSensorPort(port) else None
+        if sensor is None:
+            raise hw.SensorError(f"No sensor on port : {port}")
+        return sensor.read(self)
+
+    def invalidateSensors(self):
+        """Forget the sensors' last readings, after the robot is moved other than by a tick."""
+        for sensor in self.sensors:
+            if sensor is not None:
+                sensor.invalidate()
+
+    def __attached(self, port) -> mc.MotorController:
+        """The controller of the motor on a port, which must have one to be read."""
+        if not hw.validMotorPort(port) or self.controllers[port] is None:
+            raise hw.MotorError(f"No motor on port : {port}")
+        return self.controllers[port]
+
+    def __emitTelemetry(self, vel_left, vel_right):
+        telemetry = self.telemetry
+        if telemetry.encoders:
+            telemetry.emit(self.time, "encoders", self.left_motor.encoder, self.right_motor.encoder)
+        if telemetry.velocities:
+            telemetry.emit(self.time, "velocities", vel_left, vel_right)
+        if telemetry.pose:
+            telemetry.emit(self.time, "pose", self.x, self.y, self.orientation)
+        if telemetry.power:
+            telemetry.emit(self.time, "power", self.left_motor.power, self.right_motor.power)
+
+    def __linear_wheel_velocity(self, motor) -> float:
+        """Calculate the linear velocity of a wheel over the ground (m/s).
 
         Args:
-            wheel (enum): The wheel to calculate for.
+            motor (motor.Motor): The motor driving the wheel.
 
         Returns:
             float: The linear velocity of the wheel (m/s).
         """
-        angularVel = self.right_motor.getVelocity() if wheel == WHEEL.RIGHT else self.left_motor.getVelocity()
-                
-        print("linear wheel vel", 2 * np.pi * self.config['wheel_radius'] * angularVel / 360.0)
+        rim = self.rim
+        vel = rim * motor.getVelocity()
 
-        return 2 * np.pi * self.config['wheel_radius'] * angularVel / 360.0
\ No newline at end of file
+        slip = self.wheel_slip_vel * abs(vel) + self.wheel_slip_acc * abs(rim * motor.ang_acc)
+        return vel * (1.0 - min(slip, 1.0))
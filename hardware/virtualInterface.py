@@ -1,11 +1,24 @@
 import hardware.hardwareInterface as hw
 import hardware.virtual.virtualRobot as vr
-import common as cm
+import hardware.virtual.motorController as mc
+import logging
+
+log = logging.getLogger(__name__)
 
 class VirtualInterface(hw.HardwareInterface):
-    def __init__(self):
-        print("[virtualInterface] Initialising")
-        self.virtualRobot = vr.VirtualRobot()
+    def __init__(self, config, telemetry=None, recorder=None):
+        log.info("Initialising")
+        self.virtualRobot = vr.VirtualRobot(config, telemetry, recorder)
+
+        # World of the robot's own, from the [world] config, which is stepped
+        # in its place. None when there is no [world], or when the robot is
+        # put in a shared world.World, which steps it instead.
+        self.world = None
+        if not config.world.empty:
+            import world as wd
+
+            self.world = wd.World.fromConfig(config.world)
+            self.world.attach(self, self.virtualRobot.x, self.virtualRobot.y, self.virtualRobot.orientation)
 
     def update(self, dt):
         """Update the underlying hardware.
@@ -15,8 +28,20 @@ class VirtualInterface(hw.HardwareInterface):
         Args:
             dt (float): Delta time (s).
         """
-        print("updating virtual robot")
-        self.virtualRobot.update(dt)
+        if self.world is not None:
+            self.world.update(dt)
+        else:
+            self.virtualRobot.update(dt)
+
+    def stop(self):
+        """Float the motors at the end of a run."""
+        for controller in self.virtualRobot.controllers:
+            if controller is not None:
+                controller.set_power(mc.MOTOR_FLOAT)
+
+    def join(self):
+        """Wait until the virtual robot's window is closed."""
+        self.virtualRobot.join()
 
     def set_motor_power(self, port, power):
         """
@@ -27,17 +52,14 @@ class VirtualInterface(hw.HardwareInterface):
         power -- The power from -100 to 100, or -128 for float
         """
 
-        if not hw.validMotorPort(port):
-            print(f"[virtualInterface]: Port not valid, port : {port}")
+        controller = self.__controller(port)
+        if controller is None:
             return
-        
-        if power == 128:
-            self.virtualRobot.set_motor_idle(port)
-        elif cm.bounded(power, -100.0, 100.0):
-            self.virtualRobot.set_motor_power(port, power)
-        else:
-            print(f"[virtualInterface]: Power exceeds limits, power : {power}")
+
+        if power != mc.MOTOR_FLOAT and not -100.0 <= power <= 100.0:
+            log.warning("Power exceeds limits, power : %s", power)
             return
+        controller.set_power(power)
 
     def set_motor_position(self, port, position):
         """
@@ -48,11 +70,19 @@ class VirtualInterface(hw.HardwareInterface):
         position -- The target position
         """
 
-        if not hw.validMotorPort(port):
-            print(f"[virtualInterface]: Port not valid, port : {port}")
-            return
-        
-        self.virtualRobot.set_motor_position(port, round(position))
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_position(position)
+
+    def set_motor_positions(self, positions):
+        """
+        Set the target positions of several motors together, so they all take effect in the same tick
+
+        Keyword arguments:
+        positions -- Dictionary of motor port to target position in degrees
+        """
+        for port, position in positions.items():
+            self.set_motor_position(port, position)
 
     def set_motor_position_relative(self, port, degrees): 
         """
@@ -62,7 +92,9 @@ class VirtualInterface(hw.HardwareInterface):
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         degrees -- The relative target position in degrees
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_position_relative(degrees)
 
     def set_motor_position_kp(self, port, kp = 25):
         """
@@ -76,7 +108,9 @@ class VirtualInterface(hw.HardwareInterface):
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         kp -- The KP constant (default 25)
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_kp(kp)
 
     def set_motor_position_kd(self, port, kd = 70):
         """
@@ -90,7 +124,9 @@ class VirtualInterface(hw.HardwareInterface):
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         kd -- The KD constant (default 70)
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_kd(kd)
 
     def set_motor_dps(self, port, dps):
         """
@@ -100,7 +136,9 @@ class VirtualInterface(hw.HardwareInterface):
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         dps -- The target speed in degrees per second
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_dps(dps)
 
 
     def set_motor_limits(self, port, power = 0, dps = 0):
@@ -112,7 +150,9 @@ class VirtualInterface(hw.HardwareInterface):
         power -- The power limit in percent (0 to 100), with 0 being no limit (100)
         dps -- The speed limit in degrees per second, with 0 being no limit
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.set_limits(power, dps)
 
     def get_motor_status(self, port):
         """
@@ -128,8 +168,21 @@ class VirtualInterface(hw.HardwareInterface):
             power -- the raw PWM power in percent (-100 to 100)
             encoder -- The encoder position
             dps -- The current speed in Degrees Per Second
+
+        Raises MotorError if there is no motor on the port.
         """
-        raise "Method not defined"
+        return self.virtualRobot.get_status(port)
+
+    def get_motor_statuses(self, ports):
+        """
+        Read the status of several motors together
+
+        Keyword arguments:
+        ports -- The motor ports to read. PORT_A, PORT_B, PORT_C, and/or PORT_D.
+
+        Returns a list with the status of each port in the order given, as get_motor_status
+        """
+        return [self.virtualRobot.get_status(port) for port in ports]
 
     def get_motor_encoder(self, port):
         """
@@ -138,10 +191,21 @@ class VirtualInterface(hw.HardwareInterface):
         Keyword arguments:
         port -- The motor port (one at a time). PORT_A, PORT_B, PORT_C, or PORT_D.
 
-        Returns the encoder position in degrees
+        Returns the encoder position in degrees. Raises MotorError if there is no motor on the port.
         """
         return self.virtualRobot.get_encoder(port)
 
+    def get_motor_encoders(self, ports):
+        """
+        Read several motor encoders in degrees together
+
+        Keyword arguments:
+        ports -- The motor ports to read. PORT_A, PORT_B, PORT_C, and/or PORT_D.
+
+        Returns a list with the encoder position of each port in the order given
+        """
+        return [self.virtualRobot.get_encoder(port) for port in ports]
+
 
     def offset_motor_encoder(self, port, position):
         """
@@ -153,7 +217,9 @@ class VirtualInterface(hw.HardwareInterface):
 
         You can zero the encoder by offsetting it by the current position
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.offset_encoder(position)
 
 
     def reset_motor_encoder(self, port):
@@ -163,4 +229,38 @@ class VirtualInterface(hw.HardwareInterface):
         Keyword arguments:
         port -- The motor port(s). PORT_A, PORT_B, PORT_C, and/or PORT_D.
         """
-        raise "Method not defined"
+        controller = self.__controller(port)
+        if controller is not None:
+            controller.reset_encoder()
+
+    def set_sensor_type(self, port, sensor_type):
+        """
+        Set the type of the sensor on a port
+
+        Keyword arguments:
+        port -- The sensor port (one at a time). PORT_1, PORT_2, PORT_3, or PORT_4.
+        sensor_type -- The sensor type, one of SENSOR_TYPES
+        """
+        if not hw.validSensorPort(port):
+            log.warning("Sensor port not valid, port : %s", port)
+            return
+        self.virtualRobot.set_sensor_type(port, sensor_type)
+
+    def get_sensor(self, port):
+        """
+        Read a sensor
+
+        Keyword arguments:
+        port -- The sensor port (one at a time). PORT_1, PORT_2, PORT_3, or PORT_4.
+
+        Returns the value of the sensor, as described by SENSOR_TYPES. Raises SensorError if the port has no sensor type set.
+        """
+        if not hw.validSensorPort(port):
+            raise hw.SensorError(f"Sensor port not valid, port : {port}")
+        return self.virtualRobot.get_sensor(port)
+
+    def __controller(self, port):
+        if not hw.validMotorPort(port):
+            log.warning("Port not valid, port : %s", port)
+            return None
+        return self.virtualRobot.controller(port)
@@ -0,0 +1,136 @@
+"""Velocity profiles for the moves of the wheels.
+
+Rather than stepping a wheel's target straight to the end of a move, which
+saturates the motor and overshoots, a profile ramps the target along with a
+limited speed and acceleration (trapezoid), and optionally a limited jerk
+(scurve). A profile is computed once when a move starts, as the fraction of
+the move done at each control tick, so each tick of the move only indexes it.
+Both wheels of a move follow the same profile scaled by their own distance,
+keeping the ratio between them (and so the curve driven) throughout.
+"""
+import array
+import math
+
+def trapezoid(distance, max_vel, max_acc, dt) -> array.array:
+    """Accelerate at max_acc up to max_vel, cruise, and decelerate to a stop,
+    or accelerate then decelerate if the move is too short to reach max_vel.
+
+    Args:
+        distance (float): Length of the move (degrees), at least 0.
+        max_vel (float): Largest speed (degrees / s).
+        max_acc (float): Largest acceleration (degrees / s^2).
+        dt (float): Control tick (s).
+
+    Returns:
+        array.array: Fraction of the move done at each tick, ending with 1.0.
+    """
+    if max_vel <= 0 or max_acc <= 0:
+        raise ValueError(f"Speed and acceleration of a profile should be positive, not {max_vel} and {max_acc}")
+    if distance <= 0:
+        return array.array("d", [1.0])
+
+    ramp = max_vel / max_acc
+    if max_acc * ramp * ramp >= distance:
+        # Never reaches max_vel
+        ramp = math.sqrt(distance / max_acc)
+        max_vel = max_acc * ramp
+    cruise = (distance - max_acc * ramp * ramp) / max_vel
+    duration = 2 * ramp + cruise
+
+    fractions = array.array("d")
+    for tick in range(1, math.ceil(duration / dt - 1e-9) + 1):
+        t = min(tick * dt, duration)
+        if t < ramp:
+            done = 0.5 * max_acc * t * t
+        elif t < ramp + cruise:
+            done = 0.5 * max_acc * ramp * ramp + max_vel * (t - ramp)
+        else:
+            left = duration - t
+            done = distance - 0.5 * max_acc * left * left
+        fractions.append(done / distance)
+    fractions[-1] = 1.0
+    return fractions
+
+def sCurve(distance, max_vel, max_acc, max_jerk, dt) -> array.array:
+    """A trapezoid with the acceleration ramped in and out at max_jerk.
+
+    The trapezoid's progress is averaged over a window of max_acc / max_jerk,
+    which turns each step in its acceleration into a ramp over the window
+    while keeping the distance, speed and acceleration, and lengthens the move
+    by the window.
+
+    Args:
+        distance (float): Length of the move (degrees), at least 0.
+        max_vel (float): Largest speed (degrees / s).
+        max_acc (float): Largest acceleration (degrees / s^2).
+        max_jerk (float): Largest jerk (degrees / s^3).
+        dt (float): Control tick (s).
+
+    Returns:
+        array.array: Fraction of the move done at each tick, ending with 1.0.
+    """
+    if max_jerk <= 0:
+        raise ValueError(f"Jerk of a profile should be positive, not {max_jerk}")
+    fractions = trapezoid(distance, max_vel, max_acc, dt)
+    window = max(1, round(max_acc / max_jerk / dt))
+    if window == 1 or distance <= 0:
+        return fractions
+
+    # Running mean of the trapezoid, which is 0 before it starts and 1 once
+    # it has finished
+    smoothed = array.array("d")
+    total = 0.0
+    for tick in range(len(fractions) + window - 1):
+        total += fractions[tick] if tick < len(fractions) else 1.0
+        if tick >= window:
+            total -= fractions[tick - window] if tick - window < len(fractions) else 1.0
+        smoothed.append(total / window)
+    smoothed[-1] = 1.0
+    return smoothed
+
+PROFILES = ("step", "trapezoid", "scurve")
+
+def validate(name, power, acceleration, jerk):
+    """Check the motion settings of a move, from the [motion] config or a command.
+
+    Args:
+        name (str): Profile, one of PROFILES.
+        power (float): Fraction of full power, above 0 and at most 1.
+        acceleration (float): Largest acceleration (m/s^2), above 0.
+        jerk (float): Largest jerk (m/s^3), above 0.
+
+    Raises:
+        ValueError: Naming the first setting which is invalid.
+    """
+    if name not in PROFILES:
+        raise ValueError(f"Unknown motion profile : {name!r}")
+    for key, value in (("power", power), ("acceleration", acceleration), ("jerk", jerk)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} should be a number, not {value!r}")
+    if not 0 < power <= 1:
+        raise ValueError(f"power should be above 0 and at most 1, not {power}")
+    if acceleration <= 0 or jerk <= 0:
+        raise ValueError(f"acceleration and jerk should be positive, not {acceleration} and {jerk}")
+
+def getProfile(name, distance, max_vel, max_acc, max_jerk, dt):
+    """Compute a named profile.
+
+    Args:
+        name (str): One of PROFILES.
+        distance (float): Length of the move (degrees).
+        max_vel (float): Largest speed (degrees / s).
+        max_acc (float): Largest acceleration (degrees / s^2).
+        max_jerk (float): Largest jerk (degrees / s^3), for scurve.
+        dt (float): Control tick (s).
+
+    Returns:
+        array.array: Fraction of the move done at each tick, or None for a
+            step straight to the target.
+    """
+    if name == "step":
+        return None
+    if name == "trapezoid":
+        return trapezoid(abs(distance), max_vel, max_acc, dt)
+    if name == "scurve":
+        return sCurve(abs(distance), max_vel, max_acc, max_jerk, dt)
+    raise ValueError(f"Unknown motion profile : {name!r}")
@@ -0,0 +1,166 @@
+"""Pose estimation from the wheel encoders.
+
+Odometry dead reckons the robot's pose from the encoder readings of any
+HardwareInterface, physical or virtual, updated once per control tick. Each
+update treats the wheels' travel since the last one as a circular arc, as
+integrators.arc does for the simulation, so the estimate doesn't depend on
+the tick rate. The pose follows the simulator's convention, x and y in metres
+and the orientation as a heading in degrees clockwise from the y axis.
+
+integrate does the same for whole arrays of encoder readings at once, to
+reprocess logs offline. Run on a recording, this compares the estimate with
+the simulated pose, which shows the drift wheel slip causes:
+
+    python odometry.py trajectory
+"""
+import math
+
+# Smallest difference in the travel of the wheels (m) over an update for the
+# robot to be considered turning
+TRAVEL_DIFF_MIN = 1e-9
+
+class Odometry:
+    __slots__ = ("rim", "width", "encoder_left", "encoder_right", "x", "y", "orientation")
+
+    def __init__(self, wheel_radius, wheel_width):
+        """Estimate the pose of a robot from its encoders.
+
+        Args:
+            wheel_radius (float): Wheel radius (m).
+            wheel_width (float): Distance between the centres of the wheels (m).
+        """
+        # Distance (m) the rim of a wheel travels per degree
+        self.rim = 2 * math.pi * wheel_radius / 360.0
+        self.width = wheel_width
+        self.reset(0, 0)
+
+    @classmethod
+    def fromConfig(cls, config):
+        """Build the odometry of the robot described by the [robot] config.
+
+        Args:
+            config (robotConfig.BodyConfig): The [robot] config.
+        """
+        return cls(config.wheel_radius, config.wheel_width)
+
+    def reset(self, encoder_left, encoder_right, x=0.0, y=0.0, orientation=0.0):
+        """Start estimating from a pose.
+
+        Args:
+            encoder_left (float): Left encoder at the pose (degrees).
+            encoder_right (float): Right encoder at the pose (degrees).
+            x (float, optional): Defaults to 0.0.
+            y (float, optional): Defaults to 0.0.
+            orientation (float, optional): Defaults to 0.0.
+        """
+        self.encoder_left = encoder_left
+        self.encoder_right = encoder_right
+        self.x = x
+        self.y = y
+        self.orientation = orientation
+
+    def update(self, encoder_left, encoder_right):
+        """Advance the pose to new encoder readings (degrees)."""
+        left = (encoder_left - self.encoder_left) * self.rim
+        right = (encoder_right - self.encoder_right) * self.rim
+        self.encoder_left = encoder_left
+        self.encoder_right = encoder_right
+
+        distance = (left + right) / 2.0
+        heading = math.radians(self.orientation)
+        if abs(left - right) < TRAVEL_DIFF_MIN:
+            self.x += math.sin(heading) * distance
+            self.y += math.cos(heading) * distance
+            return
+
+        # Angle turned anticlockwise around the centre of the arc, and the
+        # travel forward and sideways (to the left)
+        arc_angle = (right - left) / self.width
+        forward = math.sin(arc_angle) / arc_angle * distance
+        side = (1.0 - math.cos(arc_angle)) / arc_angle * distance
+
+        self.x += forward * math.sin(heading) - side * math.cos(heading)
+        self.y += forward * math.cos(heading) + side * math.sin(heading)
+        self.orientation -= math.degrees(arc_angle)
+
+    def poll(self, interface, ports):
+        """Read the encoders of a HardwareInterface and advance the pose.
+
+        Args:
+            interface (hw.HardwareInterface): The hardware.
+            ports (tuple): Left and right motor ports.
+        """
+        encoder_left, encoder_right = interface.get_motor_encoders(ports)
+        self.update(encoder_left, encoder_right)
+
+    def pose(self) -> tuple:
+        return self.x, self.y, self.orientation
+
+def integrate(encoder_left, encoder_right, wheel_radius, wheel_width, x=0.0, y=0.0, orientation=0.0) -> tuple:
+    """Estimate the pose at every reading of a log of encoders, as Odometry
+    would reading them one at a time.
+
+    Args:
+        encoder_left (np.ndarray): Left encoder readings (degrees).
+        encoder_right (np.ndarray): Right encoder readings (degrees).
+        wheel_radius (float): Wheel radius (m).
+        wheel_width (float): Distance between the centres of the wheels (m).
+        x (float, optional): x at the first reading. Defaults to 0.0.
+        y (float, optional): y at the first reading. Defaults to 0.0.
+        orientation (float, optional): Orientation at the first reading. Defaults to 0.0.
+
+    Returns:
+        tuple: x, y and orientation arrays.
+    """
+    # Only offline tools use this, so the robot itself doesn't load NumPy
+    import numpy as np
+
+    rim = 2 * np.pi * wheel_radius / 360.0
+    encoder_left = np.asarray(encoder_left, dtype=float)
+    encoder_right = np.asarray(encoder_right, dtype=float)
+    left = np.diff(encoder_left, prepend=encoder_left[:1]) * rim
+    right = np.diff(encoder_right, prepend=encoder_right[:1]) * rim
+
+    distance = (left + right) / 2.0
+    straight = np.abs(left - right) < TRAVEL_DIFF_MIN
+    arc_angle = np.where(straight, 0.0, (right - left) / wheel_width)
+    safe_angle = np.where(straight, 1.0, arc_angle)
+    forward = np.where(straight, distance, np.sin(safe_angle) / safe_angle * distance)
+    side = np.where(straight, 0.0, (1.0 - np.cos(safe_angle)) / safe_angle * distance)
+
+    # Heading after each update, and before it, which the travel is along
+    orientations = orientation - np.degrees(np.cumsum(arc_angle))
+    heading = np.radians(np.concatenate(([orientation], orientations[:-1])))
+    xs = x + np.cumsum(forward * np.sin(heading) - side * np.cos(heading))
+    ys = y + np.cumsum(forward * np.cos(heading) + side * np.sin(heading))
+    return xs, ys, orientations
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare odometry with the pose of a recorded trajectory.")
+    parser.add_argument("path", help="Directory of the recording")
+    parser.add_argument("--config", default="robot_config.toml", help="Robot config with the robot geometry")
+    args = parser.parse_args()
+
+    # Only loaded here, as the robot imports this module at startup
+    import numpy as np
+    import recorder as rc
+    import robotConfig
+
+    config = robotConfig.loadOrExit(args.config).robot
+    trajectory = rc.loadTrajectory(args.path)
+    if not len(trajectory['time']):
+        print(f"odometry: {args.path} is empty")
+        return
+
+    xs, ys, orientations = integrate(trajectory['encoder_left'], trajectory['encoder_right'], config.wheel_radius, config.wheel_width,
+                                     trajectory['x'][0], trajectory['y'][0], trajectory['orientation'][0])
+    drift = np.hypot(xs - trajectory['x'], ys - trajectory['y'])
+    print(f"odometry: Estimated ({xs[-1]:.4f}, {ys[-1]:.4f}, {orientations[-1]:.2f}), "
+          f"recorded ({trajectory['x'][-1]:.4f}, {trajectory['y'][-1]:.4f}, {trajectory['orientation'][-1]:.2f})")
+    print(f"odometry: Drift final {drift[-1] * 1000:.1f}mm, max {drift.max() * 1000:.1f}mm, "
+          f"heading {orientations[-1] - trajectory['orientation'][-1]:.2f} degrees")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Binary trajectory recording.
+
+A recording is a directory holding one .npy file per column. Ticks are written
+into a preallocated block and appended to the column files whenever it fills,
+so the recorder's memory use is fixed however long the run is. The column
+files are ordinary .npy arrays and loadTrajectory maps them read only, without
+copying them into memory.
+"""
+import os
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Recorded columns and the type each is stored as
+COLUMNS = {
+    "time": np.float64,
+    "x": np.float64,
+    "y": np.float64,
+    "orientation": np.float64,
+    "encoder_left": np.float64,
+    "encoder_right": np.float64,
+    "power_left": np.float64,
+    "power_right": np.float64,
+    "status_left": np.int8,
+    "status_right": np.int8,
+}
+
+class TrajectoryRecorder:
+    def __init__(self, path, capacity=65536):
+        """Record a trajectory into the directory at path.
+
+        Args:
+            path (str): Directory to write the column files to.
+            capacity (int, optional): Ticks held in memory between writes. Defaults to 65536.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.capacity = capacity
+
+        # One row per column, one column per tick
+        self.buffer = np.empty((len(COLUMNS), capacity))
+        self.length = 0     # Ticks held in the buffer
+        self.written = 0    # Ticks already in the column files
+
+        self.files = []
+        for name, dtype in COLUMNS.items():
+            stream = open(os.path.join(path, name + ".npy"), "wb")
+            self.__writeHeader(stream, dtype, 0)
+            self.files.append(stream)
+
+    def record(self, time, x, y, orientation, encoder_left, encoder_right, power_left, power_right, status_left, status_right):
+        """Record one tick."""
+        self.buffer[:, self.length] = (time, x, y, orientation, encoder_left, encoder_right, power_left, power_right, status_left, status_right)
+        self.length += 1
+        if self.length == self.capacity:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered ticks to the column files."""
+        for row, (stream, dtype) in enumerate(zip(self.files, COLUMNS.values())):
+            self.buffer[row, :self.length].astype(dtype).tofile(stream)
+        self.written += self.length
+        self.length = 0
+
+    def close(self):
+        """Flush the remaining ticks and write the final length into each file."""
+        self.flush()
+        for stream, dtype in zip(self.files, COLUMNS.values()):
+            stream.seek(0)
+            self.__writeHeader(stream, dtype, self.written)
+            stream.close()
+        log.info("Recorded %d ticks to %s", self.written, self.path)
+
+    def __writeHeader(self, stream, dtype, length):
+        # numpy pads the header so the shape can be rewritten in place once
+        # the final length is known
+        header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (length,)}
+        np.lib.format.write_array_header_1_0(stream, header)
+        if length and stream.tell() != self.header_size:
+            raise RuntimeError(f"Header of {stream.name} changed size")
+        self.header_size = stream.tell()
+
+def loadTrajectory(path) -> dict:
+    """Map a recorded trajectory without copying it.
+
+    Args:
+        path (str): Directory the trajectory was recorded to.
+
+    Returns:
+        dict: Column name to a read only memory mapped array.
+    """
+    return {name: np.load(os.path.join(path, name + ".npy"), mmap_mode='r') for name in COLUMNS}
+
+def fromConfig(config):
+    """Build the recorder described by the [recording] config.
+
+    Args:
+        config (robotConfig.RecordingConfig): The [recording] config.
+
+    Returns:
+        TrajectoryRecorder | None: The recorder, or None if no path is set.
+    """
+    if not config.path:
+        return None
+    log.info("Recording trajectory to %s", config.path)
+    return TrajectoryRecorder(config.path, config.buffer)
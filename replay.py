@@ -0,0 +1,131 @@
+"""Replay a recorded trajectory into the graphics window.
+
+The playhead advances with the wall clock scaled by the speed multiplier, and
+each frame draws the last recorded tick at or before it, so ticks between
+frames are skipped and a replay shows exactly what was recorded whatever the
+speed, e.g.
+
+    python replay.py recordings/run1 --speed 4
+
+While playing:
+    space       -- pause / resume
+    Left, Right -- seek back / forward by the seek step
+    Up, Down    -- double / halve the speed
+    Home        -- back to the start
+    q           -- quit
+"""
+import argparse
+import sys
+import time
+import numpy as np
+
+import recorder as rc
+import robotConfig
+import graphics.graphics as gp
+import graphics.robotGraphics as robGraphics
+
+class Replay:
+    def __init__(self, trajectory, graphics, speed=1.0, fps=30.0, seek_step=5.0):
+        """Play a trajectory into a RobotGraphics.
+
+        Args:
+            trajectory (dict): Columns from recorder.loadTrajectory.
+            graphics (robGraphics.RobotGraphics): Graphics to draw the robot with.
+            speed (float, optional): Simulated seconds played per second. Defaults to 1.0.
+            fps (float, optional): Frames drawn per second. Defaults to 30.0.
+            seek_step (float, optional): Seconds skipped by a seek key. Defaults to 5.0.
+        """
+        self.time = trajectory['time']
+        self.x = trajectory['x']
+        self.y = trajectory['y']
+        self.orientation = trajectory['orientation']
+        self.graphics = graphics
+        self.speed = speed
+        self.fps = fps
+        self.seek_step = seek_step
+
+        self.playhead = self.time[0] if len(self.time) else 0.0
+        self.paused = False
+        self.shown = -1     # Index of the tick currently drawn
+
+    def seek(self, playhead):
+        """Move the playhead, clamped to the recording (s)."""
+        self.playhead = min(max(playhead, self.time[0]), self.time[-1])
+
+    def tick(self) -> int:
+        """Index of the last recorded tick at or before the playhead."""
+        return max(int(np.searchsorted(self.time, self.playhead, side='right')) - 1, 0)
+
+    def draw(self):
+        index = self.tick()
+        if index != self.shown:
+            self.graphics.setPose(self.x[index], self.y[index], self.orientation[index])
+            self.shown = index
+
+    def handleKey(self, key) -> bool:
+        """Apply a key press.
+
+        Returns:
+            bool: Whether to keep playing.
+        """
+        match key:
+            case "space":
+                self.paused = not self.paused
+            case "Left":
+                self.seek(self.playhead - self.seek_step)
+            case "Right":
+                self.seek(self.playhead + self.seek_step)
+            case "Up":
+                self.speed *= 2
+            case "Down":
+                self.speed /= 2
+            case "Home":
+                self.seek(self.time[0])
+            case "q":
+                return False
+        return True
+
+    def play(self, window):
+        """Play until the window is closed or q is pressed."""
+        frame = 1.0 / self.fps
+        previous = time.time()
+        while not window.isClosed():
+            now = time.time()
+            if not self.paused:
+                self.seek(self.playhead + (now - previous) * self.speed)
+            previous = now
+
+            self.draw()
+
+            if not self.handleKey(window.checkKey()):
+                break
+
+            time.sleep(max(frame - (time.time() - now), 0.0))
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded trajectory.")
+    parser.add_argument("path", help="Directory the trajectory was recorded to")
+    parser.add_argument("--config", default="robot_config.toml", help="Robot config with the robot geometry")
+    parser.add_argument("--speed", type=float, default=1.0, help="Simulated seconds played per second")
+    parser.add_argument("--start", type=float, default=0.0, help="Time to start playing from (s)")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--seek-step", type=float, default=5.0, help="Seconds skipped by the Left/Right keys")
+    args = parser.parse_args()
+
+    trajectory = rc.loadTrajectory(args.path)
+    if not len(trajectory['time']):
+        print(f"replay: {args.path} is empty")
+        sys.exit(-1)
+
+    config = robotConfig.loadOrExit(args.config).robot
+
+    window = gp.GraphWin("VirtualTandem Replay", 800, 800, autoflush=False)
+    window.setCoords(-3, -3, 3, 3)
+    graphics = robGraphics.RobotGraphics(window, config.inner_wheel_base, config.wheel_radius, config.wheel_thickness)
+
+    replay = Replay(trajectory, graphics, args.speed, args.fps, args.seek_step)
+    replay.seek(args.start)
+    replay.play(window)
+
+if __name__ == "__main__":
+    main()
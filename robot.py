@@ -1,96 +1,271 @@
-import toml
-import sys
+import math
 import time
-import numpy as np
+import asyncio
+import logging
 
 import hardware.hardwareInterface as hw
 
-import common as cm
-
-import graphics.robotGraphics as graphics
+import robotConfig
+import telemetry as tm
+import scheduler as sc
+import commands
+import odometry
+import motionProfile as mp
 
+# Difference in encoder position (degrees) and target to consider a move done
 GOAL_COMPLETE_DISTANCE = 5
 
-def getHardware(is_virtual) -> hw.HardwareInterface:
-    if is_virtual:
+def getHardware(config, telemetry=None, recorder=None) -> hw.HardwareInterface:
+    if config.virtual:
         import hardware.virtualInterface as vi
-        return vi.VirtualInterface()
+        return vi.VirtualInterface(config, telemetry, recorder)
     else:
         import hardware.physicalInterface as pi
-        return pi.PhysicalInterface()
+        physical = config.physical
+        device = None
+        if physical.emulate:
+            import hardware.virtual.brickpi3Emulator as emulator
+            device = emulator.BrickPi3(physical.latency, physical.jitter, config.motor)
+        interface = pi.PhysicalInterface(device)
+        if physical.poll_rate:
+            import hardware.polledInterface as poll
+            return poll.PolledInterface(interface, physical.poll_rate)
+        return interface
 
 class Robot:
-    def __init__(self, config_path):
+    def __init__(self, config):
+        """Set up a robot.
+
+        Args:
+            config (str | robotConfig.Config): Path of the robot config, or the config itself.
+        """
         print("Initializing Robot")
 
-        with open(config_path) as stream:
-            try:
-                self.config = toml.load(stream)
-            except toml.TomlDecodeError as err:
-                print(err)
-                sys.exit(-1)
+        if isinstance(config, str):
+            config = robotConfig.loadOrExit(config, cache_dir=robotConfig.CACHE_DIR)
+        self.config = config
+
+        logging.basicConfig(level=config.logging.level, format="[%(name)s] %(message)s")
+
+        # Headless runs step a simulated clock instead of the wall clock
+        self.headless = config.virtual and config.headless
+
+        self.telemetry = tm.fromConfig(config.telemetry)
+        self.recorder = None
+        if config.recording.path:
+            # Recording needs NumPy, which is only loaded when it is enabled
+            import recorder as rc
+            self.recorder = rc.fromConfig(config.recording)
+        self.hw = getHardware(config, self.telemetry, self.recorder)
+        for sensor in config.sensors:
+            self.hw.set_sensor_type(sensor.port, sensor.type)
+
+        self.motors = (config.robot.left_motor, config.robot.right_motor)
+        self.wheelWidth = config.robot.wheel_width
 
-        self.hw = getHardware(self.config["virtual"])
-        self.ready = True   # Ready to execute next instruction
+        # Pose dead reckoned from the encoders each tick, on the physical robot
+        # as well as the virtual one, from the start pose in the [world] config
+        self.odometry = odometry.Odometry.fromConfig(config.robot)
+        self.odometry.reset(*self.hw.get_motor_encoders(self.motors), *config.world.start)
+
+        # Length (s) of a control tick, which motion profiles are sampled at
+        self.dt = config.simulation.dt if self.headless else 1.0 / config.control_frequency
+        # Largest speed (degrees / s) of a wheel at full power
+        self.fullSpeed = min(config.motor.rpm_power_a * 6.0 * 100.0, config.motor.rpm_torque_a * 6.0)
+
+        self.time = 0.0         # Time (s) the robot has been running, on the simulated clock when headless
+        self.waiting = []       # Futures of the commands waiting on the next tick
 
     def start(self):
         """Start the robot executing the commands in the config.
+
+        The commands are run by an asyncio event loop, alongside a clock task
+        which updates the hardware at control_frequency and wakes the commands
+        waiting on each tick. When running headless the simulation is instead
+        stepped with the fixed dt from the [simulation] config as fast as
+        possible, and this returns once the command list has finished (or the
+        simulated timeout is reached). Otherwise it returns once the window is
+        closed, or straight away for the physical robot.
         """
         print("Robot starting")
-        commandInd = 0
-        currentTime = time.time()
-        previousTime = time.time()
-        time.sleep(1.0)
-        while True:
-            previousTime = currentTime
-            currentTime = time.time()
+        startTime = time.time()
+        if not self.headless:
+            time.sleep(1.0)
+
+        scheduler = sc.LoopScheduler(self.config.control_frequency, self.config.simulation.dt if self.headless else None)
+        try:
+            asyncio.run(self.run(scheduler))
+        except KeyboardInterrupt:
+            print("Robot: Interrupted")
+        finally:
+            self.hw.stop()
 
-            if commandInd >= len(self.config['commands']) and self.ready:
-                break
-            if self.ready:
-                self.currentCommand = self.config['commands'][commandInd]
-                self.currentCommandState = ()
-                commandInd += 1
+        stats = scheduler.stats()
+        if self.headless:
+            print(f"Robot: Simulated {self.time:.2f}s in {stats['ticks']} ticks in {time.time() - startTime:.4f}s")
+        else:
+            print(f"Robot: {stats['ticks']} ticks, {stats['overruns']} overruns, "
+                  f"jitter mean {stats['jitter_mean'] * 1000:.2f}ms std {stats['jitter_std'] * 1000:.2f}ms max {stats['jitter_max'] * 1000:.2f}ms")
 
-            dt = 0.02
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.recorder is not None:
+            self.recorder.close()
 
-            self.update(dt)
-            self.hw.update(dt)
+        if self.headless or not self.config.virtual:
+            return
 
         try:
-            print("\nPress Ctrl-C to quit")
-            while True:
-                pass
+            print("\nClose the window (or press Ctrl-C) to quit")
+            self.hw.join()
         except KeyboardInterrupt:
             return
-    
-    def update(self, dt):
-        time.sleep(0.07)
-        match self.currentCommand['type']:
-            case "FORWARDS":
-                self.updateForwards(dt)
-            case _:
-                print(f"Robot: Unrecognized command : {self.currentCommand['type']}")
-
-    def updateForwards(self, dt):
-        self.hw.update(dt)
-        left_motor = self.__get_hardware_motor_port__(True)
-        right_motor = self.__get_hardware_motor_port__(False)
-        if self.ready:
-            self.ready = False
-            # TODO : Add tuned correction terms here for wheel rotations
-            rotations = self.currentCommand['distance'] / (2 * np.pi * self.config['robot']['wheel_radius'])
-            self.encoderTargetLeft = self.hw.get_motor_encoder(left_motor) + rotations * 360
-            self.encoderTargetRight = self.hw.get_motor_encoder(right_motor) + rotations * 360
-            self.hw.set_motor_position(left_motor, self.encoderTargetLeft)
-            self.hw.set_motor_position(right_motor, self.encoderTargetRight)
-
-        if abs(self.hw.get_motor_encoder(left_motor) - self.encoderTargetLeft) < GOAL_COMPLETE_DISTANCE:
-            self.ready = True
-            return
 
-    def __get_hardware_motor_port__(self, isLeft):
-        if isLeft:
-            return cm.config_port_to_hw(self.config['robot']['left_motor'])
-        else:
-            return cm.config_port_to_hw(self.config['robot']['right_motor'])
\ No newline at end of file
+    async def run(self, scheduler):
+        """Run the command list, as one SEQUENCE command.
+
+        Args:
+            scheduler (sc.LoopScheduler): Paces the ticks.
+        """
+        clock = asyncio.ensure_future(self.__clock(scheduler))
+
+        program = {"type": "SEQUENCE", "commands": self.config.commands}
+        if self.headless:
+            program['timeout'] = self.config.simulation.timeout
+        try:
+            await commands.execute(self, program)
+        finally:
+            clock.cancel()
+
+    async def tick(self) -> float:
+        """Wait for the next tick.
+
+        Returns:
+            float: Delta time of the tick (s).
+        """
+        # A future each, so cancelling one command doesn't cancel the others
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        return await future
+
+    async def sleep(self, duration):
+        """Wait for a duration (s) of robot time."""
+        end = self.time + duration
+        # Allow for the rounding error accumulated in the time
+        while end - self.time > 1e-9:
+            await self.tick()
+
+    async def within(self, coroutine, timeout):
+        """Run a coroutine, cancelling it if it hasn't finished within a
+        timeout (s) of robot time.
+
+        Raises:
+            asyncio.TimeoutError: If the timeout was reached.
+        """
+        task = asyncio.ensure_future(coroutine)
+        timedOut = False
+
+        async def watch():
+            nonlocal timedOut
+            await self.sleep(timeout)
+            timedOut = True
+            task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if timedOut:
+                raise asyncio.TimeoutError()
+            raise
+        finally:
+            watcher.cancel()
+
+    def profile(self, command, degrees):
+        """Compute the motion profile of a move, from the [motion] config and
+        any profile, power or acceleration keys of its command.
+
+        Args:
+            command (dict): The command making the move.
+            degrees (float): Distance the wheel which moves furthest turns (degrees).
+
+        Raises:
+            ValueError: If the command's profile, power or acceleration is invalid.
+
+        Returns:
+            array.array: Fraction of the move done at each tick, or None to step straight to the target.
+        """
+        motion = self.config.motion
+        name = command.get('profile', motion.profile)
+        power = command.get('power', motion.power)
+        acceleration = command.get('acceleration', motion.acceleration)
+        try:
+            mp.validate(name, power, acceleration, motion.jerk)
+        except ValueError as err:
+            raise ValueError(f"{command['type']} command : {err}") from err
+
+        perMetre = self.wheelDegrees(1.0)
+        return mp.getProfile(name, degrees, power * self.fullSpeed, acceleration * perMetre, motion.jerk * perMetre, self.dt)
+
+    async def moveWheels(self, left_degrees, right_degrees, profile=None):
+        """Turn the wheels by a number of degrees each, finishing once both are
+        within GOAL_COMPLETE_DISTANCE of their targets. If cancelled the wheels
+        are held where they are.
+
+        Args:
+            left_degrees (float): Degrees to turn the left wheel.
+            right_degrees (float): Degrees to turn the right wheel.
+            profile (array.array, optional): Fraction of the move the targets
+                are set to at each tick, from profile. Defaults to None, which
+                sets them to the end straight away.
+        """
+        encoderLeft, encoderRight = self.hw.get_motor_encoders(self.motors)
+        startLeft = encoderLeft
+        startRight = encoderRight
+        targetLeft = encoderLeft + left_degrees
+        targetRight = encoderRight + right_degrees
+
+        try:
+            if profile is not None:
+                # Index by the time since the start rather than counting
+                # ticks, so an overrun tick doesn't slow the move down
+                start = self.time
+                last = len(profile) - 1
+                tick = 0
+                while tick < last:
+                    done = profile[tick]
+                    self.hw.set_motor_positions({self.motors[0]: startLeft + left_degrees * done, self.motors[1]: startRight + right_degrees * done})
+                    await self.tick()
+                    tick = min(int((self.time - start) / self.dt + 0.5), last)
+            self.hw.set_motor_positions({self.motors[0]: targetLeft, self.motors[1]: targetRight})
+
+            while abs(encoderLeft - targetLeft) >= GOAL_COMPLETE_DISTANCE or abs(encoderRight - targetRight) >= GOAL_COMPLETE_DISTANCE:
+                await self.tick()
+                encoderLeft, encoderRight = self.hw.get_motor_encoders(self.motors)
+        except asyncio.CancelledError:
+            encoderLeft, encoderRight = self.hw.get_motor_encoders(self.motors)
+            self.hw.set_motor_positions({self.motors[0]: encoderLeft, self.motors[1]: encoderRight})
+            raise
+
+    def setPower(self, left, right):
+        """Set the power (%) of the left and right wheels."""
+        self.hw.set_motor_power(self.motors[0], left)
+        self.hw.set_motor_power(self.motors[1], right)
+
+    def wheelDegrees(self, distance) -> float:
+        """Degrees a wheel turns to roll a distance (m)."""
+        return distance / (2 * math.pi * self.config.robot.wheel_radius) * 360
+
+    async def __clock(self, scheduler):
+        while True:
+            dt = await scheduler.tickAsync()
+            self.hw.update(dt)
+            self.time += dt
+            self.odometry.poll(self.hw, self.motors)
+            if self.telemetry is not None and self.telemetry.odometry:
+                self.telemetry.emit(self.time, "odometry", self.odometry.x, self.odometry.y, self.odometry.orientation)
+
+            waiting, self.waiting = self.waiting, []
+            for future in waiting:
+                if not future.cancelled():
+                    future.set_result(dt)
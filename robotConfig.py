@@ -0,0 +1,426 @@
+"""Typed and validated robot configuration.
+
+robot_config.toml and config/motor_config.toml are parsed once into frozen
+dataclasses, which are handed down to everything that needs them (Robot, the
+hardware interfaces, VirtualRobot, Motor and BatchVirtualRobot), so nothing
+reads a config file or looks a key up by name after startup. Motor ports are
+resolved to hw.MOTOR_PORTS values as the config is parsed.
+
+Loaded configs are cached in memory, keyed by the modification time and size
+of both files, and optionally on disk in a cache directory, so loading an
+unchanged config again costs two stat calls. Robot caches on disk in
+CACHE_DIR, so main.py only parses TOML (with the standard library's tomllib)
+after the config is edited.
+"""
+import os
+import sys
+import logging
+import dataclasses
+
+from dataclasses import dataclass, field
+
+import hardware.hardwareInterface as hw
+import common as cm
+
+log = logging.getLogger(__name__)
+
+ROBOT_CONFIG_PATH = "robot_config.toml"
+MOTOR_CONFIG_PATH = "config/motor_config.toml"
+
+# Directory Robot caches parsed configs in across runs, so an unchanged
+# config starts without loading the TOML parser
+CACHE_DIR = ".config_cache"
+
+# Parsed configs by the absolute paths they were loaded from, with the
+# modification stamps of the files
+cache = {}
+
+class ConfigError(ValueError):
+    """A config file which can't be read, or which holds an invalid value."""
+
+@dataclass(frozen=True)
+class MotorConfig:
+    encoder_max: int
+    encoder_degrees: float
+    rpm_torque_a: float
+    rpm_torque_b: float
+    rpm_power_a: float
+    inertia: float = 0.0
+    friction: float = 0.0
+
+@dataclass(frozen=True)
+class TerrainConfig:
+    wheel_slip_acc: float = 0.0
+    wheel_slip_vel: float = 0.0
+
+@dataclass(frozen=True)
+class BodyConfig:
+    """The [robot] table."""
+    outer_wheel_base: float
+    inner_wheel_base: float
+    wheel_radius: float
+    weight: float
+    left_motor: int     # hw.MOTOR_PORTS value
+    right_motor: int    # hw.MOTOR_PORTS value
+    default_terrain: str
+    configs: dict       # Terrain name to TerrainConfig
+    heading_diff: float = 0.0
+    configuration: str = "tandem"
+    motor: str = "LegoMotor"
+
+    @property
+    def wheel_width(self) -> float:
+        """Distance between the centres of the wheels (m)."""
+        return (self.outer_wheel_base + self.inner_wheel_base) / 2.0
+
+    @property
+    def wheel_thickness(self) -> float:
+        return (self.outer_wheel_base - self.inner_wheel_base) / 2.0
+
+    @property
+    def terrain(self) -> TerrainConfig:
+        return self.configs[self.default_terrain]
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    dt: float = 0.02
+    timeout: float = 600.0
+    integrator: str = "arc"
+    tolerance: float = 0.0
+
+@dataclass(frozen=True)
+class MotionConfig:
+    profile: str = "trapezoid"
+    power: float = 1.0          # Fraction of full power moves are limited to
+    acceleration: float = 2.0   # m/s^2, of the wheel which moves furthest
+    jerk: float = 20.0          # m/s^3, for the scurve profile
+
+@dataclass(frozen=True)
+class PhysicalConfig:
+    poll_rate: float = 0.0
+    emulate: bool = False
+    latency: float = 0.0
+    jitter: float = 0.0
+
+@dataclass(frozen=True)
+class LoggingConfig:
+    level: str = "INFO"
+
+@dataclass(frozen=True)
+class TelemetryConfig:
+    signals: list = field(default_factory=list)
+    path: str = "telemetry.csv"
+    buffer: int = 4096
+
+@dataclass(frozen=True)
+class RecordingConfig:
+    path: str = ""
+    buffer: int = 65536
+
+@dataclass(frozen=True)
+class SensorConfig:
+    """A [[sensors]] entry."""
+    port: int               # hw.SENSOR_PORTS value
+    type: int               # hw.SENSOR_TYPES value
+    forward: float = 0.0    # m ahead of the centre of the wheels
+    left: float = 0.0       # m to the left of the centre of the wheels
+    angle: float = 0.0      # degrees clockwise from the robot's heading
+    range: float = 0.0      # m, 0 for the default of the type
+
+@dataclass(frozen=True)
+class WorldConfig:
+    bounds: list = field(default_factory=list)  # xmin, ymin, xmax, ymax (m) of the arena, empty for none
+    walls: list = field(default_factory=list)   # x1, y1, x2, y2 (m) of each wall
+    boxes: list = field(default_factory=list)   # xmin, ymin, xmax, ymax (m) of each box
+    start: list = field(default_factory=lambda: [0.0, 0.0, 0.0])   # x, y (m) and orientation (degrees)
+
+    @property
+    def empty(self) -> bool:
+        return not (self.bounds or self.walls or self.boxes)
+
+@dataclass(frozen=True)
+class Config:
+    virtual: bool
+    robot: BodyConfig
+    motors: dict        # Motor name to MotorConfig, from the motor config
+    commands: list = field(default_factory=list)
+    headless: bool = False
+    control_frequency: float = 50.0
+    simulation: SimulationConfig = field(default_factory=SimulationConfig)
+    motion: MotionConfig = field(default_factory=MotionConfig)
+    physical: PhysicalConfig = field(default_factory=PhysicalConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    telemetry: TelemetryConfig = field(default_factory=TelemetryConfig)
+    recording: RecordingConfig = field(default_factory=RecordingConfig)
+    sensors: list = field(default_factory=list)     # SensorConfig of each sensor
+    world: WorldConfig = field(default_factory=WorldConfig)
+
+    @property
+    def motor(self) -> MotorConfig:
+        """Config of the robot's wheel motors."""
+        return self.motors[self.robot.motor]
+
+# Types a value of each annotated type may be given as in the TOML
+TYPES = {
+    float: (int, float),
+    int: (int,),
+    str: (str,),
+    bool: (bool,),
+    list: (list,),
+    dict: (dict,),
+}
+
+def parseTable(cls, table, where, **parsed):
+    """Build a config dataclass from a TOML table, checking the value types.
+
+    Args:
+        cls (type): The dataclass.
+        table (dict): The TOML table.
+        where (str): Name of the table, for error messages.
+        **parsed: Fields already parsed from the table, which aren't checked.
+
+    Returns:
+        The dataclass.
+    """
+    if not isinstance(table, dict):
+        raise ConfigError(f"{where} should be a table")
+
+    values = {}
+    for entry in dataclasses.fields(cls):
+        if entry.name in parsed:
+            values[entry.name] = parsed[entry.name]
+            continue
+        if entry.name not in table:
+            if entry.default is dataclasses.MISSING and entry.default_factory is dataclasses.MISSING:
+                raise ConfigError(f"{where}.{entry.name} is missing")
+            continue
+        value = table[entry.name]
+        # bool is an int, but never a number here
+        if not isinstance(value, TYPES[entry.type]) or (entry.type is not bool and isinstance(value, bool)):
+            raise ConfigError(f"{where}.{entry.name} should be a {entry.type.__name__}, not {value!r}")
+        values[entry.name] = float(value) if entry.type is float else value
+
+    for name in table:
+        if name not in values and name not in parsed:
+            log.warning("Unknown config key : %s.%s", where, name)
+    return cls(**values)
+
+def check(condition, message):
+    if not condition:
+        raise ConfigError(message)
+
+def parsePort(table, key):
+    check(isinstance(table.get(key), str) and cm.config_port_to_hw(table[key]) is not None,
+          f"robot.{key} should be one of PORT_A, PORT_B, PORT_C or PORT_D, not {table.get(key)!r}")
+    return cm.config_port_to_hw(table[key])
+
+def parseSensor(table, where) -> SensorConfig:
+    check(isinstance(table.get('port'), str) and cm.config_sensor_port_to_hw(table['port']) is not None,
+          f"{where}.port should be one of PORT_1, PORT_2, PORT_3 or PORT_4, not {table.get('port')!r}")
+    check(table.get('type') in hw.SENSOR_TYPES.__members__ and table['type'] != "NONE",
+          f"{where}.type should be one of TOUCH, ULTRASONIC or LIGHT, not {table.get('type')!r}")
+    sensor = parseTable(SensorConfig, table, where,
+                        port=cm.config_sensor_port_to_hw(table['port']), type=hw.SENSOR_TYPES[table['type']])
+    check(sensor.range >= 0, f"{where}.range can't be negative")
+    return sensor
+
+def numbers(value, count) -> bool:
+    """Whether a config value is a list of count numbers."""
+    return (isinstance(value, list) and len(value) == count
+            and all(isinstance(number, (int, float)) and not isinstance(number, bool) for number in value))
+
+def checkCommands(commands, motion, where="commands"):
+    """Check every command in a command list, and in the lists of any SEQUENCE
+    or PARALLEL in it, has the keys its type needs (see commands.KEYS), and
+    check the motion settings of the moves against motionProfile.validate."""
+    # Imported here, only to validate against
+    import commands as cmd
+    import motionProfile as mp
+
+    for index, command in enumerate(commands):
+        name = f"{where}[{index}] ({command['type']})"
+        for key in cmd.KEYS.get(command['type'], ()):
+            check(key in command, f"{name} : {key} is missing")
+        if command['type'] == "SET_POWER":
+            check('power' in command or ('left_power' in command and 'right_power' in command),
+                  f"{name} : power, or left_power and right_power, is missing")
+        if command['type'] == "WAIT_SENSOR":
+            check(cm.config_sensor_port_to_hw(command['port']) is not None,
+                  f"{name} : port should be one of PORT_1, PORT_2, PORT_3 or PORT_4, not {command['port']!r}")
+        if command['type'] in cmd.MOVES:
+            try:
+                mp.validate(command.get('profile', motion.profile), command.get('power', motion.power),
+                            command.get('acceleration', motion.acceleration), motion.jerk)
+            except ValueError as err:
+                raise ConfigError(f"{name} : {err}") from err
+        children = command.get('commands', [])
+        check(isinstance(children, list) and all(isinstance(child, dict) and isinstance(child.get('type'), str) for child in children),
+              f"{where}[{index}].commands should be a list of tables, each with a type")
+        checkCommands(children, motion, f"{where}[{index}].commands")
+
+def parseMotors(raw) -> dict:
+    return {name: parseTable(MotorConfig, table, name) for name, table in raw.items()}
+
+def parseConfig(raw, motors) -> Config:
+    """Build and validate the Config of a parsed robot_config.toml.
+
+    Args:
+        raw (dict): The parsed robot_config.toml.
+        motors (dict): Motor name to MotorConfig.
+
+    Returns:
+        Config: The config.
+    """
+    # Imported here, only to validate names against
+    import hardware.virtual.integrators as integrators
+    import telemetry as tm
+    import motionProfile as mp
+
+    check('robot' in raw, "robot table is missing")
+    body = raw['robot']
+    check(isinstance(body.get('configs', {}), dict), "robot.configs should be a table")
+    terrains = {name: parseTable(TerrainConfig, table, f"robot.configs.{name}") for name, table in body.get('configs', {}).items()}
+    robot = parseTable(BodyConfig, body, "robot",
+                       left_motor=parsePort(body, 'left_motor'), right_motor=parsePort(body, 'right_motor'), configs=terrains)
+
+    check(robot.wheel_radius > 0, "robot.wheel_radius should be positive")
+    check(0 < robot.inner_wheel_base <= robot.outer_wheel_base, "robot wheel bases should be positive, with the inner no wider than the outer")
+    check(robot.weight >= 0, "robot.weight can't be negative")
+    check(robot.left_motor != robot.right_motor, "robot.left_motor and robot.right_motor are the same port")
+    check(robot.default_terrain in terrains, f"robot.default_terrain {robot.default_terrain!r} isn't in robot.configs")
+    check(robot.motor in motors, f"robot.motor {robot.motor!r} isn't in the motor config")
+
+    tables = {
+        'simulation': SimulationConfig,
+        'motion': MotionConfig,
+        'physical': PhysicalConfig,
+        'logging': LoggingConfig,
+        'telemetry': TelemetryConfig,
+        'recording': RecordingConfig,
+        'world': WorldConfig,
+    }
+    sections = {name: parseTable(cls, raw.get(name, {}), name) for name, cls in tables.items()}
+
+    commands = raw.get('commands', [])
+    check(isinstance(commands, list) and all(isinstance(command, dict) and isinstance(command.get('type'), str) for command in commands),
+          "commands should be a list of tables, each with a type")
+
+    sensors = raw.get('sensors', [])
+    check(isinstance(sensors, list) and all(isinstance(sensor, dict) for sensor in sensors), "sensors should be a list of tables")
+    sensors = [parseSensor(sensor, f"sensors[{index}]") for index, sensor in enumerate(sensors)]
+    check(len({sensor.port for sensor in sensors}) == len(sensors), "sensors has more than one sensor on a port")
+
+    config = parseTable(Config, raw, "config", robot=robot, motors=motors, commands=commands, sensors=sensors, **sections)
+
+    check(config.control_frequency > 0, "control_frequency should be positive")
+    check(config.simulation.dt > 0 and config.simulation.timeout > 0, "simulation.dt and simulation.timeout should be positive")
+    check(config.simulation.integrator in integrators.INTEGRATORS, f"Unknown integrator : {config.simulation.integrator}")
+    check(config.simulation.tolerance >= 0, "simulation.tolerance can't be negative")
+    try:
+        mp.validate(config.motion.profile, config.motion.power, config.motion.acceleration, config.motion.jerk)
+    except ValueError as err:
+        raise ConfigError(f"motion : {err}") from err
+    checkCommands(config.commands, config.motion)
+    check(config.physical.poll_rate >= 0 and config.physical.latency >= 0 and config.physical.jitter >= 0,
+          "physical poll_rate, latency and jitter can't be negative")
+    check(not config.world.bounds or numbers(config.world.bounds, 4), "world.bounds should be xmin, ymin, xmax and ymax, or empty")
+    check(all(numbers(wall, 4) for wall in config.world.walls), "world.walls should be lists of x1, y1, x2 and y2")
+    check(all(numbers(box, 4) for box in config.world.boxes), "world.boxes should be lists of xmin, ymin, xmax and ymax")
+    check(numbers(config.world.start, 3), "world.start should be x, y and orientation")
+    for signal in config.telemetry.signals:
+        check(signal in tm.SIGNALS, f"Unknown telemetry signal : {signal}")
+    return config
+
+def readToml(path) -> dict:
+    # Only needed when a config is in neither the memory nor the disk cache,
+    # so left out of the startup of a robot whose config is unchanged
+    import tomllib
+
+    try:
+        with open(path, "rb") as stream:
+            return tomllib.load(stream)
+    except (OSError, tomllib.TOMLDecodeError) as err:
+        raise ConfigError(f"{path} : {err}") from err
+
+def stamp(path) -> tuple:
+    """Modification time and size of a file, which change when it is edited."""
+    status = os.stat(path)
+    return (status.st_mtime_ns, status.st_size)
+
+def cached(key, stamps, build, cache_dir=None):
+    """Get a parsed config from the cache, or build and cache it.
+
+    Args:
+        key (tuple): The absolute paths the config is loaded from.
+        stamps (tuple): The stamp of each path.
+        build (function): Parses the config.
+        cache_dir (str, optional): Directory to also cache configs in. Defaults to None.
+    """
+    if key in cache and cache[key][0] == stamps:
+        return cache[key][1]
+
+    path = None
+    if cache_dir is not None:
+        import pickle
+        import hashlib
+
+        path = os.path.join(cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".pickle")
+        try:
+            with open(path, "rb") as stream:
+                stored, config = pickle.load(stream)
+            if stored == stamps:
+                cache[key] = (stamps, config)
+                return config
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+    config = build()
+    cache[key] = (stamps, config)
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, "wb") as stream:
+            pickle.dump((stamps, config), stream)
+    return config
+
+def loadMotors(path=MOTOR_CONFIG_PATH, cache_dir=None) -> dict:
+    """Load the motor config.
+
+    Returns:
+        dict: Motor name to MotorConfig.
+    """
+    key = ("motors", os.path.abspath(path))
+    try:
+        stamps = (stamp(path),)
+    except OSError as err:
+        raise ConfigError(f"{path} : {err}") from err
+    return cached(key, stamps, lambda: parseMotors(readToml(path)), cache_dir)
+
+def load(path=ROBOT_CONFIG_PATH, motor_path=MOTOR_CONFIG_PATH, cache_dir=None) -> Config:
+    """Load the robot config.
+
+    Args:
+        path (str, optional): The robot config. Defaults to ROBOT_CONFIG_PATH.
+        motor_path (str, optional): The motor config. Defaults to MOTOR_CONFIG_PATH.
+        cache_dir (str, optional): Directory parsed configs are also cached in,
+            to be reused across runs. Defaults to None.
+
+    Raises:
+        ConfigError: If a file can't be read or holds an invalid value.
+
+    Returns:
+        Config: The config.
+    """
+    key = ("robot", os.path.abspath(path), os.path.abspath(motor_path))
+    try:
+        stamps = (stamp(path), stamp(motor_path))
+    except OSError as err:
+        raise ConfigError(str(err)) from err
+    return cached(key, stamps, lambda: parseConfig(readToml(path), loadMotors(motor_path)), cache_dir)
+
+def loadOrExit(path=ROBOT_CONFIG_PATH, motor_path=MOTOR_CONFIG_PATH, cache_dir=None) -> Config:
+    """Load the robot config, exiting with the error if it is invalid."""
+    try:
+        return load(path, motor_path, cache_dir)
+    except ConfigError as err:
+        print(err)
+        sys.exit(-1)
@@ -0,0 +1,101 @@
+import math
+import time
+import asyncio
+
+class LoopScheduler:
+    def __init__(self, frequency, fixed_dt=None):
+        """Pace a control loop at a fixed rate.
+
+        Each call to tick sleeps only for what is left of the current period and
+        returns the time that really passed since the previous tick. A tick
+        which arrives after its deadline is counted as an overrun, and the
+        schedule restarts from it rather than running late ticks back to back.
+
+        With a fixed dt the loop is on a simulated clock instead: tick never
+        sleeps and always returns the fixed dt.
+
+        Args:
+            frequency (float): Ticks per second.
+            fixed_dt (float, optional): Simulated time per tick (s). Defaults to None.
+        """
+        self.period = 1.0 / frequency
+        self.fixed_dt = fixed_dt
+
+        self.ticks = 0
+        self.overruns = 0
+
+        # Running sums of how far each period was from the target (s)
+        self.jitter_sum = 0.0
+        self.jitter_sq_sum = 0.0
+        self.jitter_max = 0.0
+
+        self.previous = time.perf_counter()
+        self.deadline = self.previous + self.period
+
+    def tick(self) -> float:
+        """Wait for the next tick.
+
+        Returns:
+            float: Delta time since the previous tick (s).
+        """
+        self.ticks += 1
+        if self.fixed_dt is not None:
+            return self.fixed_dt
+
+        remaining = self.deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        return self.__advance(remaining > 0)
+
+    async def tickAsync(self) -> float:
+        """Wait for the next tick without blocking the event loop.
+
+        As tick, but the wait is an asyncio sleep so other tasks run in the
+        meantime. On a simulated clock it still yields once, so the tasks woken
+        by the previous tick run before the next one.
+
+        Returns:
+            float: Delta time since the previous tick (s).
+        """
+        self.ticks += 1
+        if self.fixed_dt is not None:
+            await asyncio.sleep(0)
+            return self.fixed_dt
+
+        remaining = self.deadline - time.perf_counter()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+        return self.__advance(remaining > 0)
+
+    def __advance(self, on_time) -> float:
+        """Move the schedule on by one period once the tick has arrived."""
+        now = time.perf_counter()
+        if on_time:
+            self.deadline += self.period
+        else:
+            self.overruns += 1
+            self.deadline = now + self.period
+
+        dt = now - self.previous
+        self.previous = now
+
+        jitter = abs(dt - self.period)
+        self.jitter_sum += jitter
+        self.jitter_sq_sum += jitter * jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+
+        return dt
+
+    def stats(self) -> dict:
+        """Loop statistics: ticks, overruns and the mean, standard deviation
+        and maximum of the period jitter (s)."""
+        timed = self.ticks if self.fixed_dt is None else 0
+        mean = self.jitter_sum / timed if timed else 0.0
+        variance = self.jitter_sq_sum / timed - mean * mean if timed else 0.0
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "jitter_mean": mean,
+            "jitter_std": math.sqrt(max(variance, 0.0)),
+            "jitter_max": self.jitter_max,
+        }
@@ -0,0 +1,309 @@
+"""Sweep control constants across many virtual robot runs.
+
+Each parameter is given either as a comma separated list of values or as a
+low:high range. By default the sweep runs the full grid (ranges are expanded
+to --steps evenly spaced values), with --samples N it instead draws N random
+parameter sets (uniformly from ranges, or uniformly from lists).
+
+The parameter sets are split into chunks which are run as BatchVirtualRobot
+batches across a process pool, and the per-run metrics are written to one CSV
+table, e.g.
+
+    python sweep.py --kp 5:100 --kd 0,35,70,140 --steps 20
+
+To tune only the end of a command list, --prefix N runs the first N commands
+once with the default parameters and forks every run from a snapshot of the
+robot at the end of them, so the shared approach isn't simulated again for
+each parameter set. The settle times then only cover the remaining commands.
+
+The command list may hold FORWARDS, TURN, ARC and WAIT commands, whose moves
+follow the [motion] profiles as the robot's do. Any other command can't be
+run in a batch, and the sweep refuses to start.
+
+kp, kd and ki are in the BrickPi3 firmware's units, as passed to
+set_motor_position_kp and set_motor_position_kd (defaults 25, 70 and 0).
+"""
+import argparse
+import csv
+import itertools
+import os
+import time
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+import hardware.virtual.batchVirtualRobot as bvr
+import robotConfig
+
+# Sweepable BatchVirtualRobot parameters, anything not swept keeps its default
+PARAMETERS = ("kp", "kd", "ki", "position_reached", "wheel_radius", "weight", "wheel_slip_vel", "wheel_slip_acc")
+
+METRICS = ("settle_time", "overshoot", "final_error", "heading_error")
+
+# Commands a batch can run
+COMMANDS = ("FORWARDS", "TURN", "ARC", "WAIT")
+
+def unsupported(commands) -> list:
+    """Types of the commands in the list which a batch can't run."""
+    return sorted({command['type'] for command in commands} - set(COMMANDS))
+
+def grid(space, steps=5) -> list[dict]:
+    """Every combination of the values in the parameter space.
+
+    Args:
+        space (dict): Parameter name to a list of values or a (low, high) range.
+        steps (int, optional): Number of values a range is expanded to. Defaults to 5.
+
+    Returns:
+        list[dict]: One dict of parameter values per run.
+    """
+    names = list(space)
+    values = [np.linspace(*space[name], steps) if isinstance(space[name], tuple) else space[name] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+def randomSample(space, samples, seed=None) -> list[dict]:
+    """Random parameter sets drawn from the parameter space.
+
+    Args:
+        space (dict): Parameter name to a list of values or a (low, high) range.
+        samples (int): Number of parameter sets to draw.
+        seed (int, optional): Random seed. Defaults to None.
+
+    Returns:
+        list[dict]: One dict of parameter values per run.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {
+        name: rng.uniform(*values, samples) if isinstance(values, tuple) else rng.choice(values, samples)
+        for name, values in space.items()
+    }
+    return [{name: column[i] for name, column in columns.items()} for i in range(samples)]
+
+def runCommands(robots, commands, motion, dt, max_time) -> tuple:
+    """Drive a batch through a command list, each command until every robot
+    has settled or max_time has been simulated.
+
+    Args:
+        robots (bvr.BatchVirtualRobot): The batch.
+        commands (list[dict]): Commands, of the types in COMMANDS.
+        motion (robotConfig.MotionConfig): The [motion] config.
+        dt (float): Simulation time step (s).
+        max_time (float): Maximum time simulated for each command (s).
+
+    Raises:
+        ValueError: If a command isn't one of COMMANDS.
+
+    Returns:
+        tuple: Arrays of the total time each robot took to settle (s, nan if
+            it ever didn't) and of its largest overshoot (degrees).
+    """
+    settle_time = np.zeros(robots.n)
+    overshoot = np.zeros(robots.n)
+
+    for command in commands:
+        if command['type'] == "WAIT":
+            for _ in range(round(command['duration'] / dt)):
+                robots.update(dt)
+            continue
+        if command['type'] == "FORWARDS":
+            degrees = robots.wheelDegrees(command['distance'])
+            left, right = degrees, degrees
+        elif command['type'] == "TURN":
+            left, right = robots.turnDegrees(command['angle'])
+        elif command['type'] == "ARC":
+            left, right = robots.arcDegrees(command['radius'], command['angle'])
+        else:
+            raise ValueError(f"Command can't be swept : {command['type']}")
+
+        profile = robots.profile(command.get('profile', motion.profile), np.maximum(np.abs(left), np.abs(right)),
+                                 command.get('power', motion.power), command.get('acceleration', motion.acceleration),
+                                 motion.jerk, dt)
+        robots.move(left, right, profile)
+        # Overshoot is measured past the end of the move, along the way each wheel turns
+        direction_left = np.sign(left)
+        direction_right = np.sign(right)
+
+        elapsed = 0.0
+        command_time = np.full(robots.n, np.nan)
+        pending = ~robots.settled()
+        command_time[~pending] = 0.0
+        while pending.any() and elapsed < max_time:
+            robots.update(dt)
+            elapsed += dt
+            for encoder, target, direction in ((robots.encoder_left, robots.target_left, direction_left),
+                                               (robots.encoder_right, robots.target_right, direction_right)):
+                np.maximum(overshoot, (encoder - target) * direction, out=overshoot)
+            done = pending & robots.settled()
+            command_time[done] = elapsed
+            pending &= ~done
+        settle_time += command_time
+
+    return settle_time, overshoot
+
+def expectedPose(commands, pose=(0.0, 0.0, 0.0)) -> tuple:
+    """Pose (x, y, orientation) the command list should end at, from the pose
+    (x, y, orientation) it starts at."""
+    x, y, orientation = (float(value) for value in pose)
+    for command in commands:
+        heading = np.deg2rad(orientation)
+        if command['type'] == "FORWARDS":
+            x += np.sin(heading) * command['distance']
+            y += np.cos(heading) * command['distance']
+        elif command['type'] == "TURN":
+            orientation += command['angle']
+        elif command['type'] == "ARC":
+            # Around a centre to the right of the robot when turning clockwise
+            angle = np.deg2rad(command['angle'])
+            radius = abs(command['radius'])
+            forward = radius * np.sin(angle)
+            right = radius * (1.0 - np.cos(angle)) * (1.0 if command['radius'] >= 0 else -1.0)
+            x += forward * np.sin(heading) + right * np.cos(heading)
+            y += forward * np.cos(heading) - right * np.sin(heading)
+            orientation += command['angle'] if command['radius'] >= 0 else -command['angle']
+    return x, y, orientation
+
+def startRobots(robots, pose):
+    """Put every robot at the start pose (x, y, orientation)."""
+    robots.x[:], robots.y[:], robots.orientation[:] = pose
+
+def runPrefix(commands, config, motor_config, motion, dt, max_time, pose=(0.0, 0.0, 0.0)):
+    """Run the start of the command list once, with the default parameters.
+
+    Returns:
+        array.array: Snapshot of the robot at the end, to fork every run from.
+    """
+    robots = bvr.BatchVirtualRobot(1, config, motor_config)
+    startRobots(robots, pose)
+    runCommands(robots, commands, motion, dt, max_time)
+    return robots.snapshot(0)
+
+def runChunk(params, commands, config, motor_config, motion, dt, max_time, start=None, prefix=0, pose=(0.0, 0.0, 0.0)) -> dict:
+    """Run one batch of parameter sets through the command list.
+
+    Args:
+        params (list[dict]): Parameter sets, one robot each.
+        commands (list[dict]): The command list from robot_config.toml.
+        config (robotConfig.BodyConfig): The [robot] config.
+        motor_config (robotConfig.MotorConfig): The motor config.
+        motion (robotConfig.MotionConfig): The [motion] config.
+        dt (float): Simulation time step (s).
+        max_time (float): Maximum time simulated for each command (s).
+        start (array.array, optional): Snapshot every robot starts from. Defaults to None.
+        prefix (int, optional): Number of commands already run to reach the start. Defaults to 0.
+        pose (tuple, optional): Pose (x, y, orientation) the command list
+            starts at, the [world] start. Defaults to (0.0, 0.0, 0.0).
+
+    Returns:
+        dict: Metric name to an array with one value per parameter set.
+    """
+    kwargs = {name: np.array([p[name] for p in params], dtype=float) for name in params[0]}
+    robots = bvr.BatchVirtualRobot(len(params), config, motor_config, **kwargs)
+    if start is not None:
+        robots.restore(start)
+    else:
+        startRobots(robots, pose)
+
+    settle_time, overshoot = runCommands(robots, commands[prefix:], motion, dt, max_time)
+    expected_x, expected_y, expected_orientation = expectedPose(commands, pose)
+
+    return {
+        "settle_time": settle_time,
+        "overshoot": overshoot,
+        "final_error": np.hypot(robots.x - expected_x, robots.y - expected_y),
+        "heading_error": robots.orientation - expected_orientation,
+    }
+
+def sweep(params, commands, config, motor_config, motion, dt=0.02, max_time=30.0, workers=None, prefix=0, pose=(0.0, 0.0, 0.0)) -> list[dict]:
+    """Fan the parameter sets out across a process pool.
+
+    Args:
+        params (list[dict]): Parameter sets to run.
+        commands (list[dict]): The command list from robot_config.toml.
+        config (robotConfig.BodyConfig): The [robot] config.
+        motor_config (robotConfig.MotorConfig): The motor config.
+        motion (robotConfig.MotionConfig): The [motion] config.
+        dt (float, optional): Simulation time step (s). Defaults to 0.02.
+        max_time (float, optional): Maximum time simulated for each command (s). Defaults to 30.0.
+        workers (int, optional): Number of worker processes. Defaults to the cpu count.
+        prefix (int, optional): Number of commands at the start of the list
+            which are run once, with the default parameters, and every run
+            forked from the end of. Defaults to 0.
+        pose (tuple, optional): Pose (x, y, orientation) the command list
+            starts at, the [world] start. Defaults to (0.0, 0.0, 0.0).
+
+    Returns:
+        list[dict]: Results table, the parameters and metrics of each run.
+    """
+    workers = workers or os.cpu_count()
+    # A few chunks per worker keeps them all busy without giving up the
+    # batching inside each chunk
+    chunks = [chunk.tolist() for chunk in np.array_split(np.arange(len(params)), min(len(params), workers * 4))]
+
+    # The shared start is simulated once here, and only its snapshot is sent to the workers
+    start = runPrefix(commands[:prefix], config, motor_config, motion, dt, max_time, pose) if prefix else None
+
+    results = {metric: np.empty(len(params)) for metric in METRICS}
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(runChunk, [params[i] for i in chunk], commands, config, motor_config, motion, dt, max_time, start, prefix, pose)
+            for chunk in chunks
+        ]
+        for chunk, future in zip(chunks, futures):
+            for metric, values in future.result().items():
+                results[metric][chunk] = values
+
+    return [dict(p, **{metric: results[metric][i] for metric in METRICS}) for i, p in enumerate(params)]
+
+def writeResults(path, rows):
+    with open(path, "w", newline="") as stream:
+        writer = csv.DictWriter(stream, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def parseSpace(value):
+    """Parse 'low:high' into a range tuple and 'a,b,c' into a list of values."""
+    if ":" in value:
+        low, high = value.split(":")
+        return (float(low), float(high))
+    return [float(v) for v in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep control constants across virtual robot runs.")
+    parser.add_argument("--config", default="robot_config.toml", help="Robot config with the command list")
+    parser.add_argument("--motor-config", default="config/motor_config.toml")
+    for name in PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), type=parseSpace, help="List a,b,c or range low:high")
+    parser.add_argument("--steps", type=int, default=5, help="Values per range in a grid sweep")
+    parser.add_argument("--samples", type=int, help="Draw this many random parameter sets instead of a grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--dt", type=float, default=0.02)
+    parser.add_argument("--max-time", type=float, default=30.0, help="Simulated time limit per command (s)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--prefix", type=int, default=0, help="Run the first N commands once with the default parameters, and fork every run from there")
+    parser.add_argument("--output", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    space = {name: getattr(args, name) for name in PARAMETERS if getattr(args, name) is not None}
+    if not space:
+        parser.error("No parameters to sweep")
+    params = randomSample(space, args.samples, args.seed) if args.samples else grid(space, args.steps)
+
+    config = robotConfig.loadOrExit(args.config, args.motor_config)
+    if unsupported(config.commands):
+        parser.error(f"{args.config} has commands which can't be swept : {', '.join(unsupported(config.commands))} "
+                     f"(only {', '.join(COMMANDS)})")
+
+    print(f"sweep: Running {len(params)} parameter sets")
+    start = time.time()
+    rows = sweep(params, config.commands, config.robot, config.motor, config.motion, args.dt, args.max_time, args.workers, args.prefix,
+                 config.world.start)
+    print(f"sweep: Finished in {time.time() - start:.2f}s")
+
+    writeResults(args.output, rows)
+
+    ranked = sorted(rows, key=lambda row: (np.isnan(row['settle_time']), row['settle_time']))
+    for row in ranked[:10]:
+        print(", ".join(f"{key} = {value:.4g}" for key, value in row.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Signal telemetry for the virtual hardware.
+
+Rather than printing every tick, the virtual robot hands selected signals to a
+Telemetry object which buffers them and writes them to a CSV file in large
+blocks. When telemetry is disabled the robot holds None and the per-tick cost
+is a single identity check.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+# Signals which can be streamed and the columns each one writes
+SIGNALS = {
+    "encoders": ("left", "right"),
+    "velocities": ("left", "right"),
+    "pose": ("x", "y", "orientation"),
+    "power": ("left", "right"),
+    "odometry": ("x", "y", "orientation"),
+}
+
+class BufferedSink:
+    """CSV sink which holds rows in memory and writes them out in blocks.
+
+    Rows are written as time, signal, value... so that signals with different
+    numbers of values can share one file.
+    """
+    def __init__(self, path, buffer_size=4096):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.stream = open(path, "w")
+        self.stream.write("time,signal,a,b,c\n")
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        # Formatting is deferred to here to keep it off the tick
+        self.stream.write("".join(",".join(map(str, row)) + "\n" for row in self.rows))
+        self.rows.clear()
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+class Telemetry:
+    def __init__(self, sink, signals):
+        """Stream the selected signals to a sink.
+
+        Args:
+            sink (BufferedSink): Where to write the signals.
+            signals (list[str]): Names of the signals to stream, from SIGNALS.
+        """
+        for signal in signals:
+            if signal not in SIGNALS:
+                raise ValueError(f"Unknown telemetry signal : {signal}")
+
+        self.sink = sink
+
+        # One flag per signal so the robot can skip building values it won't send
+        self.encoders = "encoders" in signals
+        self.velocities = "velocities" in signals
+        self.pose = "pose" in signals
+        self.power = "power" in signals
+        self.odometry = "odometry" in signals
+
+    def emit(self, time, signal, *values):
+        self.sink.write((time, signal) + values)
+
+    def close(self):
+        self.sink.close()
+
+def fromConfig(config):
+    """Build the telemetry described by the [telemetry] config.
+
+    Args:
+        config (robotConfig.TelemetryConfig): The [telemetry] config.
+
+    Returns:
+        Telemetry | None: The telemetry, or None if no signals are selected.
+    """
+    if not config.signals:
+        return None
+    log.info("Streaming %s to %s", ", ".join(config.signals), config.path)
+    return Telemetry(BufferedSink(config.path, config.buffer), config.signals)
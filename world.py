@@ -0,0 +1,288 @@
+"""A shared world for many virtual robots.
+
+A World hosts any number of robots, each with its own config and
+VirtualInterface, in an arena of static obstacles. The arena's bounds and the
+obstacles are straight walls, and each robot's footprint is a circle around
+its centre. Stepping the world steps every robot, then checks for robots which
+hit a wall or another robot and puts them back where they were before the
+tick, so their wheels spin without moving them, as a blocked robot's would.
+Each robot's tick is only published to its telemetry, recorder and window
+once every collision is resolved.
+
+Collision and proximity queries go through a uniform grid rather than
+comparing every pair. The walls are indexed once, and the robots are indexed
+again each tick, so a tick costs O(n) for n robots spread over the arena. The
+robots' virtual sensors (see hardware.virtual.sensors) find the obstacles to
+cast their rays against through the same grids.
+
+A robot run on its own is put in a world of its own when the [world] config
+describes one, which its VirtualInterface steps in its place.
+"""
+import dataclasses
+import logging
+import math
+
+import hardware.virtualInterface as vi
+import robotConfig
+
+log = logging.getLogger(__name__)
+
+# Default side (m) of a grid cell, a few robots across
+CELL_SIZE = 0.5
+
+class Grid:
+    """Uniform grid of cells, each holding the items whose bounding boxes overlap it."""
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def clear(self):
+        self.cells.clear()
+
+    def insert(self, item, xmin, ymin, xmax, ymax):
+        for cell in self.__cells(xmin, ymin, xmax, ymax):
+            self.cells.setdefault(cell, []).append(item)
+
+    def query(self, xmin, ymin, xmax, ymax) -> set:
+        """Items whose bounding boxes may overlap a box."""
+        found = set()
+        for cell in self.__cells(xmin, ymin, xmax, ymax):
+            found.update(self.cells.get(cell, ()))
+        return found
+
+    def __cells(self, xmin, ymin, xmax, ymax):
+        size = self.cell_size
+        for i in range(math.floor(xmin / size), math.floor(xmax / size) + 1):
+            for j in range(math.floor(ymin / size), math.floor(ymax / size) + 1):
+                yield (i, j)
+
+@dataclasses.dataclass(frozen=True)
+class Wall:
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+    def distance(self, x, y) -> float:
+        """Distance (m) from a point to the nearest point of the wall."""
+        dx = self.x2 - self.x1
+        dy = self.y2 - self.y1
+        length = dx * dx + dy * dy
+        along = 0.0 if length == 0 else min(max(((x - self.x1) * dx + (y - self.y1) * dy) / length, 0.0), 1.0)
+        return math.hypot(x - (self.x1 + along * dx), y - (self.y1 + along * dy))
+
+class WorldRobot:
+    __slots__ = ("name", "interface", "robot", "radius", "collisions")
+
+    def __init__(self, name, interface, radius):
+        """A robot in the world.
+
+        Args:
+            name (str): Name of the robot.
+            interface (vi.VirtualInterface): Its hardware, to drive it with.
+            radius (float): Radius of its footprint (m).
+        """
+        self.name = name
+        self.interface = interface
+        self.robot = interface.virtualRobot
+        self.radius = radius
+        self.collisions = 0     # Ticks the robot has been blocked for
+
+class World:
+    def __init__(self, bounds=None, cell_size=CELL_SIZE):
+        """Create an empty world.
+
+        Args:
+            bounds (tuple, optional): Arena (xmin, ymin, xmax, ymax) in metres,
+                walled in on every side. Defaults to None, an open world.
+            cell_size (float, optional): Side of a grid cell (m), best a little
+                larger than a robot. Defaults to CELL_SIZE.
+        """
+        self.robots = []
+        self.walls = []
+        self.wallArray = None   # Walls as an array for ray casting, built when first needed
+        self.wallGrid = Grid(cell_size)
+        self.robotGrid = Grid(cell_size)
+        self.time = 0.0
+
+        if bounds is not None:
+            xmin, ymin, xmax, ymax = bounds
+            self.addBox(xmin, ymin, xmax, ymax)
+
+    @classmethod
+    def fromConfig(cls, config, cell_size=CELL_SIZE):
+        """Build the world described by the [world] config, with no robots.
+
+        Args:
+            config (robotConfig.WorldConfig): The [world] config.
+            cell_size (float, optional): Side of a grid cell (m). Defaults to CELL_SIZE.
+        """
+        world = cls(config.bounds or None, cell_size)
+        for wall in config.walls:
+            world.addWall(*wall)
+        for box in config.boxes:
+            world.addBox(*box)
+        return world
+
+    def addWall(self, x1, y1, x2, y2) -> Wall:
+        wall = Wall(x1, y1, x2, y2)
+        self.wallGrid.insert(len(self.walls), min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.walls.append(wall)
+        self.wallArray = None
+        return wall
+
+    def addBox(self, xmin, ymin, xmax, ymax):
+        """Add the four walls of a rectangle, such as an obstacle or the arena."""
+        self.addWall(xmin, ymin, xmax, ymin)
+        self.addWall(xmax, ymin, xmax, ymax)
+        self.addWall(xmax, ymax, xmin, ymax)
+        self.addWall(xmin, ymax, xmin, ymin)
+
+    def addRobot(self, config, x=0.0, y=0.0, orientation=0.0, name=None, telemetry=None, recorder=None) -> WorldRobot:
+        """Add a robot to the world.
+
+        The robot is always headless, the world is drawn (if at all) as a whole.
+
+        Args:
+            config (robotConfig.Config): Config of the robot.
+            x (float, optional): Starting x (m). Defaults to 0.0.
+            y (float, optional): Starting y (m). Defaults to 0.0.
+            orientation (float, optional): Starting heading (degrees clockwise from the y axis). Defaults to 0.0.
+            name (str, optional): Name of the robot. Defaults to its index.
+            telemetry (telemetry.Telemetry, optional): Telemetry of the robot. Defaults to None.
+            recorder (recorder.TrajectoryRecorder, optional): Recorder of the robot. Defaults to None.
+
+        Returns:
+            WorldRobot: The robot, with the VirtualInterface to drive it by.
+        """
+        # Without its [world], so the robot doesn't build a world of its own
+        config = dataclasses.replace(config, headless=True, world=robotConfig.WorldConfig())
+        return self.attach(vi.VirtualInterface(config, telemetry, recorder), x, y, orientation, name)
+
+    def attach(self, interface, x=0.0, y=0.0, orientation=0.0, name=None) -> WorldRobot:
+        """Put the robot of an existing VirtualInterface in the world.
+
+        Args:
+            interface (vi.VirtualInterface): Hardware of the robot.
+            x (float, optional): Starting x (m). Defaults to 0.0.
+            y (float, optional): Starting y (m). Defaults to 0.0.
+            orientation (float, optional): Starting heading (degrees clockwise from the y axis). Defaults to 0.0.
+            name (str, optional): Name of the robot. Defaults to its index.
+
+        Raises:
+            ValueError: If the robot would start overlapping a wall or another robot.
+
+        Returns:
+            WorldRobot: The robot.
+        """
+        virtualRobot = interface.virtualRobot
+        robot = WorldRobot(str(len(self.robots)) if name is None else name, interface, virtualRobot.config.outer_wheel_base / 2.0)
+        # A robot which starts overlapping something would be put back every
+        # tick, and never move
+        if self.nearbyWalls(x, y, robot.radius):
+            raise ValueError(f"Robot {robot.name} starts overlapping a wall at ({x}, {y})")
+        if self.nearbyRobots(x, y, robot.radius):
+            raise ValueError(f"Robot {robot.name} starts overlapping another robot at ({x}, {y})")
+
+        virtualRobot.x = x
+        virtualRobot.y = y
+        virtualRobot.orientation = orientation
+        virtualRobot.world = self
+        self.robotGrid.insert(len(self.robots), x - robot.radius, y - robot.radius, x + robot.radius, y + robot.radius)
+        self.robots.append(robot)
+        return robot
+
+    def update(self, dt) -> list:
+        """Step every robot, then put back any which collided.
+
+        Args:
+            dt (float): Delta time (s).
+
+        Returns:
+            list: The robots blocked this tick.
+        """
+        poses = [(robot.robot.x, robot.robot.y, robot.robot.orientation) for robot in self.robots]
+        for robot in self.robots:
+            robot.robot.step(dt)
+        self.time += dt
+
+        self.__indexRobots()
+        blocked = []
+        colliding = [index for index, robot in enumerate(self.robots) if self.__collides(robot)]
+        while colliding:
+            for index in colliding:
+                robot = self.robots[index]
+                robot.robot.x, robot.robot.y, robot.robot.orientation = poses[index]
+                robot.robot.invalidateSensors()
+                robot.collisions += 1
+            blocked += colliding
+            # Robots put back have moved, so the index is stale until rebuilt,
+            # and one put back may now overlap a robot which moved where it was
+            self.__indexRobots()
+            done = set(blocked)
+            near = set()
+            for index in colliding:
+                robot = self.robots[index]
+                near.update(self.robotGrid.query(robot.robot.x - 2 * robot.radius, robot.robot.y - 2 * robot.radius,
+                                                 robot.robot.x + 2 * robot.radius, robot.robot.y + 2 * robot.radius))
+            colliding = [index for index in sorted(near - done) if self.__collides(self.robots[index])]
+
+        # Only now is every pose final, put back or not
+        for robot in self.robots:
+            robot.robot.publish()
+        return [self.robots[index] for index in blocked]
+
+    def nearbyRobots(self, x, y, radius) -> list:
+        """Robots whose footprints come within a radius (m) of a point."""
+        found = []
+        for index in self.robotGrid.query(x - radius, y - radius, x + radius, y + radius):
+            robot = self.robots[index]
+            if math.hypot(robot.robot.x - x, robot.robot.y - y) < radius + robot.radius:
+                found.append(robot)
+        return found
+
+    def nearbyWalls(self, x, y, radius) -> list:
+        """Walls which come within a radius (m) of a point."""
+        walls = (self.walls[index] for index in self.wallGrid.query(x - radius, y - radius, x + radius, y + radius))
+        return [wall for wall in walls if wall.distance(x, y) < radius]
+
+    def obstacles(self, xmin, ymin, xmax, ymax, robot=None) -> tuple:
+        """Obstacles which may be in a box, as arrays to cast rays against.
+
+        Args:
+            xmin, ymin, xmax, ymax (float): The box (m).
+            robot (VirtualRobot, optional): Robot to leave out, such as the
+                one casting the rays. Defaults to None.
+
+        Returns:
+            tuple: (m, 4) walls, x1, y1, x2 and y2, then (c, 2) centres and
+                (c,) radii of the robots' footprints.
+        """
+        # Only sensing needs NumPy, which the sensors have already loaded
+        import numpy as np
+
+        if self.wallArray is None:
+            self.wallArray = np.array([(wall.x1, wall.y1, wall.x2, wall.y2) for wall in self.walls], dtype=float).reshape(-1, 4)
+        indices = self.wallGrid.query(xmin, ymin, xmax, ymax)
+        walls = self.wallArray[np.fromiter(indices, dtype=np.intp, count=len(indices))]
+
+        others = [self.robots[index] for index in self.robotGrid.query(xmin, ymin, xmax, ymax)]
+        others = [other for other in others if other.robot is not robot]
+        centres = np.array([(other.robot.x, other.robot.y) for other in others], dtype=float).reshape(-1, 2)
+        radii = np.array([other.radius for other in others], dtype=float)
+        return walls, centres, radii
+
+    def __indexRobots(self):
+        self.robotGrid.clear()
+        for index, robot in enumerate(self.robots):
+            x = robot.robot.x
+            y = robot.robot.y
+            self.robotGrid.insert(index, x - robot.radius, y - robot.radius, x + robot.radius, y + robot.radius)
+
+    def __collides(self, robot) -> bool:
+        x = robot.robot.x
+        y = robot.robot.y
+        radius = robot.radius
+        if self.nearbyWalls(x, y, radius):
+            return True
+        return any(other is not robot for other in self.nearbyRobots(x, y, radius))